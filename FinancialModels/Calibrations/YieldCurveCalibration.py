@@ -1,15 +1,22 @@
 from functools import partial
 from scipy.optimize import minimize
+from Schedules.CashflowSchedules import coupon_cashflow_table
 from Optimizers.BondPricingOptimizer import optimize_bond_price
 
 
 def yield_curve_calibration(bond_market_price, first_coupon_date,
                             coupon_frequency, maturity_date, val_date,
                             coupon_rate, face, yield_curve, z_spread):
+    # The cashflows do not depend on the z-spread, so they are built once
+    # rather than at every iteration of the minimizer
+    cashflow_table = coupon_cashflow_table(first_coupon_date,
+                                           coupon_frequency, maturity_date,
+                                           val_date, coupon_rate, face)
     bond_pricing_function = partial(optimize_bond_price, bond_market_price,
                                     first_coupon_date, coupon_frequency,
                                     maturity_date, val_date, coupon_rate, face,
-                                    yield_curve)
+                                    yield_curve,
+                                    cashflow_table=cashflow_table)
 
     res = minimize(bond_pricing_function, z_spread, method='SLSQP')
 
@@ -1,5 +1,6 @@
 from functools import partial
 from scipy.optimize import minimize
+from Schedules.CashflowSchedules import coupon_cashflow_table
 from Optimizers.FRNPricingOptimizer import optimize_FRN_price
 
 
@@ -7,10 +8,16 @@ def yield_curve_calibration_FRN(FRN_market_price, first_coupon_date,
                                 coupon_frequency, maturity_date, val_date,
                                 coupon_rate, face, yield_curve, reference_curve,
                                 z_spread):
+    # The cashflows do not depend on the z-spread, so they are built once
+    # rather than at every iteration of the minimizer
+    cashflow_table = coupon_cashflow_table(first_coupon_date,
+                                           coupon_frequency, maturity_date,
+                                           val_date, coupon_rate, face)
     FRN_pricing_function = partial(optimize_FRN_price, FRN_market_price,
                                    first_coupon_date, coupon_frequency,
                                    maturity_date, val_date, coupon_rate, face,
-                                   yield_curve, reference_curve)
+                                   yield_curve, reference_curve,
+                                   cashflow_table=cashflow_table)
 
     res = minimize(FRN_pricing_function, z_spread, method='SLSQP')
 
@@ -1,4 +1,5 @@
 from bisect import bisect_left
+import numpy as np
 
 
 class BilinearInterpolator(object):
@@ -29,3 +30,51 @@ class BilinearInterpolator(object):
         weight22 = ((x - x1) * (y - y1)) / denominator
 
         return z11 * weight11 + z21 * weight21 + z12 * weight12 + z22 * weight22
+
+
+def bilinear_interpolation_array(x_index, y_index, values, x, y):
+    """ Bilinear interpolation of arrays of points.
+
+    Gives the same result as BilinearInterpolator(x_index, y_index, values)
+    at each point (x, y), with the same indexing of values. The points are
+    broadcast against each other and values can have leading batch
+    dimensions (e.g. one surface per scenario) that are broadcast against
+    the points. Points outside the grid use the nearest cell.
+    """
+    x_index = np.asarray(x_index, float)
+    y_index = np.asarray(y_index, float)
+    values = np.asarray(values, float)
+    x, y = np.broadcast_arrays(np.asarray(x, float), np.asarray(y, float))
+
+    i = np.searchsorted(x_index, x, side='left') - 1
+    j = np.searchsorted(y_index, y, side='left') - 1
+    i = np.clip(i, 0, min(len(x_index), values.shape[-1]) - 2)
+    j = np.clip(j, 0, min(len(y_index), values.shape[-2]) - 2)
+
+    x1, x2 = x_index[i], x_index[i + 1]
+    y1, y2 = y_index[j], y_index[j + 1]
+    z11 = _take(values, j, i)
+    z12 = _take(values, j, i + 1)
+    z21 = _take(values, j + 1, i)
+    z22 = _take(values, j + 1, i + 1)
+
+    denominator = (x2 - x1) * (y2 - y1)
+
+    weight11 = ((x2 - x) * (y2 - y)) / denominator
+    weight21 = ((x - x1) * (y2 - y)) / denominator
+    weight12 = ((x2 - x) * (y - y1)) / denominator
+    weight22 = ((x - x1) * (y - y1)) / denominator
+
+    return z11 * weight11 + z21 * weight21 + z12 * weight12 + z22 * weight22
+
+
+def _take(values, rows, cols):
+    # values[..., rows, cols] with the batch dimensions of values broadcast
+    # against the points
+    if values.ndim == 2:
+        return values[rows, cols]
+    batch_shape = values.shape[:-2]
+    flat = values.reshape((-1,) + values.shape[-2:])
+    batch = np.arange(len(flat)).reshape(batch_shape)
+    batch, rows, cols = np.broadcast_arrays(batch, rows, cols)
+    return flat[batch, rows, cols]
@@ -1,40 +1,45 @@
+import numpy as np
+
+
 # TODO: This method should be added to the BlackVolatilitySurface when it's created
 def interpolated_yield_curve(input_yield_curve, payment_timing):
     # The inputted yield curve will be a pandas dataframe with row of terms and corresponding row of rates.
     # We assume the yield curve will be generic, i.e. the key rates for certain curves will be different from others.
     # "Payment Timing" is a list of times (in years) representing timing of payments.
-    valuation__curve = []
+    # The yields are interpolated linearly between the key rates and held
+    # flat before the first and after the last key rate, for all the
+    # payments at once
+    key_rates = [float(k) for k in list(input_yield_curve)]
+    key_rate_yields = np.asarray(input_yield_curve.values[0], float)
 
-    key_rate_list = list(input_yield_curve)
+    return np.interp(payment_timing, key_rates, key_rate_yields).tolist()
 
-    # Convert the key rates to floats (if they are string or unicode)
-    key_rates = []
-    for k in range(len(key_rate_list)):
-        key_rates.append(float(key_rate_list[k]))
 
-    input_yield_curve = [k for k in input_yield_curve.iloc[0,
-                                    :]]  # change pandas DataFrame to list
+def interpolated_yield_curve_weights(input_yield_curve, payment_timing):
+    # Matrix W (Rows=Payments; Col=Key Rates) with
+    # interpolated_yield_curve(input_yield_curve, payment_timing) equal to
+    # W * (key rate yields), i.e. the derivative of each interpolated yield
+    # with respect to each key rate yield
+    key_rates = [float(k) for k in list(input_yield_curve)]
+    weights = np.zeros((len(payment_timing), len(key_rates)))
 
     for ii in range(len(payment_timing)):
 
         if payment_timing[ii] <= key_rates[0]:
-            valuation__curve.append(input_yield_curve[0])
+            weights[ii, 0] = 1.0
 
         if (payment_timing[ii] > key_rates[0]) & (
                 payment_timing[ii] < key_rates[-1]):
             jj = 0
             while payment_timing[ii] > key_rates[jj]:
                 jj = jj + 1
-            valuation__curve.append(input_yield_curve[jj - 1] + (
-                    input_yield_curve[jj] - input_yield_curve[jj - 1]) / (
-                                            key_rates[jj] - key_rates[
-                                        jj - 1]) * (
-                                            payment_timing[ii] - key_rates[
-                                        jj - 1]))
-
-        # if payment date exceeds last key rate, then set yield to last key rate yield
-        if payment_timing[ii] >= key_rates[-1]:
+            weight = (payment_timing[ii] - key_rates[jj - 1]) / (
+                    key_rates[jj] - key_rates[jj - 1])
+            weights[ii, jj - 1] = 1.0 - weight
+            weights[ii, jj] = weight
 
-            valuation__curve.append(input_yield_curve[-1])
+        # if payment date exceeds last key rate, then use the last key rate
+        if payment_timing[ii] >= key_rates[-1]:
+            weights[ii, -1] = 1.0
 
-    return valuation__curve
+    return weights
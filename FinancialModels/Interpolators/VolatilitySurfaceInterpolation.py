@@ -1,4 +1,5 @@
-from Interpolators.BilinearInterpolator import BilinearInterpolator
+from Interpolators.BilinearInterpolator import (BilinearInterpolator,
+                                               bilinear_interpolation_array)
 
 
 # TODO: This method should be added to the BlackVolatilitySurface when it's created
@@ -15,3 +16,22 @@ def volatility_surface_interpolation(volatility_surface, target_maturity,
                                              volatility_surface)
 
     return interpolator(target_maturity, target_strike)
+
+
+def volatility_surface_interpolation_array(volatility_surface, target_maturity,
+                                           target_strike, interp_method,
+                                           surface_values=None):
+    # Array version of volatility_surface_interpolation. The target
+    # maturities and strikes (as percentages of the spot) are broadcast
+    # against each other and surface_values can hold a batch of surfaces
+    # with the labels of volatility_surface (e.g. one surface per scenario)
+    maturities = [float(i) for i in list(volatility_surface.index)]
+    strike_as_percentages = [float(i) for i in list(volatility_surface)]
+    if surface_values is None:
+        surface_values = volatility_surface.values
+
+    # TODO: Add other types of interpolation methods
+    if interp_method.lower() == 'bilinearinterpolation':
+        return bilinear_interpolation_array(maturities, strike_as_percentages,
+                                            surface_values, target_maturity,
+                                            target_strike)
@@ -1,12 +1,12 @@
-from dateutil.relativedelta import relativedelta
 from Interpolators.InterpolatedYieldCurve import interpolated_yield_curve
+from Schedules.CashflowSchedules import coupon_cashflow_table
 import numpy as np
 import pandas as pd
 
 
 def optimize_FRN_price(FRN_market_price, first_coupon_date, coupon_frequency,
                        maturity_date, val_date, coupon_rate, face, yield_curve,
-                       reference_curve, z_spread):
+                       reference_curve, z_spread, cashflow_table=None):
     headers = list(yield_curve)
     yield_curve = z_spread + yield_curve.iloc[0, :]
     yield_curve = [kk for kk in yield_curve]
@@ -19,32 +19,17 @@ def optimize_FRN_price(FRN_market_price, first_coupon_date, coupon_frequency,
     # MaturityDate=datetime.datetime(2017,12,1,0,0)
     # ValDate=datetime.datetime(2016,12,1,0,0)
 
+    # The cashflows are the same at every iteration of the calibration, so
+    # the calibration builds the cashflow_table once and passes it in
+    if cashflow_table is None:
+        cashflow_table = coupon_cashflow_table(first_coupon_date,
+                                               coupon_frequency, maturity_date,
+                                               val_date, coupon_rate, face)
+
     coupon_rate = 1.0 * coupon_rate / coupon_frequency
 
     #######################################################################
-    num_months = 12. / coupon_frequency
-
-    coupon_schedule = [first_coupon_date]
-
-    j = 1
-    while coupon_schedule[-1] < maturity_date:
-        coupon_schedule.append(
-            coupon_schedule[-1] + relativedelta(months=int(num_months)))
-        j = j + 1
-
-    if coupon_schedule[-1] > maturity_date:
-        coupon_schedule[-1] = maturity_date
-
-    coupon_schedule_temp = []
-    for ii in range(len(coupon_schedule)):
-        if coupon_schedule[ii] > val_date:
-            coupon_schedule_temp.append(coupon_schedule[ii])
-    coupon_schedule = coupon_schedule_temp
-
-    coupon_schedule_value = []
-    for ii in range(len(coupon_schedule)):
-        coupon_schedule_value.append(
-            float((coupon_schedule[ii] - val_date).days) / 365)
+    coupon_schedule_value = cashflow_table['times']
 
     valuation_curve = interpolated_yield_curve(yield_curve,
                                                coupon_schedule_value)
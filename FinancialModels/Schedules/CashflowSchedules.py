@@ -0,0 +1,209 @@
+###
+# Cashflow schedules of the fixed income products. The payment dates only
+# depend on the contract terms, so they are cached by the process, and
+# the cashflow tables (the dates, times and amounts still to be paid at a
+# valuation date as NumPy arrays) are built from them for the pricing
+# functions and the calibrations
+###
+
+import functools
+import numpy as np
+from dateutil.relativedelta import relativedelta
+
+# The most schedules kept by each of the caches of this module. The least
+# recently used schedules are dropped beyond this, so the memory stays
+# bounded however many products and valuation dates are seen
+MAX_CACHED_SCHEDULES = 1024
+
+
+@functools.lru_cache(maxsize=MAX_CACHED_SCHEDULES)
+def generate_coupon_schedule(first_coupon_date, coupon_frequency,
+                             maturity_date):
+    '''
+    generate_coupon_schedule(first_coupon_date, coupon_frequency,
+                             maturity_date)
+
+    Functionality
+    =============
+    Returns all the coupon dates of a bond from the first coupon date to the
+    maturity date. The schedules are cached (up to MAX_CACHED_SCHEDULES)
+    since they do not depend on the valuation date, so revaluing a bond at
+    later dates (e.g. along a simulated path) reuses them
+
+    Parameters
+    ==========
+    first_coupon_date : datetime
+        the date of the first coupon
+    coupon_frequency : int
+        the number of coupons per year
+    maturity_date : datetime
+        the maturity date of the bond
+
+    Returns
+    =======
+    coupon_schedule : tuple of datetimes
+        the coupon dates of the bond
+    '''
+    num_months = 12. / coupon_frequency
+
+    coupon_schedule = [first_coupon_date]
+    while coupon_schedule[-1] < maturity_date:
+        coupon_schedule.append(
+            coupon_schedule[-1] + relativedelta(months=int(num_months)))
+
+    if coupon_schedule[-1] > maturity_date:
+        coupon_schedule[-1] = maturity_date
+
+    return tuple(coupon_schedule)
+
+
+def generate_payment_schedule(maturity_date, payment_frequency, val_date):
+    '''
+    generate_payment_schedule(maturity_date, payment_frequency, val_date)
+
+    Functionality
+    =============
+    Returns the payment dates of a CDS rolled back from the maturity date
+    until the first date on or before the valuation date. The schedules are
+    cached (up to MAX_CACHED_SCHEDULES) and each call returns a new list
+
+    Parameters
+    ==========
+    maturity_date : datetime
+        the maturity date of the CDS
+    payment_frequency : int
+        the number of payments per year
+    val_date : datetime
+        the valuation date
+
+    Returns
+    =======
+    payment_schedule : list of datetimes
+        the payment dates in increasing order
+    '''
+    return list(_rolled_payment_schedule(maturity_date,
+                                         int(12. / payment_frequency),
+                                         val_date))
+
+
+@functools.lru_cache(maxsize=MAX_CACHED_SCHEDULES)
+def _rolled_payment_schedule(maturity_date, num_months, val_date):
+    # The dates rolled back from the maturity date down to the first one on
+    # or before the valuation date, in increasing order
+    rolled_schedule = [maturity_date]
+    while rolled_schedule[-1] > val_date:
+        rolled_schedule.append(
+            rolled_schedule[-1] + relativedelta(months=-num_months))
+
+    return tuple(reversed(rolled_schedule))
+
+
+@functools.lru_cache(maxsize=MAX_CACHED_SCHEDULES)
+def _coupon_dates(first_coupon_date, coupon_frequency, maturity_date):
+    # The coupon schedule as a read-only array of datetime64, so the coupons
+    # left at a valuation date are found without a loop over the dates
+    all_dates = np.array(generate_coupon_schedule(
+        first_coupon_date, coupon_frequency, maturity_date), 'datetime64[us]')
+    all_dates.flags.writeable = False
+    return all_dates
+
+
+def coupon_cashflow_table(first_coupon_date, coupon_frequency, maturity_date,
+                          val_date, coupon_rate, face):
+    '''
+    coupon_cashflow_table(first_coupon_date, coupon_frequency, maturity_date,
+                          val_date, coupon_rate, face)
+
+    Functionality
+    =============
+    The cashflows of a coupon bond left to be paid after the valuation date.
+    The times are in years (days / 365) from the valuation date and the face
+    value is added to the last coupon. The arrays are read-only so a table
+    can be cached and shared (see Product.get_cached_cashflow_table)
+
+    Parameters
+    ==========
+    first_coupon_date : datetime
+        the date of the first coupon
+    coupon_frequency : int
+        the number of coupons per year
+    maturity_date : datetime
+        the maturity date of the bond
+    val_date : datetime
+        the valuation date
+    coupon_rate : double
+        the annual coupon rate in percentage terms
+    face : double
+        the face value of the bond
+
+    Returns
+    =======
+    cashflow_table : dict
+        the payment 'dates' (datetime64), 'times' and 'amounts' of the
+        cashflows as numpy arrays
+    '''
+    coupon_amount = 1.0 * coupon_rate / coupon_frequency / 100. * face
+
+    all_dates = _coupon_dates(first_coupon_date, coupon_frequency,
+                              maturity_date)
+
+    # Only the coupons after the valuation date are left to be paid. The
+    # whole days are floored as by the days of a timedelta
+    val_date = np.datetime64(val_date, 'us')
+    dates = all_dates[all_dates > val_date]
+    times = ((dates - val_date) // np.timedelta64(1, 'D')) / 365.
+    amounts = np.full(len(dates), coupon_amount)
+    if len(dates) > 0:
+        amounts[-1] += face
+
+    return _read_only_table(dates, times, amounts)
+
+
+def CDS_cashflow_table(maturity_date, payment_frequency, val_date,
+                       contract_spread, notional):
+    '''
+    CDS_cashflow_table(maturity_date, payment_frequency, val_date,
+                       contract_spread, notional)
+
+    Functionality
+    =============
+    The premium payments of a CDS left to be paid after the valuation date
+    (see generate_payment_schedule). The times are in years (days / 365)
+    from the valuation date and the arrays are read-only so a table can be
+    cached and shared
+
+    Parameters
+    ==========
+    maturity_date : datetime
+        the maturity date of the CDS
+    payment_frequency : int
+        the number of payments per year
+    val_date : datetime
+        the valuation date
+    contract_spread : double
+        the contract spread in basis points
+    notional : double
+        the notional of the CDS
+
+    Returns
+    =======
+    cashflow_table : dict
+        the payment 'dates' (datetime64), 'times' and premium 'amounts' of
+        the payments as numpy arrays
+    '''
+    dates = [x for x in generate_payment_schedule(
+        maturity_date, payment_frequency, val_date)
+             if (x - val_date).days > 0]
+    times = np.array([(x - val_date).days for x in dates], float) / 365.
+    amounts = np.full(len(dates), notional * (1. / payment_frequency) * (
+            (contract_spread / 100.) / 100.))
+
+    return _read_only_table(np.array(dates, 'datetime64[us]'), times,
+                            amounts)
+
+
+def _read_only_table(dates, times, amounts):
+    table = {'dates': dates, 'times': times, 'amounts': amounts}
+    for values in table.values():
+        values.flags.writeable = False
+    return table
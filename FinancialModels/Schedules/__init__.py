@@ -0,0 +1 @@
+from Schedules.CashflowSchedules import *
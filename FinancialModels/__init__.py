@@ -1,3 +1,4 @@
 from FinancialModels.Calibrations import *
 from FinancialModels.Interpolators import *
 from FinancialModels.Optimizers import *
+from FinancialModels.Schedules import *
@@ -7,7 +7,7 @@ import pandas as pd
 import numpy as np
 import ValuationEngine as valEng
 import FinancialModels as finModels
-from Product import Product
+from Product import Product, add_factor_gradient
 
 
 class Bond(Product):
@@ -127,6 +127,8 @@ class Bond(Product):
         sets the valuation specification to use when pricing thebond
     get_asset_class :
         returns the asset class of the product
+    get_cashflow_table :
+        returns the cashflows left to be paid at a valuation date
     get_exposure :
         returns the exposure of the product
     get_market_risk_factors :
@@ -134,7 +136,8 @@ class Bond(Product):
     get_credit_risk_factors :
         return a set of credit risk factors underlying the product
     value_product :
-        method used to determine the market value of the product
+        method used to determine the market value of the product (and
+        optionally its gradient with respect to the risk factors)
     to_string :
         prints out details about the product
     '''
@@ -304,6 +307,22 @@ class Bond(Product):
     def get_asset_class(self):
         return self._asset_class
 
+    # -------------------------------------------------------------------------
+    # The coupons and face value left to be paid after the valuation date
+    # (see finModels.coupon_cashflow_table), cached by the valuation date
+    # until the terms of the bond change
+    # -------------------------------------------------------------------------
+    def get_cashflow_table(self, val_date):
+        terms = (self.first_coupon_date, self.coupon_freq, self.maturity_date,
+                 self.coupon_rate, self.face_value)
+
+        def build_table(date):
+            return finModels.coupon_cashflow_table(
+                self.first_coupon_date, self.coupon_freq, self.maturity_date,
+                date, self.coupon_rate, self.face_value)
+
+        return self.get_cached_cashflow_table(val_date, terms, build_table)
+
     # -------------------------------------------------------------------------
     # Method to return the exposure of the stock
     # -------------------------------------------------------------------------
@@ -325,9 +344,9 @@ class Bond(Product):
         # Add the risk factors to the correct sets
 
         # Risk-free rate
-        curves.add('RiskFree-' + self.rf_ID + '-' + self.currency)
+        curves.add('RiskFree-Gov-' + self.currency)
         # Credit Spreads
-        lists.add('CreditSpreads')
+        matrices.add('CreditSpreads-Ratings-' + self.currency)
         # Idiosyncratic Spread
         constants.add('IdiosyncraticSpread-' + self.ID)
 
@@ -363,9 +382,11 @@ class Bond(Product):
         return risk_factors
 
     # -------------------------------------------------------------------------
-    # Method to value the underlying product
+    # Method to value the underlying product. If return_gradient is True a
+    # dictionary is returned with the 'value' and the 'gradient' (a
+    # dictionary of risk factor name : derivative of the value)
     # -------------------------------------------------------------------------
-    def value_product(self, market_environment):
+    def value_product(self, market_environment, return_gradient=False):
         FirstCouponDate = self.first_coupon_date
         CouponFrequency = self.coupon_freq
         MaturityDate = self.maturity_date
@@ -413,8 +434,34 @@ class Bond(Product):
         # calculate price
         price = valEng.bond_pricing_function(FirstCouponDate, CouponFrequency,
                                              MaturityDate, ValDate, CouponRate,
-                                             Face, yieldCurveInput)
-        return price
+                                             Face, yieldCurveInput,
+                                             return_gradient,
+                                             self.get_cashflow_table(ValDate))
+        if not return_gradient:
+            return price
+
+        # Chain the derivatives with respect to the key rates of the yield
+        # curve back to the risk-free curve, credit spreads and idiosyncratic
+        # spread
+        key_rate_gradient = price['yield_curve']
+        risk_free_weights = finModels.interpolated_yield_curve_weights(
+            risk_free_curve, payment_timing)
+        gradient = {}
+        add_factor_gradient(gradient, 'Curves-' + string1,
+                            list(risk_free_curve),
+                            np.dot(key_rate_gradient, risk_free_weights))
+        if rating != 'AAA':
+            credit_spread_weights = finModels.interpolated_yield_curve_weights(
+                credit_spreads_vector, payment_timing)
+            add_factor_gradient(gradient, 'Matrices-' + string2 + '-' + rating,
+                                list(credit_spread_matrix),
+                                np.dot(key_rate_gradient,
+                                       credit_spread_weights))
+        gradient['Constants-' + string3] = float(np.sum(key_rate_gradient))
+
+        price_info = {'value': price['value'], 'gradient': gradient}
+
+        return price_info
 
     # -------------------------------------------------------------------------
     # print(out a table describing the product
@@ -448,6 +495,89 @@ class Bond(Product):
         print(bar)
 
 
+
+def value_bond_book(bonds, engine, states, val_date=None):
+    '''
+    value_bond_book(bonds, engine, states, val_date=None)
+
+    Functionality
+    =============
+    Values a book of bonds priced by Bond.value_product (fixed rate and zero
+    coupon bonds) under every shocked state of a ScenarioEngine at once. The
+    yields at the cashflow times are linear in the risk-free curve, the
+    credit spreads of the rating and the idiosyncratic spread, so each bond
+    maps the curves of all the states to its yields with one matrix product
+    of the interpolation weights, and discounts its cashflow table under all
+    the states together. The values are the same as value_product in the
+    market environment built from each state. Bonds that have matured by the
+    valuation date are valued at maturity.
+
+    Parameters
+    ==========
+    bonds : list of Bond objects
+        the bonds to value
+    engine : ScenarioEngine object
+        the engine the states were shocked with
+    states : numpy array
+        the shocked state vectors (Rows=States)
+    val_date : datetime
+        the valuation date (defaulted to that of the base environment)
+
+    Returns
+    =======
+    values : numpy array
+        the value of one unit of each bond (Col) in each state (Rows)
+    '''
+    states = np.atleast_2d(states)
+    mkt_env = engine.get_mkt_env()
+    if val_date == None:
+        val_date = mkt_env.get_val_date()
+
+    # The key rates the risk-free curve and credit spreads are layered on
+    payment_timing = [0.25, 0.5, 1, 2, 3, 4, 5, 7, 10, 15, 20, 25, 30]
+    key_rate_curve = pd.DataFrame([payment_timing], columns=payment_timing)
+
+    values = np.zeros((len(states), len(bonds)))
+    for kk, bond in enumerate(bonds):
+        currency = bond.get_currency()
+        table = bond.get_cashflow_table(min(val_date,
+                                            bond.get_maturity_date()))
+        times = table['times']
+        if len(times) == 0:
+            continue
+        key_rate_weights = finModels.interpolated_yield_curve_weights(
+            key_rate_curve, times)
+
+        string1 = 'RiskFree-Gov-' + currency
+        risk_free_curve = mkt_env.get_curve(string1)
+        weights = np.dot(key_rate_weights,
+                         finModels.interpolated_yield_curve_weights(
+                             risk_free_curve, payment_timing))
+        rates = np.dot(engine.get_container_states(states, 'Curves',
+                                                   string1)[:, 0, :],
+                       weights.T)
+
+        rating = bond.get_rating('S&P')
+        if rating != 'AAA':
+            string2 = 'CreditSpreads-Ratings-' + currency
+            credit_spread_matrix = mkt_env.get_matrix(string2)
+            weights = np.dot(key_rate_weights,
+                             finModels.interpolated_yield_curve_weights(
+                                 credit_spread_matrix, payment_timing))
+            row = list(credit_spread_matrix.index).index(rating)
+            rates += np.dot(engine.get_container_states(states, 'Matrices',
+                                                        string2)[:, row, :],
+                            weights.T)
+
+        string3 = 'IdiosyncraticSpread-' + bond.get_ID()
+        rates += engine.get_container_states(states, 'Constants',
+                                             string3)[:, None]
+
+        values[:, kk] = np.dot(np.power(1 + rates, -times), table['amounts'])
+
+    return values
+
+
 # -----------------------------------------------------------------------------
 # Testing
 # -----------------------------------------------------------------------------
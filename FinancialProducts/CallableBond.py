@@ -60,6 +60,7 @@ class CallableBond(Bond):
         for pricing
     val_spec : str
         string to specify the valuation specification when valuing the option
+        (one of valEng.SHORT_RATE_MODELS, otherwise the Ho-Lee model is used)
 
     Methods
     =======
@@ -77,8 +78,16 @@ class CallableBond(Bond):
     set_option_details :
         sets the dictionary of the detials about bond optionality
         coupon bond
+    get_market_risk_factors :
+        return a set of market risk factors underlying the product
     value_product :
         method used to determine the market value of the product
+    get_call_schedule :
+        returns the matrix of call dates and strikes and the exercise type
+    get_short_rate_model :
+        returns the short rate model of the lattice the bond is valued on
+    get_market_data_keys :
+        returns the keys of the market data used to value the bond
     to_string :
         prints out details about the product
     '''
@@ -139,65 +148,94 @@ class CallableBond(Bond):
     def set_option_details(self, new_option_details):
         self.option_details = new_option_details
 
+    # -------------------------------------------------------------------------
+    # The short rate lattice is built from the risk-free curve and the drift
+    # and volatility of its shortest tenor
+    # -------------------------------------------------------------------------
+    def get_market_risk_factors(self):
+        # Create the empty sets to populate
+        constants = set([])
+        lists = set([])
+        curves = set([])
+        matrices = set([])
+        surfaces = set([])
+
+        # Add the risk factors to the correct sets
+
+        # Risk-free rate
+        curves.add('RiskFree-Gov-' + self.currency)
+        # Drift and volatility of the short rate
+        lists.add('RiskFactorMeans')
+        lists.add('RiskFactorVolatilities')
+
+        # Crete the dictionary of risk factors
+        risk_factors = {'Constants': constants, 'Lists': lists,
+                        'Curves': curves, 'Matrices': matrices,
+                        'Surfaces': surfaces}
+
+        # Return a dictionary of the risk factors
+        return risk_factors
+
     # -------------------------------------------------------------------------
     # Method to value the underlying product
     # -------------------------------------------------------------------------
     def value_product(self, market_environment):
 
         # Initial Short Rate
-        currency = self.currency
-        string1 = 'RiskFree-Gov-' + currency
-        initial_short_rate = market_environment.get_curve(string1)
+        keys = self.get_market_data_keys()
+        initial_short_rate = market_environment.get_curve(keys['curve'])
         initial_short_rate = initial_short_rate.iloc[0, 0]
 
-        string2 = 'Curves-RiskFree-Gov-' + currency + '-0.25'
+        # Drift and volatility of the short rate
         mean_vect = market_environment.get_list('RiskFactorMeans')
         vol_vect = market_environment.get_list('RiskFactorVolatilities')
-        mu = mean_vect[string2][0]
-        vol = vol_vect[string2][0]
+        mu = mean_vect[keys['short_rate']][0]
+        vol = vol_vect[keys['short_rate']][0]
 
-        FirstCouponDate = self.first_coupon_date
-        CouponFrequency = self.coupon_freq
-        CouponRate = self.coupon_rate
-        Face = self.face_value
         ValDate = market_environment.get_val_date()
-        MaturityDate = self.maturity_date
-
-        # callSchedule
-        from datetime import datetime, date, time
-        callSchedule = self.option_details
-        exercise_time_list = []
-        for key in callSchedule:
-            exercise_time_list.append(key)
-        strike_list = []
-        for key in callSchedule:
-            strike_list.append(callSchedule[key]['strike'])
-        key_list = []
-        for key in callSchedule:
-            key_list.append(key)
-        after_feature = callSchedule[key_list[0]]['after_feature']
-
-        temp1 = []
-        for ii in range(0, len(strike_list)):
-            temp1.append([exercise_time_list[ii], strike_list[ii]])
-        callSchedule = np.matrix(temp1)
-
-        # CallScheduleExerciseType
-        if after_feature == 'True':
-            CallScheduleExerciseType = 'American'
-        else:
-            CallScheduleExerciseType = 'Bermudan'
+        callSchedule, CallScheduleExerciseType = self.get_call_schedule()
 
         # calculate price
-        price = valEng.callable_bond_pricing_function(initial_short_rate, mu,
-                                                      vol, FirstCouponDate,
-                                                      CouponFrequency,
-                                                      CouponRate, Face,
-                                                      callSchedule,
-                                                      CallScheduleExerciseType,
-                                                      ValDate, MaturityDate)
+        price = valEng.callable_bond_pricing_function(
+            initial_short_rate, mu, vol, self.first_coupon_date,
+            self.coupon_freq, self.coupon_rate, self.face_value, callSchedule,
+            CallScheduleExerciseType, ValDate, self.maturity_date,
+            self.get_short_rate_model())
         return price
 
+    # -------------------------------------------------------------------------
+    # The call schedule as a matrix of the call dates and strikes, and its
+    # exercise type (American if the bond is callable after the call dates)
+    # -------------------------------------------------------------------------
+    def get_call_schedule(self):
+        call_dates = list(self.option_details)
+        call_schedule = np.matrix(
+            [[k, (self.option_details)[k]['strike']] for k in call_dates])
+
+        after_feature = (self.option_details)[call_dates[0]]['after_feature']
+        if after_feature == 'True':
+            exercise_type = 'American'
+        else:
+            exercise_type = 'Bermudan'
+
+        return call_schedule, exercise_type
+
+    # -------------------------------------------------------------------------
+    # Short rate model of the lattice the bond is valued on
+    # -------------------------------------------------------------------------
+    def get_short_rate_model(self):
+        if self.val_spec in valEng.SHORT_RATE_MODELS:
+            return self.val_spec
+        return 'ho_lee'
+
+    # -------------------------------------------------------------------------
+    # Keys of the market data used to value the bond
+    # -------------------------------------------------------------------------
+    def get_market_data_keys(self):
+        return {'curve': 'RiskFree-Gov-' + self.currency,
+                'short_rate': 'Curves-RiskFree-Gov-' + self.currency +
+                              '-0.25'}
+
     # -------------------------------------------------------------------------
     # print(out a table describing the product
     # -------------------------------------------------------------------------
@@ -241,6 +279,83 @@ class CallableBond(Bond):
         print(bar)
 
 
+def value_callable_bond_book(bonds, engine, states, val_date=None):
+    '''
+    value_callable_bond_book(bonds, engine, states, val_date=None)
+
+    Functionality
+    =============
+    Values a book of callable bonds under every shocked state of a
+    ScenarioEngine at once. The bonds are grouped by currency, coupon
+    frequency and short rate model, and each group shares one short rate
+    lattice per state, built from the short rate of the risk-free curve and
+    the RiskFactorMeans and RiskFactorVolatilities of its 0.25 tenor in that
+    state. All the bonds of a group are then inducted back on the lattices
+    of all the states together. The values are the same as value_product in
+    the market environment built from each state. Bonds that have matured
+    by the valuation date are valued at maturity.
+
+    Parameters
+    ==========
+    bonds : list of CallableBond objects
+        the bonds to value
+    engine : ScenarioEngine object
+        the engine the states were shocked with
+    states : numpy array
+        the shocked state vectors (Rows=States)
+    val_date : datetime
+        the valuation date (defaulted to that of the base environment)
+
+    Returns
+    =======
+    values : numpy array
+        the value of one unit of each bond (Col) in each state (Rows)
+    '''
+    states = np.atleast_2d(states)
+    mkt_env = engine.get_mkt_env()
+    if val_date == None:
+        val_date = mkt_env.get_val_date()
+
+    groups = {}
+    for kk, bond in enumerate(bonds):
+        key = (bond.get_currency(), bond.get_coupon_freq(),
+               bond.get_short_rate_model())
+        groups.setdefault(key, []).append(kk)
+
+    means = engine.get_container_states(states, 'Lists', 'RiskFactorMeans')
+    vols = engine.get_container_states(states, 'Lists',
+                                       'RiskFactorVolatilities')
+    mean_names = list(mkt_env.get_list('RiskFactorMeans'))
+    vol_names = list(mkt_env.get_list('RiskFactorVolatilities'))
+
+    values = np.zeros((len(states), len(bonds)))
+    for (currency, coupon_freq, model), group in groups.items():
+        keys = bonds[group[0]].get_market_data_keys()
+        initial_short_rate = engine.get_container_states(
+            states, 'Curves', keys['curve'])[:, 0, 0]
+        mu = means[:, 0, mean_names.index(keys['short_rate'])]
+        vol = vols[:, 0, vol_names.index(keys['short_rate'])]
+
+        schedules = []
+        for kk in group:
+            bond = bonds[kk]
+            call_schedule, exercise_type = bond.get_call_schedule()
+            schedules.append(valEng.callable_bond_schedule(
+                bond.get_first_coupon_date(), coupon_freq,
+                bond.get_coupon_rate(), bond.get_face_value(), call_schedule,
+                exercise_type, min(val_date, bond.get_maturity_date()),
+                bond.get_maturity_date()))
+
+        dt = 1. / coupon_freq
+        num_steps = max(x['num_steps'] for x in schedules)
+        rates = valEng.short_rate_lattice(initial_short_rate, mu, vol, dt,
+                                          num_steps, model)
+        values[:, group] = valEng.callable_bond_lattice_values(
+            rates, dt, schedules, model)
+
+    return values
+
+
 # -----------------------------------------------------------------------------
 # Testing
 # -----------------------------------------------------------------------------
@@ -98,7 +98,9 @@ class CashAccount(Product):
     # Method to value the underlying product. This should always be one unit of
     # the currency. Interest is dealt with by the portflio object
     # -------------------------------------------------------------------------
-    def value_product(self, market_environment=None):
+    def value_product(self, market_environment=None, return_gradient=False):
+        if return_gradient:
+            return {'value': 1.0, 'gradient': {}}
         return 1.0
 
 
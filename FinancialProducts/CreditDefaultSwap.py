@@ -3,6 +3,8 @@
 #
 
 import ValuationEngine as valEng
+import FinancialModels as finModels
+from Product import add_factor_gradient
 from Swap import Swap
 
 
@@ -92,12 +94,15 @@ class CreditDefaultSwap(Swap):
         returns the subsector of the swap
     set_subsector :
         sets the subsector of the swap
+    get_cashflow_table :
+        returns the premium payments left at a valuation date
     get_market_risk_factors :
         return a set of market risk factors underlying the product
     get_credit_risk_factors :
         return a set of credit risk factors underlying the product
     value_product :
-        method used to determine the market value of the product
+        method used to determine the market value of the product (and
+        optionally its gradient with respect to the risk factors)
     to_string :
         prints out details about the product
     '''
@@ -198,6 +203,22 @@ class CreditDefaultSwap(Swap):
     def set_subsector(self, new_subsector):
         self.subsector = new_subsector
 
+    # -------------------------------------------------------------------------
+    # The premium payments left after the valuation date (see
+    # finModels.CDS_cashflow_table), cached by the valuation date until the
+    # terms of the swap change
+    # -------------------------------------------------------------------------
+    def get_cashflow_table(self, val_date):
+        terms = (self.expiration_date, self.pmt_freq, self.contract_spread,
+                 self.notional)
+
+        def build_table(date):
+            return finModels.CDS_cashflow_table(
+                self.expiration_date, self.pmt_freq, date,
+                self.contract_spread, self.notional)
+
+        return self.get_cached_cashflow_table(val_date, terms, build_table)
+
     # -------------------------------------------------------------------------
     # Define methods for returning a set of market risk factors and credit risk
     # factors
@@ -212,12 +233,13 @@ class CreditDefaultSwap(Swap):
 
         # Add the risk factors to the correct sets
 
-        # Risk-free rate
-        curves.add('RiskFree-' + self.rf_ID + '-' + self.currency)
-        # Default Probability
-        lists.add('DefualtProbability')
+        # Discount curve
+        curves.add(self.discount_curve)
+        # Hazard rates
+        matrices.add('HazardRates-Ratings')
+        constants.add('IdiosyncraticHazardRate-' + self.ID)
         # Recovery Rate
-        constants.add('RecoveryRate-' + self.ID)
+        lists.add('RecoveryRates')
 
         # Crete the dictionary of risk factors
         risk_factors = {'Constants': constants, 'Lists': lists,
@@ -251,9 +273,11 @@ class CreditDefaultSwap(Swap):
         return risk_factors
 
     # -------------------------------------------------------------------------
-    # Method to value the underlying product
+    # Method to value the underlying product. If return_gradient is True a
+    # dictionary is returned with the 'value' and the 'gradient' (a
+    # dictionary of risk factor name : derivative of the value)
     # -------------------------------------------------------------------------
-    def value_product(self, market_environment):
+    def value_product(self, market_environment, return_gradient=False):
         PaymentFrequency = self.pmt_freq
         contractSpread = self.contract_spread
         Notional = self.notional
@@ -266,10 +290,12 @@ class CreditDefaultSwap(Swap):
         tier = self.tier
         try:
             RecoveryRate = RecoveryRateList.iloc[0][tier]
+            recovery_label = tier
         # If the tier is not contained in the list. Be conservative and assume
         # the worst
         except:
             RecoveryRate = RecoveryRateList.iloc[0][-1]
+            recovery_label = list(RecoveryRateList)[-1]
 
         # yieldCurveInput
         rating = self.ratings['S&P']
@@ -294,8 +320,29 @@ class CreditDefaultSwap(Swap):
         price = valEng.CDS_pricing_function(PaymentFrequency, contractSpread,
                                             Notional, ValDate, MaturityDate,
                                             BuyOrSellProtection, RecoveryRate,
-                                            yieldCurveInput, HazardRate)
-        return price
+                                            yieldCurveInput, HazardRate,
+                                            return_gradient,
+                                            self.get_cashflow_table(ValDate))
+        if not return_gradient:
+            return price
+
+        # The hazard rate is floored at zero
+        hazard_gradient = price['hazard_rate']
+        if IdiosyncraticHazardRate + HazardRateByRating < 0:
+            hazard_gradient = 0.0
+        gradient = {}
+        add_factor_gradient(gradient, 'Curves-' + string1,
+                            list(yieldCurveInput), price['yield_curve'])
+        gradient['Constants-' + string2] = hazard_gradient
+        add_factor_gradient(gradient, 'Matrices-' + string3 + '-' + rating,
+                            list(market_environment.get_matrix(string3))[:1],
+                            [hazard_gradient])
+        add_factor_gradient(gradient, 'Lists-RecoveryRates',
+                            [recovery_label], [price['recovery_rate']])
+
+        price_info = {'value': price['value'], 'gradient': gradient}
+
+        return price_info
 
     # -------------------------------------------------------------------------
     # Print out a table describing the product
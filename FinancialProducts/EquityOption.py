@@ -2,6 +2,7 @@
 # Equity Option Object
 #
 
+import numpy as np
 import ValuationEngine as valEng
 import FinancialModels as finModels
 from Option import Option
@@ -38,6 +39,8 @@ class EquityOption(Option):
         for pricing
     val_spec : str
         string to specify the valuation specification when valuing the option
+        (for American options one of valEng.AMERICAN_METHODS, otherwise the
+        default American method is used)
 
     Methods
     =======
@@ -45,6 +48,12 @@ class EquityOption(Option):
         returns the exposure of the product
     value_product :
         method used to determine the market value of the product
+    get_greeks :
+        returns the value and greeks (delta, gamma, ...) of the option
+    get_american_method :
+        returns the method used to value the option if it is American
+    get_market_data_keys :
+        returns the keys of the market data used to price the option
     '''
 
     # -------------------------------------------------------------------------
@@ -64,55 +73,12 @@ class EquityOption(Option):
     # -------------------------------------------------------------------------
     def get_exposure(self, market_environment):
 
-        OptionType = self.option_type
-        if OptionType == 'Call':
-            option = 'call'
-        if OptionType == 'Put':
-            option = 'put'
-
-        ExerciseType = self.exercise_type
-
-        S0 = self.underlying.value_product(market_environment)
-        K = self.strike
-        ID_underlying = self.underlying.get_ID()
-
-        # Risk-Free Rate
-        currency = self.currency
-        string1 = 'RiskFree-Gov-' + currency
-        r = market_environment.get_curve(string1)
-        r = r.iloc[0, 0]
-
-        # Time to Maturity
-        MaturityDate = self.expiration_date
-        ValDate = market_environment.get_val_date()
-        T = (MaturityDate - ValDate).days / 365.
-
-        # Volatility
-        string2 = 'ImpliedVols-' + currency + '-' + ID_underlying
-        volSurface = market_environment.get_surface(string2)
-        K_as_percentage_of_stockprice = float(K) / S0
-        sigma = finModels.volatility_surface_interpolation(volSurface, T,
-                                                           K_as_percentage_of_stockprice)
-
-        # Dividend Yield
-        string3 = 'DividendYields-' + ID_underlying
-        q = market_environment.get_constant(string3)
-
-        # Get the delta and gamma of the option
-        if ExerciseType == 'European':
-            price_info = valEng.black_scholes_value(S0, K, T, r, sigma, q,
-                                                    option)
-        elif ExerciseType == 'American':
-            american = True
-            N = 100
-            price_info = valEng.binomial_tree(S0, K, r, sigma, T, q, N, option,
-                                              american)
-
-        # Get the delta and gamma of the option
+        # Get the delta of the option
+        price_info = self.get_greeks(market_environment)
         delta = price_info.get('delta')
-        gamma = price_info.get('gamma')
 
         # Calculate the exposure
+        S0 = self.underlying.value_product(market_environment)
         exposure = delta * S0
 
         return exposure
@@ -121,23 +87,24 @@ class EquityOption(Option):
     # Method to value the underlying product
     # -------------------------------------------------------------------------
     def value_product(self, market_environment):
+        price_info = self.get_greeks(market_environment)
+        return price_info.get('value')
 
-        OptionType = self.option_type
-        if OptionType == 'Call':
-            option = 'call'
-        if OptionType == 'Put':
-            option = 'put'
+    # -------------------------------------------------------------------------
+    # Method to return the value and greeks of the option (with respect to
+    # the price of the underlying for delta and gamma)
+    # -------------------------------------------------------------------------
+    def get_greeks(self, market_environment):
 
+        option = self.option_type.lower()
         ExerciseType = self.exercise_type
+        keys = self.get_market_data_keys()
 
         S0 = self.underlying.value_product(market_environment)
         K = self.strike
-        ID_underlying = self.underlying.get_ID()
 
         # Risk-Free Rate
-        currency = self.currency
-        string1 = 'RiskFree-Gov-' + currency
-        r = market_environment.get_curve(string1)
+        r = market_environment.get_curve(keys['curve'])
         r = r.iloc[0, 0]
 
         # Time to Maturity
@@ -146,28 +113,111 @@ class EquityOption(Option):
         T = (MaturityDate - ValDate).days / 365.
 
         # Volatility
-        string2 = 'ImpliedVols-' + currency + '-' + ID_underlying
-        volSurface = market_environment.get_surface(string2)
+        volSurface = market_environment.get_surface(keys['surface'])
         K_as_percentage_of_stockprice = float(K) / S0
-        sigma = finModels.volatility_surface_interpolation(volSurface, T,
-                                                           K_as_percentage_of_stockprice)
+        sigma = finModels.volatility_surface_interpolation(
+            volSurface, T, K_as_percentage_of_stockprice,
+            'BilinearInterpolation')
 
         # Dividend Yield
-        string3 = 'DividendYields-' + ID_underlying
-        q = market_environment.get_constant(string3)
+        q = market_environment.get_constant(keys['dividend'])
 
-        # calculate price
+        # calculate price and greeks
         if ExerciseType == 'European':
             price_info = valEng.black_scholes_value(S0, K, T, r, sigma, q,
                                                     option)
-            price = price_info.get('value')
         if ExerciseType == 'American':
-            american = True
-            N = 100
-            price_info = valEng.binomial_tree(S0, K, r, sigma, T, q, N, option,
-                                              american)
-            price = price_info.get('value')
-        return price
+            price_info = valEng.american_option_value(
+                S0, K, r, sigma, T, q, option, self.get_american_method())
+        return price_info
+
+    # -------------------------------------------------------------------------
+    # Method used to value the option if it is American
+    # -------------------------------------------------------------------------
+    def get_american_method(self):
+        if self.val_spec in valEng.AMERICAN_METHODS:
+            return self.val_spec
+        return valEng.DEFAULT_AMERICAN_METHOD
+
+    # -------------------------------------------------------------------------
+    # Keys of the market data used to price the option
+    # -------------------------------------------------------------------------
+    def get_market_data_keys(self):
+        ID_underlying = self.underlying.get_ID()
+        return {'spot': 'MarketPrice-' + ID_underlying,
+                'curve': 'RiskFree-Gov-' + self.currency,
+                'surface': 'ImpliedVols-' + self.currency + '-' +
+                           ID_underlying,
+                'dividend': 'DividendYields-' + ID_underlying}
+
+
+def value_option_book(options, engine, states, val_date=None):
+    '''
+    value_option_book(options, engine, states, val_date=None)
+
+    Functionality
+    =============
+    Values a book of equity options under every shocked state of a
+    ScenarioEngine at once. For each option the spot, rate, dividend yield
+    and volatility surface of all the states are gathered as arrays, the
+    volatilities are interpolated for all the states together and each
+    option is priced with a single call of black_scholes_values (European)
+    or american_option_value batched over the states (American). The
+    values are the same as value_product in the market environment built
+    from each state. Options that have expired by the valuation date are
+    valued at expiration.
+
+    Parameters
+    ==========
+    options : list of EquityOption objects
+        the options to value
+    engine : ScenarioEngine object
+        the engine the states were shocked with
+    states : numpy array
+        the shocked state vectors (Rows=States)
+    val_date : datetime
+        the valuation date (defaulted to that of the base environment)
+
+    Returns
+    =======
+    values : numpy array
+        the value of one unit of each option (Col) in each state (Rows)
+    '''
+    states = np.atleast_2d(states)
+    mkt_env = engine.get_mkt_env()
+    if val_date == None:
+        val_date = mkt_env.get_val_date()
+
+    values = np.zeros((len(states), len(options)))
+    for kk, option in enumerate(options):
+        keys = option.get_market_data_keys()
+        S0 = engine.get_container_states(states, 'Constants', keys['spot'])
+        r = engine.get_container_states(states, 'Curves',
+                                        keys['curve'])[:, 0, 0]
+        q = engine.get_container_states(states, 'Constants', keys['dividend'])
+        surfaces = engine.get_container_states(states, 'Surfaces',
+                                               keys['surface'])
+
+        # Time to Maturity
+        expiration_date = option.get_expiration_date()
+        T = (expiration_date - min(val_date, expiration_date)).days / 365.
+
+        # Volatility
+        K = float(option.get_strike())
+        sigma = finModels.volatility_surface_interpolation_array(
+            mkt_env.get_surface(keys['surface']), T, K / S0,
+            'BilinearInterpolation', surfaces)
+
+        option_type = option.get_option_type().lower()
+        if option.get_exercise_type() == 'European':
+            values[:, kk] = valEng.black_scholes_values(
+                S0, K, T, r, sigma, q, option_type)['value']
+        else:
+            values[:, kk] = valEng.american_option_value(
+                S0, K, r, sigma, T, q, option_type,
+                option.get_american_method())['value']
+
+    return values
 
 
 # -----------------------------------------------------------------------------
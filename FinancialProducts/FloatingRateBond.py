@@ -7,6 +7,7 @@ import numpy as np
 import ValuationEngine as valEng
 import FinancialModels as finModels
 from Bond import Bond
+from Product import add_factor_gradient
 
 
 class FlaotingRateBond(Bond):
@@ -72,8 +73,11 @@ class FlaotingRateBond(Bond):
         returns the spread over the floating rate for the bond
     set_floating_spread :
         sets the spread over the floating rate for the bond
+    get_market_risk_factors :
+        return a set of market risk factors underlying the product
     value_product :
-        method used to determine the market value of the product
+        method used to determine the market value of the product (and
+        optionally its gradient with respect to the risk factors)
     to_string :
         prints out details about the product
     '''
@@ -119,9 +123,20 @@ class FlaotingRateBond(Bond):
         self.floating_spread = new_floating_spread
 
     # -------------------------------------------------------------------------
-    # Method to value the underlying product
+    # The floating rate reference curve is a risk factor on top of those of a
+    # fixed rate bond
     # -------------------------------------------------------------------------
-    def value_product(self, market_environment):
+    def get_market_risk_factors(self):
+        risk_factors = super(FlaotingRateBond, self).get_market_risk_factors()
+        risk_factors['Curves'].add(self.floating_ref)
+        return risk_factors
+
+    # -------------------------------------------------------------------------
+    # Method to value the underlying product. If return_gradient is True a
+    # dictionary is returned with the 'value' and the 'gradient' (a
+    # dictionary of risk factor name : derivative of the value)
+    # -------------------------------------------------------------------------
+    def value_product(self, market_environment, return_gradient=False):
         FirstCouponDate = self.first_coupon_date
         CouponFrequency = self.coupon_freq
         MaturityDate = self.maturity_date
@@ -179,8 +194,37 @@ class FlaotingRateBond(Bond):
         price = valEng.FRN_pricing_function(FirstCouponDate, CouponFrequency,
                                             MaturityDate, ValDate, CouponRate,
                                             Face, yieldCurveInput,
-                                            referenceCurveInput)
-        return price
+                                            referenceCurveInput,
+                                            return_gradient,
+                                            self.get_cashflow_table(ValDate))
+        if not return_gradient:
+            return price
+
+        # Chain the derivatives with respect to the key rates of the yield
+        # curve back to the risk-free curve, credit spreads and idiosyncratic
+        # spread. The reference curve is only shifted by a constant spread
+        key_rate_gradient = price['yield_curve']
+        risk_free_weights = finModels.interpolated_yield_curve_weights(
+            risk_free_curve, payment_timing)
+        gradient = {}
+        add_factor_gradient(gradient, 'Curves-' + string1,
+                            list(risk_free_curve),
+                            np.dot(key_rate_gradient, risk_free_weights))
+        if rating != 'AAA':
+            credit_spread_weights = finModels.interpolated_yield_curve_weights(
+                credit_spreads_vector, payment_timing)
+            add_factor_gradient(gradient, 'Matrices-' + string2 + '-' + rating,
+                                list(credit_spread_matrix),
+                                np.dot(key_rate_gradient,
+                                       credit_spread_weights))
+        gradient['Constants-' + string3] = float(np.sum(key_rate_gradient))
+        add_factor_gradient(gradient, 'Curves-' + string4,
+                            list(referenceCurveInput),
+                            price['reference_curve'])
+
+        price_info = {'value': price['value'], 'gradient': gradient}
+
+        return price_info
 
     # -------------------------------------------------------------------------
     # Print out a table describing the product
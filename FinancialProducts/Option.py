@@ -153,15 +153,12 @@ class Option(Derivative):
         # Add the risk factors to the correct sets
 
         # Risk-free
-        curves.add('RiskFree-' + self.rf_ID + '-' + self.currency)
+        curves.add('RiskFree-Gov-' + self.currency)
         # Underlying
-        if type(self.underlying) == str:
-            constants.add(
-                (self.underlying).get_ID() + (self.underlying).get_currency())
-        else:
-            constants.add('MarketPrice-' + (self.underlying).get_ID())
+        underlying_ID = (self.underlying).get_ID()
+        constants.add('MarketPrice-' + underlying_ID)
         # Implied Volatilities
-        surfaces.add('ImpliedVols-' + (self.underlying).get_ID())
+        surfaces.add('ImpliedVols-' + self.currency + '-' + underlying_ID)
 
         # Crete the dictionary of risk factors
         risk_factors = {'Constants': constants, 'Lists': lists,
@@ -2,6 +2,12 @@
 # Portfolio Object
 #
 
+import inspect
+import numpy as np
+from Bond import Bond, value_bond_book
+from CallableBond import CallableBond, value_callable_bond_book
+from EquityOption import EquityOption, value_option_book
+
 class Portfolio(object):
     '''
     Portfolio(object)
@@ -14,6 +20,11 @@ class Portfolio(object):
         dictionary of positions (instances of product class)
     currency :
         the currency to used for the denomination of all portfolio values
+    factor_positions : dict ((str, str):list of products)
+        the positions depending on each (container type, key) of market data,
+        built from the risk factors declared by the products when first
+        needed (positions that do not declare their risk factors are stored
+        under None and depend on all market data)
 
     Methods
     =======
@@ -29,11 +40,37 @@ class Portfolio(object):
         return a set of market risk factors underlying the portfolio
     get_credit_risk_factors :
         return a set of credit risk factors underlying the portfolio
+    get_factor_positions :
+        return the positions depending on each piece of market data
+    get_dependent_positions :
+        return the positions depending on a piece of market data
     value_product
         determine the market value of the entire portfolio
+    value_position :
+        determine the market value of a single position of the portfolio
+    value_positions :
+        determine the market value of each position of the portfolio
+    supports_gradient :
+        returns True if a product can return the gradient of its value
+    value_bond_positions :
+        determine the market value of the fixed rate and zero coupon bond
+        positions under a matrix of shocked states at once
+    value_option_positions :
+        determine the market value of the equity option positions under a
+        matrix of shocked states at once
+    value_callable_bond_positions :
+        determine the market value of the callable bond positions under a
+        matrix of shocked states at once
+    value_batched_positions :
+        determine the market value of all the positions valued in batches
+        (bonds, equity options and callable bonds) under a matrix of shocked
+        states
     get_FX_rate :
         helper function to get the FX conversion rate to convert the product
         value to the currency of the portfolio
+    get_FX_risk_factors :
+        helper function to get the FX rates used to convert the product value
+        to the currency of the portfolio
     to_string :
         prints out details about the portfolio
     '''
@@ -44,6 +81,7 @@ class Portfolio(object):
     def __init__(self, positions, currency='CAD'):
         self.positions = positions
         self.currency = currency
+        self.factor_positions = None
 
     # -------------------------------------------------------------------------
     # Basic Getter and Setter Methods for the bond attributes
@@ -53,12 +91,14 @@ class Portfolio(object):
 
     def set_currency(self, new_currency):
         self.currency = new_currency
+        self.factor_positions = None
 
     # -------------------------------------------------------------------------
     # Add a position to the portfolio. If the object already exists then update
     # the number of units appropriately
     # -------------------------------------------------------------------------
     def add_position(self, product, units=1):
+        self.factor_positions = None
         if product in self.positions:
             current_units = (self.positions).get(product)
             # Check if the trades cancel out
@@ -100,11 +140,15 @@ class Portfolio(object):
         # appropriate set. Sets were used to avoid repitition in risk factors
         for k in (self.positions).keys():
             factor_dict = k.get_market_risk_factors()
-            constants.add(factor_dict.get('Constants'))
-            lists.add(factor_dict.get('Lists'))
-            curves.add(factor_dict.get('Curves'))
-            matrices.add(factor_dict.get('Matrices'))
-            surfaces.add(factor_dict.get('Surfaces'))
+            constants.update(factor_dict.get('Constants'))
+            lists.update(factor_dict.get('Lists'))
+            curves.update(factor_dict.get('Curves'))
+            matrices.update(factor_dict.get('Matrices'))
+            surfaces.update(factor_dict.get('Surfaces'))
+
+            # The value of a product in another currency also depends on the
+            # FX rate used to convert it to the currency of the portfolio
+            constants.update(self.get_FX_risk_factors(k))
 
         # Crete the dictionary of risk factors
         risk_factors = {'Constants': constants, 'Lists': lists,
@@ -127,11 +171,11 @@ class Portfolio(object):
         # appropriate set. Sets were used to avoid repitition in risk factors
         for k in (self.positions).keys():
             factor_dict = k.get_credit_risk_factors()
-            constants.add(factor_dict.get('Constants'))
-            lists.add(factor_dict.get('Lists'))
-            curves.add(factor_dict.get('Curves'))
-            matrices.add(factor_dict.get('Matrices'))
-            surfaces.add(factor_dict.get('Surfaces'))
+            constants.update(factor_dict.get('Constants'))
+            lists.update(factor_dict.get('Lists'))
+            curves.update(factor_dict.get('Curves'))
+            matrices.update(factor_dict.get('Matrices'))
+            surfaces.update(factor_dict.get('Surfaces'))
 
         # Crete the dictionary of risk factors
         risk_factors = {'Constants': constants, 'Lists': lists,
@@ -141,54 +185,191 @@ class Portfolio(object):
         # Return a dictionary of the risk factors
         return risk_factors
 
+    # -------------------------------------------------------------------------
+    # Index of the positions depending on each (container type, key) of
+    # market data (e.g. ('Curves', 'RiskFree-Gov-CAD')) built from the
+    # declared market risk factors of the products. It is cached until the
+    # positions change
+    # -------------------------------------------------------------------------
+    def get_factor_positions(self):
+        if self.factor_positions == None:
+            factor_positions = {}
+            for k in (self.positions).keys():
+                try:
+                    factor_dict = k.get_market_risk_factors()
+                    factor_dict['Constants'] = set(
+                        factor_dict.get('Constants')).union(
+                        self.get_FX_risk_factors(k))
+                except AttributeError:
+                    factor_positions.setdefault(None, []).append(k)
+                    continue
+                for container_type, keys in factor_dict.items():
+                    for key in keys:
+                        factor_positions.setdefault((container_type, key),
+                                                    []).append(k)
+            self.factor_positions = factor_positions
+        return self.factor_positions
+
+    def get_dependent_positions(self, container_type, key):
+        factor_positions = self.get_factor_positions()
+        return (factor_positions.get((container_type, key), []) +
+                factor_positions.get(None, []))
+
     # -------------------------------------------------------------------------
     # Method to value each of the underlying products. This implicilty uses
     # recursion to allow a portfolio to be built from sub portfolios
     # -------------------------------------------------------------------------
     def value_product(self, market_environment):
+        port_val = 0.0
+        for k in (self.positions).keys():
+            port_val += self.value_position(k, market_environment)
+
+        return port_val
+
+    def value_positions(self, market_environment):
+        position_vals = {}
+        for k in (self.positions).keys():
+            position_vals[k] = self.value_position(k, market_environment)
+
+        return position_vals
+
+    def value_position(self, product, market_environment,
+                       return_gradient=False):
 
         val_date = market_environment.get_val_date()
+        units = (self.positions)[product]
+
+        # Get the FX Rate
+        fx_rate = self.get_base_currency_conversion(product,
+                                                    market_environment)
+
+        # Set the temporary valuation date to the actual valuation date
+        val_date_temp = val_date
+
+        # If the product has an maturity date that is less than the
+        # (Simulated past the maturity date) then set the temporary
+        # valuation date to the maturity date
+        try:
+            mat_date = product.get_maturity_date()
+            if mat_date < val_date:
+                val_date_temp = mat_date
+        except:
+            pass
+
+        # If the product has an expiration date that is less than the
+        # (Simulated past the expiration date) then set the temporary
+        # valuation date to the expiration date
+        try:
+            exp_date = product.get_expiration_date()
+            if exp_date < val_date:
+                val_date_temp = exp_date
+        except:
+            pass
+
+        # Set the valuation date of the market environment to be the
+        # temporary valuation date to price the product and then set it
+        # back
+        market_environment.set_val_date(val_date_temp)
+        if return_gradient:
+            price_info = product.value_product(market_environment,
+                                               return_gradient=True)
+            price = price_info['value']
+        else:
+            price = product.value_product(market_environment)
+        market_environment.set_val_date(val_date)
+
+        # The value of the position
+        if not return_gradient:
+            return units * price * fx_rate
+
+        # If return_gradient is True a dictionary is returned with the
+        # 'value' and 'gradient' of the position, including the derivative
+        # with respect to the FX rate it was converted with
+        gradient = {}
+        for factor, derivative in price_info['gradient'].items():
+            gradient[factor] = units * derivative * fx_rate
+        prod_currency = product.get_currency()
+        if prod_currency != self.currency:
+            spot_str = 'FXRates-' + prod_currency + self.currency
+            if spot_str in (market_environment.constants).keys():
+                gradient['Constants-' + spot_str] = units * price
+            else:
+                spot_str = 'FXRates-' + self.currency + prod_currency
+                gradient['Constants-' + spot_str] = -units * price * (
+                        fx_rate ** 2)
 
-        port_val = 0.0
-        for k, v in (self.positions).items():
+        return {'value': units * price * fx_rate, 'gradient': gradient}
 
-            # Get the FX Rate
-            fx_rate = self.get_base_currency_conversion(k, market_environment)
+    # -------------------------------------------------------------------------
+    # Products returning the gradient of their value take a return_gradient
+    # argument in value_product
+    # -------------------------------------------------------------------------
+    def supports_gradient(self, product):
+        try:
+            parameters = inspect.signature(product.value_product).parameters
+        except (TypeError, ValueError):
+            return False
+        return 'return_gradient' in parameters
 
-            # Set the temporary valuation date to the actual valuation date
-            val_date_temp = val_date
+    # -------------------------------------------------------------------------
+    # The bonds of the portfolio priced by Bond.value_product (fixed rate and
+    # zero coupon bonds) are valued under all the states of a ScenarioEngine
+    # at once (see value_bond_book). Returns the bonds and the value of each
+    # position (Col) in each state (Rows)
+    # -------------------------------------------------------------------------
+    def value_bond_positions(self, engine, states, val_date=None):
+        bonds = [k for k in (self.positions).keys()
+                 if isinstance(k, Bond) and
+                 type(k).value_product is Bond.value_product]
+        values = value_bond_book(bonds, engine, states, val_date)
+        for kk, bond in enumerate(bonds):
+            values[:, kk] *= (self.positions)[bond] * \
+                self.get_base_currency_conversions(bond, engine, states)
 
-            # If the product has an maturity date that is less than the
-            # (Simulated past the maturity date) then set the temporary
-            # valuation date to the maturity date
-            try:
-                mat_date = k.get_maturity_date()
-                if mat_date < val_date:
-                    val_date_temp = mat_date
-            except:
-                pass
+        return bonds, values
 
-            # If the product has an expiration date that is less than the
-            # (Simulated past the expiration date) then set the temporary
-            # valuation date to the expiration date
-            try:
-                exp_date = k.get_expiration_date()
-                if exp_date < val_date:
-                    val_date_temp = exp_date
-            except:
-                pass
+    # -------------------------------------------------------------------------
+    # The equity options of the portfolio are valued under all the states of
+    # a ScenarioEngine at once (see value_option_book). Returns the options
+    # and the value of each position (Col) in each state (Rows)
+    # -------------------------------------------------------------------------
+    def value_option_positions(self, engine, states, val_date=None):
+        options = [k for k in (self.positions).keys()
+                   if isinstance(k, EquityOption)]
+        values = value_option_book(options, engine, states, val_date)
+        for kk, option in enumerate(options):
+            values[:, kk] *= (self.positions)[option] * \
+                self.get_base_currency_conversions(option, engine, states)
+
+        return options, values
 
-            # Set the valuation date of the market environment to be the
-            # temporary valuation date to price the product and then set it
-            # back
-            market_environment.set_val_date(val_date_temp)
-            price = k.value_product(market_environment)
-            market_environment.set_val_date(val_date)
+    # -------------------------------------------------------------------------
+    # The callable bonds of the portfolio are valued under all the states of
+    # a ScenarioEngine at once (see value_callable_bond_book). Returns the
+    # bonds and the value of each position (Col) in each state (Rows)
+    # -------------------------------------------------------------------------
+    def value_callable_bond_positions(self, engine, states, val_date=None):
+        bonds = [k for k in (self.positions).keys()
+                 if isinstance(k, CallableBond)]
+        values = value_callable_bond_book(bonds, engine, states, val_date)
+        for kk, bond in enumerate(bonds):
+            values[:, kk] *= (self.positions)[bond] * \
+                self.get_base_currency_conversions(bond, engine, states)
 
-            # Add the product value to the portfolio value
-            port_val += v * price * fx_rate
+        return bonds, values
 
-        return port_val
+    # -------------------------------------------------------------------------
+    # All the positions with a batch valuation (bonds, equity options and
+    # callable bonds) valued under all the states of a ScenarioEngine at once
+    # -------------------------------------------------------------------------
+    def value_batched_positions(self, engine, states, val_date=None):
+        bonds, bond_vals = self.value_bond_positions(engine, states, val_date)
+        options, option_vals = self.value_option_positions(engine, states,
+                                                           val_date)
+        callables, callable_vals = self.value_callable_bond_positions(
+            engine, states, val_date)
+        return (bonds + options + callables,
+                np.hstack([bond_vals, option_vals, callable_vals]))
 
     # -------------------------------------------------------------------------
     # A function used to return a portfolio of products that remove the nesting
@@ -197,6 +378,7 @@ class Portfolio(object):
     def remove_portfolio_nesting(self):
         flat_positions = self.get_flat_positions()
         self.positions = flat_positions
+        self.factor_positions = None
 
     # -------------------------------------------------------------------------
     # A function used to return the the product positions of a portfolio by
@@ -243,6 +425,33 @@ class Portfolio(object):
 
         return base_currency_conversion
 
+    # -------------------------------------------------------------------------
+    # The FX conversion rate of a product under each state of a ScenarioEngine
+    # -------------------------------------------------------------------------
+    def get_base_currency_conversions(self, product, engine, states):
+        prod_currency = product.get_currency()
+        port_currency = self.currency
+        if prod_currency == port_currency:
+            return 1.0
+
+        spot_str = 'FXRates-' + prod_currency + port_currency
+        if spot_str in (engine.get_mkt_env().constants).keys():
+            return engine.get_container_states(states, 'Constants', spot_str)
+        spot_str = 'FXRates-' + port_currency + prod_currency
+        return 1.0 / engine.get_container_states(states, 'Constants', spot_str)
+
+    # -------------------------------------------------------------------------
+    # The FX rates (either quotation) used to convert the product value to
+    # the currency of the portfolio
+    # -------------------------------------------------------------------------
+    def get_FX_risk_factors(self, product):
+        prod_currency = product.get_currency()
+        port_currency = self.currency
+        if prod_currency == port_currency:
+            return set([])
+        return set(['FXRates-' + prod_currency + port_currency,
+                    'FXRates-' + port_currency + prod_currency])
+
     # -------------------------------------------------------------------------
     # Print out a table describing the product and number of units
     # -------------------------------------------------------------------------
@@ -2,6 +2,11 @@
 # Product Object
 #
 
+# The most valuation dates a product keeps cashflow tables for. Beyond this
+# the tables are rebuilt (e.g. when valuing along a long simulated path)
+MAX_CACHED_CASHFLOW_TABLES = 64
+
+
 class Product(object):
     '''
     Product(Object)
@@ -29,6 +34,9 @@ class Product(object):
         returns the country of the product
     set_country :
         sets the country of the product
+    get_cached_cashflow_table :
+        returns the cashflow table of the product at a valuation date,
+        built once per set of contract terms
     get_FX_rate :
         returns the FX rate of the product
     to_string :
@@ -48,6 +56,11 @@ class Product(object):
         else:
             self.country = 'N/A'
 
+        # Cashflow tables by valuation date and the contract terms they were
+        # built from (see get_cached_cashflow_table)
+        self._cashflow_terms = None
+        self._cashflow_tables = {}
+
     # -------------------------------------------------------------------------
     # Basic Getter and Setter Methods for the product attributes
     # -------------------------------------------------------------------------
@@ -66,6 +79,24 @@ class Product(object):
     def set_country(self, new_country):
         self.country = new_country
 
+    # -------------------------------------------------------------------------
+    # Cashflow table of a product with a fixed schedule (e.g. the table of a
+    # bond from finModels.coupon_cashflow_table) at a valuation date. The
+    # tables are built by build_table once per valuation date and kept until
+    # the contract terms they were built from change, so the setters of the
+    # products do not need to know about the cache. The tables are read-only
+    # and shared by every valuation at the date
+    # -------------------------------------------------------------------------
+    def get_cached_cashflow_table(self, val_date, terms, build_table):
+        if self._cashflow_terms != terms:
+            self._cashflow_terms = terms
+            self._cashflow_tables = {}
+        if val_date not in self._cashflow_tables:
+            if len(self._cashflow_tables) >= MAX_CACHED_CASHFLOW_TABLES:
+                self._cashflow_tables.clear()
+            self._cashflow_tables[val_date] = build_table(val_date)
+        return self._cashflow_tables[val_date]
+
     #    # -------------------------------------------------------------------------
     #    # Method to return the exposure of the stock
     #    # -------------------------------------------------------------------------
@@ -124,6 +155,20 @@ class Product(object):
         print(bar)
 
 
+# -----------------------------------------------------------------------------
+# Helper function used by the products that return the gradient of their
+# value. Adds the derivatives with respect to the nodes of a piece of market
+# data (e.g. the key rates of 'Curves-RiskFree-Gov-CAD') to a dictionary of
+# risk factor name : derivative
+# -----------------------------------------------------------------------------
+def add_factor_gradient(gradient, factor_prefix, labels, node_gradient):
+    for label, node_derivative in zip(labels, node_gradient):
+        factor_name = factor_prefix + '-' + str(label)
+        gradient[factor_name] = gradient.get(factor_name, 0.0) + float(
+            node_derivative)
+    return gradient
+
+
 # -----------------------------------------------------------------------------
 # Testing
 # -----------------------------------------------------------------------------
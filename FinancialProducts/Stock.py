@@ -176,7 +176,7 @@ class Stock(Product):
         # Add the risk factors to the correct sets
 
         # Stock price
-        constants.add(self.ID)
+        constants.add('MarketPrice-' + self.ID)
 
         # Crete the dictionary of risk factors
         risk_factors = {'Constants': constants, 'Lists': lists,
@@ -203,10 +203,15 @@ class Stock(Product):
         return risk_factors
 
     # -------------------------------------------------------------------------
-    # Method to value the underlying product
+    # Method to value the underlying product (and optionally its gradient
+    # with respect to the risk factors)
     # -------------------------------------------------------------------------
-    def value_product(self, market_environment):
-        return market_environment.get_constant('MarketPrice-' + self.ID)
+    def value_product(self, market_environment, return_gradient=False):
+        price = market_environment.get_constant('MarketPrice-' + self.ID)
+        if not return_gradient:
+            return price
+        return {'value': price, 'gradient': {'Constants-MarketPrice-' +
+                                             self.ID: 1.0}}
 
     # -------------------------------------------------------------------------
     # print(out a table describing the product
@@ -26,6 +26,14 @@ num_bins = 20
 scenario_horizon_mkt = sim_delta_t * 252
 VaR_horizon_mkt = 10
 
+# Specify the root seed of the market and credit simulations so that a run
+# can be reproduced exactly (None uses the global numpy random state)
+sim_seed = 20170601
+
+# Specify the number of market scenarios generated and valued at a time, which
+# bounds the memory used by the simulations
+sim_block_size = 1000
+
 # Specify the parameters for credit VaR
 rho = 0.2
 stressed_rho = 0.9
@@ -315,74 +323,62 @@ leverage_val = (tot_val_long - tot_val_short) / (tot_val_long + tot_val_short)
 # Market VaR Calculation for all Sub-portfolios
 # -----------------------------------------------------------------------------
 
-# Generate Scenarios
+# Generate Scenarios. The scenarios are streamed in blocks and never stored,
+# and since the streams are seeded every pass over them gives the same
+# scenarios
 print('Generating Market Risk Scenarios..')
-scenarios = finRisk.SimulationEngine(corr_mat, factor_vol, num_sims_mkt,
-                                     sim_delta_t)
-
-# Convert Scenarios to Market Environment
-print('Converting Scenarios to Market Environments..')
-mkt_env_dist = finRisk.generate_mkt_env_distribution(scenarios, mkt_env)
-
-# Generate PnL Distributions and Calculate Market VaR and ES
-print('Generating Market Risk Total Portfolio Distribution..')
-tot_mkt_PnL_dist = finRisk.generate_PnL_distribution_from_mkt_envs(tot_port,
-                                                                   mkt_env_dist,
-                                                                   mkt_env)
+
+
+def market_scenario_blocks():
+    return finScenarios.simulation_engine_blocks(corr_mat, factor_vol,
+                                                 num_sims_mkt, sim_delta_t,
+                                                 block_size=sim_block_size,
+                                                 seed=sim_seed)
+
+
+# Generate PnL Distributions of all the sub-portfolios in a single pass over
+# the scenarios (block by block) without storing the market environments
+print('Generating Market Risk Portfolio Distributions..')
+mkt_PnL_dists = finRisk.generate_PnL_distributions_from_blocks(
+    {'Total': tot_port, 'Equity': equity_port, 'FI': FI_port, 'EO': eo_port,
+     'CDS': CDS_port, 'CAD': CAD_port, 'USD': USD_port, 'EUR': EUR_port},
+    market_scenario_blocks(), mkt_env)
+
+# Calculate Market VaR and ES
+tot_mkt_PnL_dist = mkt_PnL_dists['Total']
 tot_mkt_VaR, tot_mkt_ES = finRisk.calculate_VaR_from_PnL(tot_mkt_PnL_dist,
                                                          alpha_mkt)
 
 tot_mkt_mean = np.mean(tot_mkt_PnL_dist)
 tot_mkt_vol = np.std(tot_mkt_PnL_dist)
 
-print('Generating Market Risk Equity Portfolio Distribution..')
-equity_mkt_PnL_dist = finRisk.generate_PnL_distribution_from_mkt_envs(
-    equity_port, mkt_env_dist, mkt_env)
+equity_mkt_PnL_dist = mkt_PnL_dists['Equity']
 equity_mkt_VaR, equity_mkt_ES = finRisk.calculate_VaR_from_PnL(
     equity_mkt_PnL_dist, alpha_mkt)
 
-print('Generating Market Risk Fixed Income Portfolio Distribution..')
-FI_mkt_PnL_dist = finRisk.generate_PnL_distribution_from_mkt_envs(FI_port,
-                                                                  mkt_env_dist,
-                                                                  mkt_env)
+FI_mkt_PnL_dist = mkt_PnL_dists['FI']
 FI_mkt_VaR, FI_mkt_ES = finRisk.calculate_VaR_from_PnL(FI_mkt_PnL_dist,
                                                        alpha_mkt)
 
-print('Generating Market Risk Equity Option Portfolio Distribution..')
-eo_mkt_PnL_dist = finRisk.generate_PnL_distribution_from_mkt_envs(eo_port,
-                                                                  mkt_env_dist,
-                                                                  mkt_env)
+eo_mkt_PnL_dist = mkt_PnL_dists['EO']
 eo_mkt_VaR, eo_mkt_ES = finRisk.calculate_VaR_from_PnL(eo_mkt_PnL_dist,
                                                        alpha_mkt)
 
-print('Generating Market Risk CDS Portfolio Distribution..')
-CDS_mkt_PnL_dist = finRisk.generate_PnL_distribution_from_mkt_envs(CDS_port,
-                                                                   mkt_env_dist,
-                                                                   mkt_env)
+CDS_mkt_PnL_dist = mkt_PnL_dists['CDS']
 CDS_mkt_VaR, CDS_mkt_ES = finRisk.calculate_VaR_from_PnL(CDS_mkt_PnL_dist,
                                                          alpha_mkt)
 
-print('Generating Market Risk CAD Portfolio Distribution..')
-CAD_mkt_PnL_dist = finRisk.generate_PnL_distribution_from_mkt_envs(CAD_port,
-                                                                   mkt_env_dist,
-                                                                   mkt_env)
+CAD_mkt_PnL_dist = mkt_PnL_dists['CAD']
 CAD_mkt_VaR, CAD_mkt_ES = finRisk.calculate_VaR_from_PnL(CAD_mkt_PnL_dist,
                                                          alpha_mkt)
 
-print('Generating Market Risk USD Portfolio Distribution..')
-USD_mkt_PnL_dist = finRisk.generate_PnL_distribution_from_mkt_envs(USD_port,
-                                                                   mkt_env_dist,
-                                                                   mkt_env)
+USD_mkt_PnL_dist = mkt_PnL_dists['USD']
 USD_mkt_VaR, USD_mkt_ES = finRisk.calculate_VaR_from_PnL(USD_mkt_PnL_dist,
                                                          alpha_mkt)
 
-print('Generating Market Risk EUR Portfolio Distribution..')
-EUR_mkt_PnL_dist = finRisk.generate_PnL_distribution_from_mkt_envs(EUR_port,
-                                                                   mkt_env_dist,
-                                                                   mkt_env)
+EUR_mkt_PnL_dist = mkt_PnL_dists['EUR']
 EUR_mkt_VaR, EUR_mkt_ES = finRisk.calculate_VaR_from_PnL(EUR_mkt_PnL_dist,
                                                          alpha_mkt)
-
 # -----------------------------------------------------------------------------
 # Marginal Market VaR of the portfolio and sub-portfolios
 # -----------------------------------------------------------------------------
@@ -425,19 +421,20 @@ tot_RC_curr, tot_MVaR_curr = finRisk.marginal_VaR_from_sub_dists(
 # Calculate Marginal VaR of each sub portfolio with respect to the underlying
 # assets
 print('Equity Portfolio Marginal VaR..')
-equity_RC, equity_MVaR = finRisk.marginal_VaR_from_total_port(equity_port,
-                                                              mkt_env,
-                                                              scenarios,
-                                                              alpha_mkt)
+equity_RC, equity_MVaR = finRisk.marginal_VaR_from_blocks(
+    equity_port, mkt_env, market_scenario_blocks(), alpha_mkt)
 print('Fixed Income Portfolio Marginal VaR..')
-FI_RC, FI_MVaR = finRisk.marginal_VaR_from_total_port(FI_port, mkt_env,
-                                                      scenarios, alpha_mkt)
+FI_RC, FI_MVaR = finRisk.marginal_VaR_from_blocks(FI_port, mkt_env,
+                                                  market_scenario_blocks(),
+                                                  alpha_mkt)
 print('Equity Option Portfolio Marginal VaR..')
-eo_RC, eo_MVaR = finRisk.marginal_VaR_from_total_port(eo_port, mkt_env,
-                                                      scenarios, alpha_mkt)
+eo_RC, eo_MVaR = finRisk.marginal_VaR_from_blocks(eo_port, mkt_env,
+                                                  market_scenario_blocks(),
+                                                  alpha_mkt)
 print('CDS Portfolio Marginal VaR..')
-CDS_RC, CDS_MVaR = finRisk.marginal_VaR_from_total_port(CDS_port, mkt_env,
-                                                        scenarios, alpha_mkt)
+CDS_RC, CDS_MVaR = finRisk.marginal_VaR_from_blocks(CDS_port, mkt_env,
+                                                    market_scenario_blocks(),
+                                                    alpha_mkt)
 
 # -----------------------------------------------------------------------------
 # Plot the Market VaR Distribution of the Portfolios
@@ -482,7 +479,8 @@ finRisk.plot_market_VaR_dist(EUR_mkt_PnL_dist, EUR_port, mkt_env,
 # Generate PnL Distributions and Calculate Credit VaR and ES
 print('Generating Credit Risk Total Portfolio Distribution..')
 tot_cred_PnL_dists = finRisk.generate_credit_VaR_distrubtion(tot_port, mkt_env,
-                                                             num_sims_crd, rho)
+                                                             num_sims_crd, rho,
+                                                             seed=sim_seed)
 tot_cred_PnL_dist = tot_cred_PnL_dists[0]
 tot_mig_PnL_dist = tot_cred_PnL_dists[1]
 tot_dflt_PnL_dist = tot_cred_PnL_dists[2]
@@ -507,7 +505,8 @@ print('Generating Stressed Credit Risk Total Portfolio Distribution..')
 tot_stressed_cred_PnL_dists = finRisk.generate_credit_VaR_distrubtion(tot_port,
                                                                       mkt_env,
                                                                       num_sims_crd,
-                                                                      stressed_rho)
+                                                                      stressed_rho,
+                                                                      seed=sim_seed)
 tot_stressed_cred_PnL_dist = tot_stressed_cred_PnL_dists[0]
 tot_stressed_mig_PnL_dist = tot_stressed_cred_PnL_dists[1]
 tot_stressed_dflt_PnL_dist = tot_stressed_cred_PnL_dists[2]
@@ -560,12 +559,13 @@ sensitivities_tot = pd.DataFrame.from_dict(sensitivities_tot)
 # Historic Stressed VaR
 # -----------------------------------------------------------------------------
 print('Generating Distribution for Market Stressed VaR..')
-stressed_scenarios = finScenarios.housing_bubble_scenerios()
-stressed_tot_PnL_dist = finRisk.generate_PnL_distribution(tot_port,
-                                                          stressed_scenarios,
-                                                          mkt_env)
-tot_SVaR, tot_SES = finRisk.calculate_VaR_from_PnL(stressed_tot_PnL_dist,
-                                                   alpha_mkt)
+# The historic P&L is generated once and the stressed period is the 250 day
+# window with the worst VaR
+hist_tot_PnL = finRisk.generate_historic_PnL_series(tot_port, mkt_env,
+                                                    end_date=val_date)
+tot_SVaR, tot_SES, SVaR_start, SVaR_end = finRisk.find_stressed_VaR_window(
+    hist_tot_PnL, alpha_mkt, 250)
+stressed_tot_PnL_dist = hist_tot_PnL[SVaR_start:SVaR_end].values
 finRisk.plot_market_VaR_dist(stressed_tot_PnL_dist, tot_port, mkt_env,
                              scenario_horizon_mkt, VaR_horizon_mkt, alpha_mkt,
                              num_bins, 'Total Stressed')
@@ -574,24 +574,25 @@ finRisk.plot_market_VaR_dist(stressed_tot_PnL_dist, tot_port, mkt_env,
 # Scenario Analysis
 # -----------------------------------------------------------------------------
 print('Generating Stress Scenarios..')
-# Adverse Scenario
-mkt_env_Adverse_Scenario = finScenarios.generate_adverse_scenario(mkt_env)
-SVaR_Adverse_Scenario = tot_port.value_product(
-    mkt_env_Adverse_Scenario) - tot_port.value_product(mkt_env)
-
-# FS_Vulnerability Scenario
-mkt_env_FS_Vulnerability_Scenario = finScenarios.generate_vulnerability_stress_scenario(
-    mkt_env)
-SVaR_FS_Vulnerability_Scenario = tot_port.value_product(
-    mkt_env_FS_Vulnerability_Scenario) - tot_port.value_product(mkt_env)
+# Adverse and FS Vulnerability Scenarios are revalued in one batch
+stress_scenarios = [finScenarios.ADVERSE_SCENARIO,
+                    finScenarios.VULNERABILITY_STRESS_SCENARIO]
+stress_PnL = finScenarios.generate_stress_PnL({'Total': tot_port}, mkt_env,
+                                              stress_scenarios)
+SVaR_Adverse_Scenario = stress_PnL.loc['Adverse_Scenario', 'Total']
+SVaR_FS_Vulnerability_Scenario = stress_PnL.loc['FS_Vulnerability_Scenario',
+                                                'Total']
 
 # -----------------------------------------------------------------------------
 # Regulatory Capital
 # -----------------------------------------------------------------------------
 print('Calculating Total Regulatory Capital..')
 tot_val = tot_port.value_product(mkt_env)
-breachs = finRisk.backtest_VaR_from_historic(tot_port, mkt_env, tot_mkt_VaR,
-                                             252, val_date)
+# Backtest the VaR re-estimated on each of the last 250 days from the
+# historic P&L already generated for the stressed VaR
+tot_backtest, tot_backtest_summary = finRisk.backtest_rolling_VaR(
+    hist_tot_PnL, alpha_mkt, 250)
+breachs = tot_backtest_summary['Breaches']
 adj_factor = finRisk.calculate_capital_factor(breachs)
 MarketRiskCapital = finRisk.calculate_market_risk_capital(tot_mkt_VaR,
                                                           SVaR_Adverse_Scenario,
@@ -4,6 +4,9 @@
 #
 
 import datetime as dt
+import numpy as np
+import pandas as pd
+from RiskFactorIndex import RiskFactorIndex
 
 
 class MarketEnvironment(object):
@@ -30,6 +33,8 @@ class MarketEnvironment(object):
         (e.g. Transition Matrix)
     surfaces : dict (Str:(pandas dataframe))
         dictionary of surfaces for the market environment (e.g. Vol Surface)
+    risk_factor_index : RiskFactorIndex object
+        parsed names of the risk factors (built when first needed)
 
     Methods
     =======
@@ -59,6 +64,12 @@ class MarketEnvironment(object):
         gets a market surface (e.g. volatility surface)
     add_surface :
         adds a market surface
+    get_risk_factor_index :
+        gets the index of the risk factors in RiskFactorVolatilities
+    get_factor_values :
+        gets the values at given positions of a container
+    set_factor_values :
+        sets the values at given positions of a container
 
     update_environment :
         updates the entire market environment
@@ -74,6 +85,7 @@ class MarketEnvironment(object):
         self.curves = {}
         self.matrices = {}
         self.surfaces = {}
+        self.risk_factor_index = None
 
         # if the valuation date is not given assume it is today
         if val_date != None:
@@ -123,6 +135,38 @@ class MarketEnvironment(object):
     def add_surface(self, key, surface):
         self.surfaces[key] = surface
 
+    # -------------------------------------------------------------------------
+    # The index of the risk factors is built once from RiskFactorVolatilities
+    # and shared with the environments initialized from this one (their
+    # containers keep the same labels). It is rebuilt if the list of risk
+    # factors is replaced
+    # -------------------------------------------------------------------------
+    def get_risk_factor_index(self):
+        factor_vol = (self.lists).get('RiskFactorVolatilities')
+        if (self.risk_factor_index == None or
+                self.risk_factor_index.get_source() is not factor_vol):
+            self.risk_factor_index = RiskFactorIndex(self)
+        return self.risk_factor_index
+
+    # -------------------------------------------------------------------------
+    # Read or write individual risk factors of a container (e.g. 'Curves')
+    # by their (row, column) positions. A new container is stored when
+    # values are set so environments sharing the old one are not affected
+    # -------------------------------------------------------------------------
+    def get_factor_values(self, stype, key, rows, cols):
+        if stype == 'Constants':
+            return np.array([self.get_constant(key)], float)
+        data = getattr(self, CONTAINER_ATTRIBUTES[stype])[key]
+        return np.asarray(data.values, float)[rows, cols]
+
+    def set_factor_values(self, stype, key, rows, cols, values):
+        if stype == 'Constants':
+            self.add_constant(key, np.ravel(values)[-1])
+            return
+        containers = getattr(self, CONTAINER_ATTRIBUTES[stype])
+        containers[key] = set_container_values(containers[key], rows, cols,
+                                               values)
+
     # -------------------------------------------------------------------------
     # Initialize a new empty environment from an existing environment
     # -------------------------------------------------------------------------
@@ -132,6 +176,20 @@ class MarketEnvironment(object):
         self.curves = (new_mkt_env.curves).copy()
         self.matrices = (new_mkt_env.matrices).copy()
         self.surfaces = (new_mkt_env.surfaces).copy()
+        self.risk_factor_index = getattr(new_mkt_env, 'risk_factor_index',
+                                         None)
+
+
+# Attribute of the market environment holding each type of container
+CONTAINER_ATTRIBUTES = {'Lists': 'lists', 'Curves': 'curves',
+                        'Matrices': 'matrices', 'Surfaces': 'surfaces'}
+
+
+def set_container_values(data, rows, cols, values):
+    # Returns a copy of the container with the values at (rows, cols) set
+    new_values = np.array(data.values, float)
+    new_values[rows, cols] = values
+    return pd.DataFrame(new_values, index=data.index, columns=data.columns)
 
 
 # -----------------------------------------------------------------------------
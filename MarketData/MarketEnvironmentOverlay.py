@@ -0,0 +1,246 @@
+#
+# Copy-on-write view of a market environment
+#
+
+from collections import ChainMap
+import numpy as np
+from MarketEnvironment import (MarketEnvironment, CONTAINER_ATTRIBUTES,
+                               set_container_values)
+
+
+class MarketEnvironmentOverlay(MarketEnvironment):
+    '''
+    MarketEnvironmentOverlay(MarketEnvironment)
+
+    Class for a market environment that only stores the market data that
+    differs from a base environment. Every lookup is resolved through the
+    overlay first and then the base environment, which must not be modified
+    while overlays of it are in use. Individual risk factors set with
+    set_factor_values are held as single values and a shocked container is
+    only built the first time it is read, so the memory of a scenario is
+    proportional to the number of shocked risk factors. An overlay of an
+    overlay shares the same base environment (the layers are never nested).
+
+    Attributes
+    ==========
+    base_env : market_environment object
+        the base environment the overlay is resolved against
+    factor_overrides : dict ((str, str):dict ((int, int):double))
+        the overridden values of each container (e.g. ('Curves', 'OIS')) by
+        (row, column) position, that have not been built into a container
+
+    Methods
+    =======
+    get_base_env :
+        returns the base environment of the overlay
+    get_num_overrides :
+        returns the number of overridden market data entries
+    initialize_from_env :
+        resolves the overlay against a market environment (copying the
+        overrides of an overlay)
+    get_risk_factor_index :
+        gets the index of the risk factors (shared with the base environment)
+    get_factor_values :
+        gets the values at given positions of a container
+    set_factor_values :
+        sets the values at given positions of a container
+    to_mkt_env :
+        returns a stand-alone market environment with the overlay applied
+    '''
+
+    # -------------------------------------------------------------------------
+    # Object Definition
+    # -------------------------------------------------------------------------
+    def __init__(self, mkt_env, ID=None, val_date=None):
+        if ID == None:
+            ID = mkt_env.get_ID()
+        if val_date == None:
+            val_date = mkt_env.get_val_date()
+        MarketEnvironment.__init__(self, ID, val_date)
+        self.initialize_from_env(mkt_env)
+
+    # -------------------------------------------------------------------------
+    # Resolve the overlay against a market environment. Overlays of overlays
+    # copy the (small) layer of overrides, including the inner dictionaries
+    # of the risk factor overrides so that shocking one overlay never
+    # changes the other, and keep the same base
+    # -------------------------------------------------------------------------
+    def initialize_from_env(self, new_mkt_env):
+        if isinstance(new_mkt_env, MarketEnvironmentOverlay):
+            self.base_env = new_mkt_env.base_env
+            self.factor_overrides = dict(
+                (container_id, dict(overrides)) for container_id, overrides
+                in new_mkt_env.factor_overrides.items())
+            layers = dict((attr, getattr(new_mkt_env, attr).maps[0])
+                          for attr in ['constants'] +
+                          list(CONTAINER_ATTRIBUTES.values()))
+        else:
+            self.base_env = new_mkt_env
+            self.factor_overrides = {}
+            layers = {}
+
+        self.constants = ChainMap(dict(layers.get('constants', {})),
+                                  self.base_env.constants)
+        for stype, attr in CONTAINER_ATTRIBUTES.items():
+            layer = _OverlayLayer(self, stype)
+            layer.update(layers.get(attr, {}))
+            setattr(self, attr,
+                    ChainMap(layer, getattr(self.base_env, attr)))
+
+        self.risk_factor_index = getattr(new_mkt_env, 'risk_factor_index',
+                                         None)
+
+    # -------------------------------------------------------------------------
+    # A copy is an overlay of this overlay, so it has its own overrides
+    # -------------------------------------------------------------------------
+    def __copy__(self):
+        return MarketEnvironmentOverlay(self, self.ID, self.val_date)
+
+    # -------------------------------------------------------------------------
+    # Basic getter functions
+    # -------------------------------------------------------------------------
+    def get_base_env(self):
+        return self.base_env
+
+    def get_num_overrides(self):
+        num_overrides = len(self.constants.maps[0])
+        for attr in CONTAINER_ATTRIBUTES.values():
+            num_overrides += len(getattr(self, attr).maps[0])
+        for overrides in self.factor_overrides.values():
+            num_overrides += len(overrides)
+        return num_overrides
+
+    # -------------------------------------------------------------------------
+    # The index of the risk factors of the base environment is used unless
+    # the overlay replaces the list of risk factors
+    # -------------------------------------------------------------------------
+    def get_risk_factor_index(self):
+        factor_vol = (self.lists).get('RiskFactorVolatilities')
+        if factor_vol is (self.base_env.lists).get('RiskFactorVolatilities'):
+            self.risk_factor_index = self.base_env.get_risk_factor_index()
+        return MarketEnvironment.get_risk_factor_index(self)
+
+    # -------------------------------------------------------------------------
+    # Risk factors are read from the overrides without building the shocked
+    # container. Setting a risk factor of a container that has not been
+    # built only records the new values
+    # -------------------------------------------------------------------------
+    def get_factor_values(self, stype, key, rows, cols):
+        if stype == 'Constants':
+            return np.array([self.get_constant(key)], float)
+
+        overrides = self.factor_overrides.get((stype, key))
+        if overrides == None:
+            return MarketEnvironment.get_factor_values(self, stype, key,
+                                                       rows, cols)
+
+        data = self._get_source_container(stype, key)
+        values = np.asarray(data.values, float)[rows, cols]
+        for ii, position in enumerate(zip(rows, cols)):
+            if position in overrides:
+                values[ii] = overrides[position]
+        return values
+
+    def set_factor_values(self, stype, key, rows, cols, values):
+        if stype == 'Constants':
+            self.add_constant(key, np.ravel(values)[-1])
+            return
+
+        layer = getattr(self, CONTAINER_ATTRIBUTES[stype]).maps[0]
+        if dict.__contains__(layer, key):
+            # The container was already built, so replace it with a copy
+            dict.__setitem__(layer, key, set_container_values(
+                layer[key], rows, cols, values))
+            return
+
+        overrides = self.factor_overrides.setdefault((stype, key), {})
+        for row, col, value in zip(rows, cols, np.ravel(values)):
+            overrides[(int(row), int(col))] = float(value)
+
+    # -------------------------------------------------------------------------
+    # Build a stand-alone environment (e.g. to keep after the base changes)
+    # -------------------------------------------------------------------------
+    def to_mkt_env(self):
+        mkt_env = MarketEnvironment(self.ID, self.val_date)
+        mkt_env.constants = dict(self.constants)
+        for attr in CONTAINER_ATTRIBUTES.values():
+            setattr(mkt_env, attr, dict(getattr(self, attr)))
+        mkt_env.risk_factor_index = self.risk_factor_index
+        return mkt_env
+
+    # -------------------------------------------------------------------------
+    # Build the shocked container from the overridden values
+    # -------------------------------------------------------------------------
+    def _get_source_container(self, stype, key):
+        return getattr(self.base_env, CONTAINER_ATTRIBUTES[stype])[key]
+
+    def _build_container(self, stype, key):
+        overrides = self.factor_overrides.pop((stype, key))
+        positions = list(overrides.keys())
+        rows = np.array([position[0] for position in positions], int)
+        cols = np.array([position[1] for position in positions], int)
+        values = np.array([overrides[position] for position in positions],
+                          float)
+        return set_container_values(self._get_source_container(stype, key),
+                                    rows, cols, values)
+
+
+class _OverlayLayer(dict):
+    # Top layer of the containers of an overlay. A container with
+    # overridden risk factors is built when it is first read and replacing
+    # a container discards its overridden risk factors
+    def __init__(self, overlay, stype):
+        dict.__init__(self)
+        self.overlay = overlay
+        self.stype = stype
+
+    def __missing__(self, key):
+        if (self.stype, key) not in self.overlay.factor_overrides:
+            raise KeyError(key)
+        data = self.overlay._build_container(self.stype, key)
+        dict.__setitem__(self, key, data)
+        return data
+
+    def __contains__(self, key):
+        return (dict.__contains__(self, key) or
+                (self.stype, key) in self.overlay.factor_overrides)
+
+    def __setitem__(self, key, value):
+        self.overlay.factor_overrides.pop((self.stype, key), None)
+        dict.__setitem__(self, key, value)
+
+    def update(self, other):
+        for key, value in other.items():
+            dict.__setitem__(self, key, value)
+
+
+# -----------------------------------------------------------------------------
+# Testing
+# -----------------------------------------------------------------------------
+if __name__ == '__main__':
+    import copy
+    import datetime as dt
+    import pandas as pd
+
+    print('\nTesting MarketEnvironmentOverlay.py...')
+    base_env = MarketEnvironment('Base', dt.datetime(2017, 6, 1))
+    base_env.add_curve('OIS', pd.DataFrame([[0.01, 0.015, 0.02]],
+                                           columns=['1', '5', '10']))
+
+    # Shocking an overlay of an overlay (however it was created) must leave
+    # the parent overlay unchanged
+    parent_env = MarketEnvironmentOverlay(base_env, 'Parent')
+    parent_env.set_factor_values('Curves', 'OIS', [0], [1], [0.03])
+    reinitialized_env = MarketEnvironmentOverlay(base_env, 'Reinitialized')
+    reinitialized_env.initialize_from_env(parent_env)
+    child_envs = {'overlay': MarketEnvironmentOverlay(parent_env, 'Child'),
+                  'copy': copy.copy(parent_env),
+                  'initialize_from_env': reinitialized_env}
+    for name, child_env in child_envs.items():
+        assert child_env.get_curve('OIS').iloc[0, 1] == 0.03
+        child_env.set_factor_values('Curves', 'OIS', [0, 0], [1, 2],
+                                    [0.04, 0.05])
+        assert list(child_env.get_curve('OIS').iloc[0]) == [0.01, 0.04, 0.05]
+        assert list(parent_env.get_curve('OIS').iloc[0]) == [0.01, 0.03, 0.02]
+        assert base_env.get_curve('OIS').iloc[0, 1] == 0.015
+        print('Child from ' + name + ' shocked, parent unchanged')
@@ -0,0 +1,225 @@
+#
+# Risk Factor Index Object
+#
+
+import numpy as np
+
+
+class RiskFactorIndex(object):
+    '''
+    RiskFactorIndex(object)
+
+    Class holding the parsed risk factor names of a market environment (e.g.
+    "Curves-RiskFree-CDOR-CAD-0.25"). Each name is split once into its
+    container type, container key and row/column labels, the labels are
+    resolved to positions in the container and the factor is given an
+    integer slot, so that scenario code never needs to parse the names.
+
+    Attributes
+    ==========
+    factor_names : list of str
+        the risk factors in slot order
+    factors : dict (str:tuple)
+        (container type, key, row label, column label, row position,
+        column position) of each risk factor
+    slots : dict (str:int)
+        the slot of each risk factor
+    prefixes : dict (str:list of int)
+        the slots of the factors starting with each prefix of whole tokens
+        (e.g. "Matrices-CreditSpreads-Ratings")
+    source : pandas dataframe
+        the list of risk factors the index was built from
+
+    Methods
+    =======
+    get_factor_names :
+        returns the risk factors in slot order
+    get_num_factors :
+        returns the number of risk factors
+    get_source :
+        returns the list of risk factors the index was built from
+    has_factor :
+        returns True if the risk factor has a slot in the index
+    get_slot :
+        returns the slot of a risk factor
+    get_factor :
+        returns the parsed description of a risk factor
+    get_container_type :
+        returns the container type of a risk factor
+    get_key :
+        returns the key of the container of a risk factor
+    get_position :
+        returns the (row, column) position of a risk factor in its container
+    get_slots_with_prefix :
+        returns the slots of the risk factors starting with a prefix
+    get_factors_with_prefix :
+        returns the risk factors starting with a prefix
+    group_by_container :
+        groups risk factors by the container they belong to
+    '''
+
+    # -------------------------------------------------------------------------
+    # Object Definition
+    # -------------------------------------------------------------------------
+    def __init__(self, mkt_env, factor_names=None):
+        self.mkt_env = mkt_env
+        self.source = None
+
+        # Default to the risk factors of the market environment (if it has
+        # any)
+        if factor_names is None:
+            self.source = (mkt_env.lists).get('RiskFactorVolatilities')
+            factor_names = [] if self.source is None else list(self.source)
+        self.factor_names = list(factor_names)
+
+        self.factors = {}
+        self.slots = {}
+        self.prefixes = {}
+        for slot, name in enumerate(self.factor_names):
+            self.slots[name] = slot
+            self.factors[name] = _resolve_factor(mkt_env, name)
+
+            # Record every prefix of whole tokens of the name
+            tokens = name.split('-')
+            for ii in range(1, len(tokens) + 1):
+                prefix = '-'.join(tokens[:ii])
+                if prefix not in self.prefixes:
+                    self.prefixes[prefix] = []
+                self.prefixes[prefix].append(slot)
+
+    # -------------------------------------------------------------------------
+    # Basic getter functions
+    # -------------------------------------------------------------------------
+    def get_factor_names(self):
+        return self.factor_names
+
+    def get_num_factors(self):
+        return len(self.factor_names)
+
+    def get_source(self):
+        return self.source
+
+    def has_factor(self, factor_name):
+        return factor_name in self.slots
+
+    def get_slot(self, factor_name):
+        return self.slots[factor_name]
+
+    # -------------------------------------------------------------------------
+    # Return the parsed description of a risk factor. Factors that are not in
+    # the index (e.g. a one-off shock) are parsed once and remembered
+    # -------------------------------------------------------------------------
+    def get_factor(self, factor_name):
+        if factor_name not in self.factors:
+            self.factors[factor_name] = _resolve_factor(self.mkt_env,
+                                                        factor_name)
+        return self.factors[factor_name]
+
+    def get_container_type(self, factor_name):
+        return self.get_factor(factor_name)[0]
+
+    def get_key(self, factor_name):
+        return self.get_factor(factor_name)[1]
+
+    def get_position(self, factor_name):
+        factor = self.get_factor(factor_name)
+        return factor[4], factor[5]
+
+    # -------------------------------------------------------------------------
+    # Prefix queries on whole tokens of the names, e.g. the prefix
+    # "Matrices-CreditSpreads-Ratings" gives all the credit spread factors
+    # -------------------------------------------------------------------------
+    def get_slots_with_prefix(self, prefix):
+        return list(self.prefixes.get(prefix, []))
+
+    def get_factors_with_prefix(self, prefix):
+        return [self.factor_names[slot] for slot in
+                self.prefixes.get(prefix, [])]
+
+    # -------------------------------------------------------------------------
+    # Group risk factors by their container. Returns a dictionary of
+    # (container type, key) : (positions in factor_names, row positions,
+    # column positions) so a container can be updated in a single step
+    # -------------------------------------------------------------------------
+    def group_by_container(self, factor_names):
+        groups = {}
+        for ii, name in enumerate(factor_names):
+            stype, skey, _, _, row, col = self.get_factor(name)
+            container_id = (stype, skey)
+            if container_id not in groups:
+                groups[container_id] = ([], [], [])
+            groups[container_id][0].append(ii)
+            groups[container_id][1].append(row)
+            groups[container_id][2].append(col)
+
+        for container_id, group in groups.items():
+            if container_id[0] == 'Constants':
+                groups[container_id] = (np.asarray(group[0], int), None, None)
+            else:
+                groups[container_id] = tuple(np.asarray(x, int)
+                                             for x in group)
+
+        return groups
+
+
+# -----------------------------------------------------------------------------
+# Helper functions used to parse a risk factor name and locate it in the
+# market environment
+# -----------------------------------------------------------------------------
+def parse_factor_name(name):
+    # for example, name = Curves-RiskFree-CDOR-CAD-0.25 gives
+    # ('Curves', 'RiskFree-CDOR-CAD', None, '0.25')
+    ss = name.split('-')
+    stype = ss[0]
+    if stype in ('Curves', 'Lists'):
+        return stype, '-'.join(ss[1:-1]), None, ss[-1]
+    elif stype in ('Surfaces', 'Matrices'):
+        return stype, '-'.join(ss[1:-2]), ss[-2], ss[-1]
+    else:  # constants
+        return 'Constants', '-'.join(ss[1:]), None, None
+
+
+def get_container(mkt_env, stype, skey):
+    if stype == 'Constants':
+        return mkt_env.get_constant(skey)
+    elif stype == 'Curves':
+        return mkt_env.get_curve(skey)
+    elif stype == 'Lists':
+        return mkt_env.get_list(skey)
+    elif stype == 'Surfaces':
+        return mkt_env.get_surface(skey)
+    else:
+        return mkt_env.get_matrix(skey)
+
+
+def add_container(mkt_env, stype, skey, data):
+    if stype == 'Constants':
+        mkt_env.add_constant(skey, data)
+    elif stype == 'Curves':
+        mkt_env.add_curve(skey, data)
+    elif stype == 'Lists':
+        mkt_env.add_list(skey, data)
+    elif stype == 'Surfaces':
+        mkt_env.add_surface(skey, data)
+    else:
+        mkt_env.add_matrix(skey, data)
+
+
+def _resolve_factor(mkt_env, name):
+    stype, skey, srow, scol = parse_factor_name(name)
+    if stype == 'Constants':
+        return stype, skey, None, None, None, None
+
+    data = get_container(mkt_env, stype, skey)
+    row = 0 if srow is None else _label_position(data.index, srow)
+    col = _label_position(data.columns, scol)
+    return stype, skey, srow, scol, row, col
+
+
+def _label_position(labels, label):
+    try:
+        return labels.get_loc(label)
+    except KeyError:
+        # The labels may be stored as numbers rather than strings
+        str_labels = [str(x) for x in labels]
+        return str_labels.index(str(label))
@@ -1 +1,3 @@
 from MarketEnvironment import *
+from MarketEnvironmentOverlay import *
+from RiskFactorIndex import *
@@ -10,9 +10,14 @@ import numpy as np
 import matplotlib.pyplot as plt
 import FinancialProducts as finProds
 import MarketRisk as mktRisk
+import ScenarioAnalysis as finScenarios
 
 
-def generate_credit_VaR_distrubtion(portfolio, mkt_env, num_sims, corrC):
+def generate_credit_VaR_distrubtion(portfolio, mkt_env, num_sims, corrC,
+                                    sampling='pseudo', seed=None, first_sim=0):
+    # seed is the root seed of the random streams (None uses np.random) and
+    # first_sim the index of the first scenario, so that workers drawing
+    # disjoint ranges of scenarios reproduce a single run exactly
     currency = portfolio.get_currency()
     credit_port = finProds.Portfolio({}, currency)
     for k, v in (portfolio.positions).items():
@@ -105,7 +110,14 @@ def generate_credit_VaR_distrubtion(portfolio, mkt_env, num_sims, corrC):
                                  'NR': df_thresholds_NR_sorted}
 
     # Do Simulation and Change Rating Accordingly
-    scenarios = np.random.multivariate_normal(mu, cov, num_sims)
+    # (the normals use the same sampling schemes and Cholesky diffusion step
+    # as the market risk SimulationEngine)
+    factorization = finScenarios.get_covariance_factorization(
+        pd.DataFrame(corr), np.sqrt(np.diag(cov)), cache_dir=None)
+    std_normals = np.concatenate(list(finScenarios.standard_normal_blocks(
+        nCredits, num_sims, max(num_sims, 1), sampling, seed, first_sim)))
+    scenarios = mu + np.dot(std_normals,
+                            np.transpose(factorization.get_lower_cholesky()))
     migration_loss_dist = []
     default_loss_dist = []
     tot_loss_dist = []
@@ -110,9 +110,9 @@ def marginal_VaR_from_total_port(portfolio, mkt_env, scenarios, alpha):
     # Populate a matrix with the distributions of the underlying assets
     asset_dist = np.zeros((M, N))
     row_idx = 0
-    for ii in range(N):
-        scenario = scenarios.iloc[ii]
-        mkt_env_new = finScenarios.apply_mkt_scenario(mkt_env, scenario, abs_flag=False)
+    engine = finScenarios.ScenarioEngine(mkt_env, list(scenarios))
+    states = engine.shocked_states(scenarios, abs_flag=False)
+    for ii, mkt_env_new in enumerate(engine.generate_mkt_envs(states)):
         for k, v in portfolio.positions.items():
             old_price = old_vals[row_idx]
 
@@ -144,3 +144,106 @@ def marginal_VaR_from_total_port(portfolio, mkt_env, scenarios, alpha):
     MVaR.index = name_list
 
     return RC, MVaR
+
+
+def marginal_VaR_from_blocks(portfolio, mkt_env, scenario_blocks, alpha):
+    '''
+    marginal_VaR_from_blocks(portfolio, mkt_env, scenario_blocks, alpha)
+
+    Functionality
+    =============
+    This calculates the risk contribution and marginal VaR at alpha percentile
+    from an iterable of scenario blocks. Instead of storing the P&L of every
+    asset under every scenario, the sums and cross products needed for the
+    covariance matrix of the assets are accumulated block by block, so only
+    the total portfolio P&L is kept for each scenario
+
+    Parameters
+    ==========
+    portfolio : portfolio object
+         the portfolio to decompose
+    mkt_env : market_environment object
+        a market environment object of current market data to apply the
+        scenarios
+    scenario_blocks : iterable of pandas matrices of doubles
+        blocks of scenarios of forecasted risk factors.
+        (Rows=Scenerios; Col=Factors)
+    alpha : double
+         quantile used for the VaR calculation (between 0 and 1)
+
+    Returns
+    =======
+    RC : dataframe
+        the risk contribution of each element of the total portfolio
+    MVaR : dataframe
+        the marginal VaR of each element in the total portfolio
+    '''
+
+    M = len(portfolio.positions.keys())
+    port_currency = portfolio.get_currency()
+
+    # Calculate the portfolio Value
+    portfolio_val = portfolio.value_product(mkt_env)
+
+    # Populate the current values of the assets and the asset name list
+    old_vals = np.zeros(M)
+    name_list = []
+    idx = 0
+    for k, v in portfolio.positions.items():
+        FX_rate = k.get_base_currency_conversion(mkt_env, port_currency)
+        val = k.value_product(mkt_env)
+        old_vals[idx] = val * v * FX_rate
+        name_list.append(k.get_ID())
+        idx += 1
+
+    # Calculate the current weights of the assets
+    weights = old_vals / portfolio_val
+
+    # Accumulate the moments of the asset P&L block by block
+    N = 0
+    sum_PnL = np.zeros(M)
+    sum_cross_PnL = np.zeros((M, M))
+    total_dist = []
+    engine = None
+    for scenarios in scenario_blocks:
+        if engine is None or engine.get_factor_names() != list(scenarios):
+            engine = finScenarios.ScenarioEngine(mkt_env, list(scenarios))
+        states = engine.shocked_states(scenarios, abs_flag=False)
+
+        asset_dist = np.zeros((M, len(states)))
+        for ii, mkt_env_new in enumerate(engine.generate_mkt_envs(states)):
+            row_idx = 0
+            for k, v in portfolio.positions.items():
+                new_FX_rate = k.get_base_currency_conversion(mkt_env_new,
+                                                             port_currency)
+                new_val = k.value_product(mkt_env_new)
+                asset_dist[row_idx][ii] = new_val * v * new_FX_rate - \
+                                          old_vals[row_idx]
+                row_idx += 1
+
+        N += len(states)
+        sum_PnL += asset_dist.sum(axis=1)
+        sum_cross_PnL += np.dot(asset_dist, np.transpose(asset_dist))
+        total_dist.append(asset_dist.sum(axis=0))
+
+    # Calculate the (sample) covariance matrix of the assets
+    mean_PnL = sum_PnL / N
+    Q = (sum_cross_PnL - N * np.outer(mean_PnL, mean_PnL)) / (N - 1)
+
+    # Determine the total portfolio distribtuin and calculate VaR
+    total_dist = np.concatenate(total_dist)
+    VaR, _ = MarketVaR.calculate_VaR_from_PnL(total_dist, alpha)
+
+    # Calculate the risk contribution and marginal VaR
+    numer = np.dot(Q, weights)
+    denom = np.dot(np.transpose(weights), numer)
+    MVaR = (numer / denom) * VaR
+    RC = weights * MVaR
+
+    # Convert the arrays to dataframes
+    RC = pd.DataFrame(RC)
+    RC.index = name_list
+    MVaR = pd.DataFrame(MVaR)
+    MVaR.index = name_list
+
+    return RC, MVaR
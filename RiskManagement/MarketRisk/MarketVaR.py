@@ -3,18 +3,27 @@
 ###
 
 import math
+import datetime as dt
 import matplotlib.pyplot as plt
 import numpy as np
+import pandas as pd
 import ScenarioAnalysis as finScenarios
 
 
-def generate_PnL_distribution(portfolio, scenarios, mkt_env, static=False):
+def generate_PnL_distribution(portfolio, scenarios, mkt_env, static=False,
+                              horizon=0, method='full'):
     '''
-        generate_PnL_distribution(portfolio, scenarios)
+        generate_PnL_distribution(portfolio, scenarios, mkt_env, static=False,
+        horizon=0, method='full')
 
         Functionality
         =============
-        This gives distribtuion of PnL given portfolio and scenarios
+        This gives distribtuion of PnL given portfolio and scenarios. With
+        method='full' the portfolio is revalued in every scenario (the
+        bonds and equity options under all the scenarios in one batch). With
+        method='delta_gamma' the P&L is approximated from sensitivities
+        calculated once (see generate_delta_gamma_PnL_distribution) and
+        method='hybrid' also fully revalues the nonlinear positions
 
         Parameters
         ==========
@@ -27,25 +36,144 @@ def generate_PnL_distribution(portfolio, scenarios, mkt_env, static=False):
         scenarios
         static : Bool
         a boolean stating whether the valuation is static or time-varying
+        (the scenarios are valued at the valuation date rolled forward by
+        the horizon)
+        horizon : double
+        the time horizon of the scenarios in years
+        method : str
+        'full', 'delta_gamma' or 'hybrid'
 
         Returns
         =======
         dist : vector of doubles
         profit and loss from each scenario
         '''
+    if method in ('delta_gamma', 'hybrid'):
+        return generate_delta_gamma_PnL_distribution(
+            portfolio, scenarios, mkt_env, static, horizon,
+            hybrid=(method == 'hybrid'))
+    elif method != 'full':
+        raise ValueError("method must be 'full', 'delta_gamma' or 'hybrid' "
+                         "(given " + str(method) + ')')
+
     orig_port_val = portfolio.value_product(mkt_env)
 
-    N = len(scenarios)
-    PnL_dist = []
-    for ii in range(N):
-        scenario = scenarios.iloc[ii]
-        mkt_env_new = finScenarios.apply_mkt_scenario(mkt_env, scenario,
-                                                      abs_flag=False)
-        PnL = portfolio.value_product(mkt_env_new) - orig_port_val
-        PnL_dist.append(PnL)
+    # Apply all the scenarios to the market data at once
+    engine = finScenarios.ScenarioEngine(mkt_env, list(scenarios))
+    states = engine.shocked_states(scenarios, abs_flag=False)
+    val_date = None
+    if not static:
+        val_date = roll_val_date(mkt_env.get_val_date(), horizon)
+
+    # The bonds, equity options and callable bonds are valued under all the
+    # scenarios in one batch
+    batched, batched_vals = portfolio.value_batched_positions(engine, states,
+                                                              val_date)
+    other_positions = [x for x in (portfolio.positions).keys()
+                       if x not in set(batched)]
+
+    PnL_dist = batched_vals.sum(axis=1) - orig_port_val
+    for ii, mkt_env_new in enumerate(
+            engine.generate_mkt_envs(states, val_date=val_date)):
+        for product in other_positions:
+            PnL_dist[ii] += portfolio.value_position(product, mkt_env_new)
 
-    # Convert the P&L distribution into a numpy array
-    PnL_dist = np.asarray(PnL_dist)
+    return PnL_dist
+
+
+def generate_delta_gamma_PnL_distribution(portfolio, scenarios, mkt_env,
+                                          static=False, horizon=0,
+                                          hybrid=False):
+    '''
+        generate_delta_gamma_PnL_distribution(portfolio, scenarios, mkt_env,
+        static=False, horizon=0, hybrid=False)
+
+        Functionality
+        =============
+        This gives an approximate distribtuion of PnL given portfolio and
+        scenarios. The delta and gamma of the portfolio to the risk factors
+        of the scenarios are calculated once (using the greeks of the option
+        pricing models) and the P&L of every scenario is the quadratic form
+        x * delta + 0.5 * x * gamma * x over the matrix of scenarios, plus
+        the carry from rolling the valuation date. In the hybrid mode only
+        the positions that are linear enough to return the gradient of their
+        value (bonds, FRNs, CDSs, stocks, cash) are approximated and the
+        other positions (e.g. options) are fully revalued in each scenario
+
+        Parameters
+        ==========
+        portfolio : portfolio object
+        the portfolio to value
+        scenarios : pandas matrix of doubles
+        scenarios of forecasted risk factors. (Rows=Scenerios; Col=Factors)
+        mkt_env : market_environment object
+        a market environment object of current market data to apply the
+        scenarios
+        static : Bool
+        a boolean stating whether the valuation is static or time-varying
+        (the scenarios are valued at the valuation date rolled forward by
+        the horizon)
+        horizon : double
+        the time horizon of the scenarios in years
+        hybrid : Bool
+        a boolean stating whether the nonlinear positions are fully revalued
+
+        Returns
+        =======
+        dist : vector of doubles
+        profit and loss from each scenario
+        '''
+    positions = list((portfolio.positions).keys())
+    if hybrid:
+        full_positions = [x for x in positions
+                          if not portfolio.supports_gradient(x)]
+        positions = [x for x in positions if portfolio.supports_gradient(x)]
+    else:
+        full_positions = []
+
+    engine = finScenarios.ScenarioEngine(mkt_env, list(scenarios))
+    changes = np.asarray(scenarios, float)
+
+    # The sensitivities are taken at the (rolled) valuation date of the
+    # scenarios and the carry is the change in value from rolling the date
+    val_date = None
+    sens_env = mkt_env
+    carry = 0.0
+    if not static:
+        val_date = roll_val_date(mkt_env.get_val_date(), horizon)
+        sens_env = engine.build_mkt_env(engine.get_base_state(),
+                                        val_date=val_date)
+        for product in positions:
+            carry += (portfolio.value_position(product, sens_env) -
+                      portfolio.value_position(product, mkt_env))
+
+    PnL_dist = np.zeros(len(changes)) + carry
+    if len(positions) > 0:
+        delta, gamma = finScenarios.calculate_delta_gamma(
+            sens_env, portfolio, list(scenarios), positions=positions)
+        PnL_dist += changes.dot(delta)
+        PnL_dist += 0.5 * np.sum(changes.dot(gamma) * changes, axis=1)
+
+    # Fully revalue the nonlinear positions in every scenario (the equity
+    # options and callable bonds in one batch). The batch also values the
+    # bonds, which are already in the delta-gamma part, so only the columns
+    # of the fully revalued positions are kept
+    if len(full_positions) > 0:
+        orig_vals = dict((x, portfolio.value_position(x, mkt_env))
+                         for x in full_positions)
+        states = engine.shocked_states(scenarios, abs_flag=False)
+        batched, batched_vals = portfolio.value_batched_positions(
+            engine, states, val_date)
+        keep = [kk for kk, x in enumerate(batched) if x in orig_vals]
+        batched = [batched[kk] for kk in keep]
+        PnL_dist += batched_vals[:, keep].sum(axis=1) - sum(orig_vals[x]
+                                                            for x in batched)
+        full_positions = [x for x in full_positions if x not in set(batched)]
+        if len(full_positions) > 0:
+            for ii, mkt_env_new in enumerate(
+                    engine.generate_mkt_envs(states, val_date=val_date)):
+                PnL_dist[ii] += finScenarios.revalue_dependent_positions(
+                    portfolio, orig_vals, full_positions, mkt_env_new)
 
     return PnL_dist
 
@@ -73,24 +201,21 @@ def generate_mkt_env_distribution(scenarios, mkt_env):
         dictionary of new market environments created from the scenarios
         '''
 
-    N = len(scenarios)
-    mkt_env_dict = {}
+    engine = finScenarios.ScenarioEngine(mkt_env, list(scenarios))
+    states = engine.shocked_states(scenarios, abs_flag=False)
 
-    for ii in range(N):
-        scenario = scenarios.iloc[ii]
-        mkt_env_new = finScenarios.apply_mkt_scenario(mkt_env, scenario,
-                                                      abs_flag=False)
-        name = 'Scenario ' + str(ii + 1)
-        mkt_env_dict[name] = mkt_env_new
+    mkt_env_dict = {}
+    for mkt_env_new in engine.generate_mkt_envs(states):
+        mkt_env_dict[mkt_env_new.get_ID()] = mkt_env_new
 
     return mkt_env_dict
 
 
 def generate_PnL_distribution_from_mkt_envs(portfolio, mkt_env_dict, mkt_env,
-                                            static=False):
+                                            static=False, horizon=0):
     '''
         generate_PnL_distribution_from_mkt_envs(portfolio, mkt_env_dict, mkt_env,
-        static=False)
+        static=False, horizon=0)
 
         Functionality
         =============
@@ -107,6 +232,10 @@ def generate_PnL_distribution_from_mkt_envs(portfolio, mkt_env_dict, mkt_env,
         scenerios
         static : Bool
         a boolean stating whether the valuation is static or time-varying
+        (the scenarios are valued at the valuation date rolled forward by
+        the horizon)
+        horizon : double
+        the time horizon of the scenarios in years
 
         Returns
         =======
@@ -118,7 +247,11 @@ def generate_PnL_distribution_from_mkt_envs(portfolio, mkt_env_dict, mkt_env,
     N = len(mkt_env_dict)
     PnL_dist = []
     for mkt_env_new in mkt_env_dict.values():
+        scenario_val_date = mkt_env_new.get_val_date()
+        if not static:
+            mkt_env_new.set_val_date(roll_val_date(scenario_val_date, horizon))
         PnL = portfolio.value_product(mkt_env_new) - orig_port_val
+        mkt_env_new.set_val_date(scenario_val_date)
         PnL_dist.append(PnL)
 
     # Convert the P&L distribution into a numpy array
@@ -127,8 +260,224 @@ def generate_PnL_distribution_from_mkt_envs(portfolio, mkt_env_dict, mkt_env,
     return PnL_dist
 
 
+def generate_PnL_distributions_from_blocks(portfolios, scenario_blocks,
+                                           mkt_env):
+    '''
+        generate_PnL_distributions_from_blocks(portfolios, scenario_blocks,
+        mkt_env)
+
+        Functionality
+        =============
+        This gives the distribtuion of PnL of several portfolios from an
+        iterable of scenario blocks (e.g. simulation_engine_blocks). Each block
+        is applied to the market environment, every portfolio is valued in
+        the shocked environments and only the P&L is kept, so memory use is
+        bounded by the block size
+
+        Parameters
+        ==========
+        portfolios : dict (str:portfolio object)
+        the portfolios to value
+        scenario_blocks : iterable of pandas matrices of doubles
+        blocks of scenarios of forecasted risk factors.
+        (Rows=Scenerios; Col=Factors)
+        mkt_env : market_environment object
+        a market environment object of current market data to apply the
+        scenerios
+
+        Returns
+        =======
+        dists : dict (str:vector of doubles)
+        profit and loss of each portfolio from each scenario
+        '''
+    orig_port_vals = {}
+    PnL_dists = {}
+    for name, portfolio in portfolios.items():
+        orig_port_vals[name] = portfolio.value_product(mkt_env)
+        PnL_dists[name] = []
+
+    engine = None
+    for scenarios in scenario_blocks:
+        # The factor slots only need to be mapped once for all the blocks
+        if engine is None or engine.get_factor_names() != list(scenarios):
+            engine = finScenarios.ScenarioEngine(mkt_env, list(scenarios))
+        states = engine.shocked_states(scenarios, abs_flag=False)
+
+        block_PnL = {}
+        for name in portfolios:
+            block_PnL[name] = np.zeros(len(states))
+        for ii, mkt_env_new in enumerate(engine.generate_mkt_envs(states)):
+            for name, portfolio in portfolios.items():
+                block_PnL[name][ii] = portfolio.value_product(
+                    mkt_env_new) - orig_port_vals[name]
+
+        for name in portfolios:
+            PnL_dists[name].append(block_PnL[name])
+
+    # Convert the P&L distributions into numpy arrays
+    for name in portfolios:
+        if PnL_dists[name]:
+            PnL_dists[name] = np.concatenate(PnL_dists[name])
+        else:
+            PnL_dists[name] = np.zeros(0)
+
+    return PnL_dists
+
+
+def generate_path_PnL_distribution(portfolio, path_blocks, mkt_env,
+                                   step_delta_t):
+    '''
+        generate_path_PnL_distribution(portfolio, path_blocks, mkt_env,
+        step_delta_t)
+
+        Functionality
+        =============
+        This gives the distribtuion of PnL of a portfolio along simulated
+        paths of the risk factors (e.g. path_simulation_blocks). At the end of
+        each step the valuation date is rolled forward, so the products age
+        and the cashflows that have been paid drop out of the valuation (the
+        cashflow schedules are generated once and reused at every step)
+
+        Parameters
+        ==========
+        portfolio : portfolio object
+        the portfolio to value
+        path_blocks : iterable of lists of pandas matrices of doubles
+        blocks of paths, given as the relative change of the risk factors at
+        the end of each step (Rows=Paths; Col=Factors)
+        mkt_env : market_environment object
+        a market environment object of current market data to apply the
+        scenarios
+        step_delta_t : double
+        the length of each step in years
+
+        Returns
+        =======
+        dist : numpy matrix of doubles
+        profit and loss of each path at the end of each step
+        (Rows=Paths; Col=Steps)
+        '''
+    orig_port_val = portfolio.value_product(mkt_env)
+    val_date = mkt_env.get_val_date()
+
+    engine = None
+    PnL_blocks = []
+    for path_scenarios in path_blocks:
+        num_steps = len(path_scenarios)
+        block_PnL = np.zeros((len(path_scenarios[0]), num_steps))
+        for step, scenarios in enumerate(path_scenarios):
+            # The factor slots only need to be mapped once for all the steps
+            if engine is None or engine.get_factor_names() != list(scenarios):
+                engine = finScenarios.ScenarioEngine(mkt_env, list(scenarios))
+            states = engine.shocked_states(scenarios, abs_flag=False)
+            step_date = roll_val_date(val_date, (step + 1) * step_delta_t)
+            for ii, mkt_env_new in enumerate(
+                    engine.generate_mkt_envs(states, val_date=step_date)):
+                block_PnL[ii, step] = portfolio.value_product(
+                    mkt_env_new) - orig_port_val
+        PnL_blocks.append(block_PnL)
+
+    return np.concatenate(PnL_blocks)
+
+
+def calculate_path_VaR(portfolio, mkt_env, numSim, num_steps, step_delta_t,
+                       alpha, sampling='pseudo', seed=None, block_size=1000):
+    '''
+        calculate_path_VaR(portfolio, mkt_env, numSim, num_steps, step_delta_t,
+        alpha, sampling='pseudo', seed=None, block_size=1000)
+
+        Functionality
+        =============
+        This calculates the Value-at-Risk (VaR) and Expected Shortfall
+        (ES) of a portfolio at alpha percentile over a horizon of num_steps
+        steps from simulated paths of the risk factors, revaluing the ageing
+        portfolio at the end of every step instead of scaling a one step VaR
+        by the square root of time
+
+        Parameters
+        ==========
+        portfolio : portfolio object
+        the portfolio to value
+        mkt_env : market_environment object
+        a market environment object of current market data to apply the
+        scenarios
+        numSim : int
+        number of simulated paths
+        num_steps : int
+        number of steps in each path
+        step_delta_t : double
+        the length of each step in years
+        alpha : double
+        quantile used for the VaR calculation (between 0 and 1)
+        sampling : str
+        the sampling scheme of the normals
+        seed : int
+        the root seed of the random streams (None uses np.random)
+        block_size : int
+        the maximum number of paths revalued per block
+
+        Returns
+        =======
+        VaR : numpy array
+        the Value-At-Risk (VaR) of the portfolio at the end of each step
+        ES : numpy array
+        the Expected Shortfall (ES) of the portfolio at the end of each step
+        '''
+    corr_mat = mkt_env.get_matrix('RiskFactorCorrelationMatrix')
+    factor_vol = mkt_env.get_list('RiskFactorVolatilities')
+
+    path_blocks = finScenarios.path_simulation_blocks(
+        corr_mat, factor_vol, numSim, num_steps, step_delta_t,
+        block_size=block_size, sampling=sampling, seed=seed)
+    PnL_dist = generate_path_PnL_distribution(portfolio, path_blocks, mkt_env,
+                                              step_delta_t)
+
+    VaR = np.zeros(num_steps)
+    ES = np.zeros(num_steps)
+    for step in range(num_steps):
+        VaR[step], ES[step] = calculate_VaR_from_PnL(PnL_dist[:, step], alpha)
+
+    return VaR, ES
+
+
+def roll_val_date(val_date, horizon):
+    # Roll the valuation date forward by a horizon in years (whole days)
+    return val_date + dt.timedelta(days=int(round(365.0 * horizon)))
+
+
+def generate_PnL_distribution_from_blocks(portfolio, scenario_blocks, mkt_env):
+    '''
+        generate_PnL_distribution_from_blocks(portfolio, scenario_blocks,
+        mkt_env)
+
+        Functionality
+        =============
+        This gives distribtuion of PnL given portfolio and an iterable of
+        scenario blocks, accumulating the P&L block by block
+
+        Parameters
+        ==========
+        portfolio : portfolio object
+        the portfolio to value
+        scenario_blocks : iterable of pandas matrices of doubles
+        blocks of scenarios of forecasted risk factors.
+        (Rows=Scenerios; Col=Factors)
+        mkt_env : market_environment object
+        a market environment object of current market data to apply the
+        scenerios
+
+        Returns
+        =======
+        dist : vector of doubles
+        profit and loss from each scenario
+        '''
+    PnL_dists = generate_PnL_distributions_from_blocks({'Portfolio': portfolio},
+                                                       scenario_blocks, mkt_env)
+    return PnL_dists['Portfolio']
+
+
 def calculate_scenario_VaR(portfolio, mkt_env, scenarios, scenario_horizon,
-                           VaR_horizon, alpha):
+                           VaR_horizon, alpha, weights=None):
     '''
         calculateVaR(portfolio, scenarios, scenario_horizon, VaR_horizon,alpha)
 
@@ -149,6 +498,9 @@ def calculate_scenario_VaR(portfolio, mkt_env, scenarios, scenario_horizon,
             the time horizon that applies to the VaR calculation in days
         alpha : double
             quantile used for the VaR calculation (between 0 and 1)
+        weights : numpy array
+            likelihood ratio weights of importance sampled scenarios (None
+            for equally weighted scenarios)
 
         Returns
         =======
@@ -162,21 +514,22 @@ def calculate_scenario_VaR(portfolio, mkt_env, scenarios, scenario_horizon,
 
     portValues = generate_PnL_distribution(portfolio, scenarios, mkt_env)
 
-    VaR = np.percentile(portValues, 100.0 * alpha)
-    ES = np.mean(portValues[portValues < VaR])
-
-    return VaR, ES
+    return calculate_VaR_from_PnL(portValues, alpha, weights)
 
 
-def calculate_VaR_from_PnL(PnL_dist, alpha):
+def calculate_VaR_from_PnL(PnL_dist, alpha, weights=None):
     '''
-        calculate_VaR_from_PnL(PnL_dist, alpha)
+        calculate_VaR_from_PnL(PnL_dist, alpha, weights=None)
 
         Functionality
         =============
         This calculates the Value-at-Risk (VaR) and Expected Shortfall
         (ES) of a portfolio at alpha percentile from a distribtuion of the portfolio
-        P&L
+        P&L. If the P&L comes from importance sampled scenarios, the
+        likelihood ratio weights give the weighted estimators: the VaR is the
+        smallest P&L whose cumulative weight divided by the number of
+        scenarios reaches alpha and the ES is the weighted mean of the P&L
+        below the VaR
 
         Parameters
         ==========
@@ -184,6 +537,8 @@ def calculate_VaR_from_PnL(PnL_dist, alpha):
         this is an array of portfolio profit and losses
         alpha : double
         quantile used for the VaR calculation (between 0 and 1)
+        weights : array
+        likelihood ratio weights of the P&L (None for equal weights)
 
         Returns
         =======
@@ -192,6 +547,9 @@ def calculate_VaR_from_PnL(PnL_dist, alpha):
         ES : double
         the Expected Shortfall (ES) of the portfolio
         '''
+    if weights is not None:
+        return _calculate_weighted_VaR(np.asarray(PnL_dist, float),
+                                       np.asarray(weights, float), alpha)
 
     VaR = np.percentile(PnL_dist, 100.0 * alpha)
     ES = np.mean(PnL_dist[PnL_dist < VaR])
@@ -199,6 +557,298 @@ def calculate_VaR_from_PnL(PnL_dist, alpha):
     return VaR, ES
 
 
+def _calculate_weighted_VaR(PnL_dist, weights, alpha):
+    order = np.argsort(PnL_dist)
+    sorted_PnL = PnL_dist[order]
+    sorted_weights = weights[order]
+
+    # The weighted empirical distribution function of the P&L
+    cum_prob = np.cumsum(sorted_weights) / len(PnL_dist)
+    idx = min(np.searchsorted(cum_prob, alpha), len(PnL_dist) - 1)
+    VaR = sorted_PnL[idx]
+
+    tail = sorted_PnL < VaR
+    tail_weight = np.sum(sorted_weights[tail])
+    if tail_weight > 0:
+        ES = np.sum(sorted_weights[tail] * sorted_PnL[tail]) / tail_weight
+    else:
+        ES = np.nan
+
+    return VaR, ES
+
+
+def calculate_VaR_from_blocks(portfolio, mkt_env, scenario_blocks, alpha):
+    '''
+        calculate_VaR_from_blocks(portfolio, mkt_env, scenario_blocks, alpha)
+
+        Functionality
+        =============
+        This calculates the Value-at-Risk (VaR) and Expected Shortfall
+        (ES) of a portfolio at alpha percentile from an iterable of scenario
+        blocks without holding the shocked market environments in memory
+
+        Parameters
+        ==========
+        portfolio : portfolio object
+        the portfolio to value
+        mkt_env : market_environment object
+        a market environment object of current market data to apply the
+        scenarios
+        scenario_blocks : iterable of pandas matrices of doubles
+        blocks of scenarios of forecasted risk factors.
+        (Rows=Scenerios; Col=Factors)
+        alpha : double
+        quantile used for the VaR calculation (between 0 and 1)
+
+        Returns
+        =======
+        VaR : double
+        the Value-At-Risk (VaR) of the portfolio
+        ES : double
+        the Expected Shortfall (ES) of the portfolio
+        '''
+    PnL_dist = generate_PnL_distribution_from_blocks(portfolio, scenario_blocks,
+                                                     mkt_env)
+    return calculate_VaR_from_PnL(PnL_dist, alpha)
+
+
+def calculate_importance_sampling_VaR(portfolio, mkt_env, numSim, sim_delta_t,
+                                      alpha, sampling='pseudo', seed=None,
+                                      block_size=10000):
+    '''
+        calculate_importance_sampling_VaR(portfolio, mkt_env, numSim,
+        sim_delta_t, alpha, sampling='pseudo', seed=None, block_size=10000)
+
+        Functionality
+        =============
+        This calculates the Value-at-Risk (VaR) and Expected Shortfall
+        (ES) of a portfolio at alpha percentile from importance sampled
+        scenarios. The normals are shifted towards the loss direction given
+        by the first-order sensitivities of the portfolio and the P&L is
+        weighted by the likelihood ratios, so that many more of the full
+        revaluations land in the tail
+
+        Parameters
+        ==========
+        portfolio : portfolio object
+        the portfolio to value
+        mkt_env : market_environment object
+        a market environment object of current market data to apply the
+        scenarios
+        numSim : int
+        number of simulations
+        sim_delta_t : double
+        the time horizon for the simulation in years
+        alpha : double
+        quantile used for the VaR calculation (between 0 and 1)
+        sampling : str
+        the sampling scheme of the normals
+        seed : int
+        the root seed of the random streams (None uses np.random)
+        block_size : int
+        the maximum number of scenarios revalued per block
+
+        Returns
+        =======
+        VaR : double
+        the Value-At-Risk (VaR) of the portfolio
+        ES : double
+        the Expected Shortfall (ES) of the portfolio
+        '''
+    corr_mat = mkt_env.get_matrix('RiskFactorCorrelationMatrix')
+    factor_vol = mkt_env.get_list('RiskFactorVolatilities')
+
+    sensitivities = finScenarios.calculate_relative_sensitivities(
+        mkt_env, portfolio, list(corr_mat))
+    mean_shift = finScenarios.importance_sampling_shift(
+        corr_mat, factor_vol, sensitivities, alpha, sim_delta_t)
+
+    # The weights are collected while the blocks are consumed
+    weights = []
+
+    def _blocks():
+        for scenarios, block_weights in finScenarios.importance_sampling_blocks(
+                corr_mat, factor_vol, numSim, sim_delta_t, mean_shift,
+                block_size=block_size, sampling=sampling, seed=seed):
+            weights.append(block_weights)
+            yield scenarios
+
+    PnL_dist = generate_PnL_distribution_from_blocks(portfolio, _blocks(),
+                                                     mkt_env)
+    return calculate_VaR_from_PnL(PnL_dist, alpha, np.concatenate(weights))
+
+
+def generate_historic_PnL_series(portfolio, mkt_env, start_date=None,
+                                 end_date=None, method='full'):
+    '''
+        generate_historic_PnL_series(portfolio, mkt_env, start_date=None,
+        end_date=None, method='full')
+
+        Functionality
+        =============
+        This gives the P&L of the current portfolio under every daily
+        historic scenario after start_date up to end_date, so that windows
+        of the history can be analysed without revaluing the portfolio again
+
+        Parameters
+        ==========
+        portfolio : portfolio object
+        the portfolio to value
+        mkt_env : market_environment object
+        a market environment object of current market data to apply the
+        scenarios
+        start_date : datetime
+        the start date of the history (None for the whole history)
+        end_date : datetime
+        the end date of the history (defaulted to today)
+        method : str
+        the revaluation method (see generate_PnL_distribution)
+
+        Returns
+        =======
+        PnL_series : pandas series
+        profit and loss of each historic scenario indexed by date
+        '''
+    historic_scenarios = finScenarios.historic_between_dates(start_date,
+                                                             end_date)
+    PnL_dist = generate_PnL_distribution(portfolio, historic_scenarios,
+                                         mkt_env, static=True, method=method)
+    return pd.Series(PnL_dist, index=historic_scenarios.index)
+
+
+def calculate_rolling_VaR_from_PnL(PnL_series, alpha, window=250):
+    '''
+        calculate_rolling_VaR_from_PnL(PnL_series, alpha, window=250)
+
+        Functionality
+        =============
+        This calculates the Value-at-Risk (VaR) and Expected Shortfall (ES)
+        at alpha percentile of every window of consecutive P&Ls, labelled by
+        the last date of the window. The rolling quantile keeps the window
+        sorted (O(n log w)) and gives the same VaR as calculate_VaR_from_PnL
+        on each window. The ES of each window is the mean of its P&Ls below
+        the VaR, found from running counts and sums of the P&Ls in the
+        window by rank as it slides (O(n log n) rather than a pass over every
+        window)
+
+        Parameters
+        ==========
+        PnL_series : pandas series
+        the P&L of each day indexed by date
+        alpha : double
+        quantile used for the VaR calculation (between 0 and 1)
+        window : int
+        the number of days in each window
+
+        Returns
+        =======
+        rolling_VaR : pandas dataframe
+        the VaR and ES (Col) of each window ending on each date (Rows)
+        '''
+    PnL_series = pd.Series(PnL_series).astype(float)
+    window = int(window)
+    if len(PnL_series) < window:
+        return pd.DataFrame(columns=['VaR', 'ES'], dtype=float)
+
+    VaR = PnL_series.rolling(window).quantile(
+        alpha, interpolation='linear').values[window - 1:]
+
+    # The P&Ls below the VaR of a window are those with a rank (in the whole
+    # series) below the rank of the VaR. Binary indexed trees by rank hold
+    # the number and the sum of the P&Ls in the current window
+    sorted_PnL = np.sort(PnL_series.values)
+    ranks = np.searchsorted(sorted_PnL, PnL_series.values).tolist()
+    VaR_ranks = np.searchsorted(sorted_PnL, VaR).tolist()
+    PnL = PnL_series.values.tolist()
+    tail_counts = [0] * (len(PnL) + 1)
+    tail_sums = [0.0] * (len(PnL) + 1)
+
+    # Missing P&Ls are left out of the trees (their windows have no VaR)
+    ES = np.zeros(len(VaR))
+    for ii in range(len(PnL)):
+        if not math.isnan(PnL[ii]):
+            _add_to_tree(tail_counts, tail_sums, ranks[ii], 1, PnL[ii])
+        if ii >= window and not math.isnan(PnL[ii - window]):
+            _add_to_tree(tail_counts, tail_sums, ranks[ii - window], -1,
+                         -PnL[ii - window])
+        if ii >= window - 1:
+            num_tail, tail_sum = _sum_tree(tail_counts, tail_sums,
+                                           VaR_ranks[ii - window + 1])
+            ES[ii - window + 1] = (tail_sum / num_tail if num_tail > 0
+                                   else np.nan)
+    ES[np.isnan(VaR)] = np.nan
+
+    return pd.DataFrame({'VaR': VaR, 'ES': ES},
+                        index=PnL_series.index[window - 1:],
+                        columns=['VaR', 'ES'])
+
+
+def _add_to_tree(counts, sums, rank, count, value):
+    # Adds a count and a value at a (0-based) rank of the binary indexed
+    # trees of the counts and sums
+    index = rank + 1
+    while index < len(counts):
+        counts[index] += count
+        sums[index] += value
+        index += index & -index
+
+
+def _sum_tree(counts, sums, num_ranks):
+    # The count and sum at the ranks below num_ranks of the binary indexed
+    # trees of the counts and sums
+    total_count = 0
+    total_sum = 0.0
+    index = num_ranks
+    while index > 0:
+        total_count += counts[index]
+        total_sum += sums[index]
+        index -= index & -index
+    return total_count, total_sum
+
+
+def find_stressed_VaR_window(PnL_series, alpha, window=250):
+    '''
+        find_stressed_VaR_window(PnL_series, alpha, window=250)
+
+        Functionality
+        =============
+        This finds the window of consecutive days of the historic P&L of the
+        portfolio (see generate_historic_PnL_series) with the worst VaR,
+        which is the stressed period used for the stressed VaR
+
+        Parameters
+        ==========
+        PnL_series : pandas series
+        the historic P&L of the portfolio indexed by date
+        alpha : double
+        quantile used for the VaR calculation (between 0 and 1)
+        window : int
+        the number of days in the stressed period (250 for 12 months)
+
+        Returns
+        =======
+        SVaR : double
+        the stressed Value-At-Risk (VaR) of the portfolio
+        SES : double
+        the stressed Expected Shortfall (ES) of the portfolio
+        start_date : datetime
+        the first date of the stressed period
+        end_date : datetime
+        the last date of the stressed period
+        '''
+    rolling_VaR = calculate_rolling_VaR_from_PnL(PnL_series, alpha, window)
+    if len(rolling_VaR) == 0:
+        raise ValueError('The P&L history has fewer than ' + str(window) +
+                         ' days')
+
+    worst = int(np.argmin(rolling_VaR['VaR'].values))
+    start_date = PnL_series.index[worst]
+    end_date = rolling_VaR.index[worst]
+
+    return (rolling_VaR['VaR'].iloc[worst], rolling_VaR['ES'].iloc[worst],
+            start_date, end_date)
+
+
 def backtest_VaR_from_historic(portfolio, mkt_env, VaR, num_days,
                                end_date=None):
     '''
@@ -234,10 +884,7 @@ def backtest_VaR_from_historic(portfolio, mkt_env, VaR, num_days,
     PnL_dist = generate_PnL_distribution(portfolio, historic_scenarios, mkt_env)
 
     # Count the number of breachs
-    breachs = 0
-    for ii in range(num_days):
-        if PnL_dist[ii] < VaR:
-            breachs += 1
+    breachs = int(np.sum(np.asarray(PnL_dist) < VaR))
 
     return breachs
 
@@ -309,3 +956,56 @@ def plot_market_VaR_dist(PnL_dist, portfolio, mkt_env, scenario_horizon,
     fig_out = plt.grid(True);
 
     return fig_out
+
+
+# -----------------------------------------------------------------------------
+# Testing
+# -----------------------------------------------------------------------------
+if __name__ == '__main__':
+    import FinancialProducts as finProducts
+    from MarketData import MarketEnvironment
+
+    print('\nTesting MarketVaR.py...')
+    mkt_env = MarketEnvironment('Test', dt.datetime(2017, 6, 1))
+    tenors = ['0.25', '1', '5', '10', '30']
+    mkt_env.add_curve('RiskFree-Gov-CAD', pd.DataFrame(
+        [[0.01, 0.012, 0.018, 0.022, 0.025]], columns=tenors))
+    mkt_env.add_matrix('CreditSpreads-Ratings-CAD', pd.DataFrame(
+        [[0.004, 0.005, 0.008, 0.01, 0.012]], index=['A'], columns=tenors))
+    mkt_env.add_constant('IdiosyncraticSpread-Bond', 0.001)
+    mkt_env.add_constant('MarketPrice-XYZ', 50.0)
+    factor_names = (['Curves-RiskFree-Gov-CAD-' + x for x in tenors] +
+                    ['Constants-MarketPrice-XYZ'])
+    mkt_env.add_list('RiskFactorVolatilities', pd.DataFrame(
+        [0.01 * np.ones(len(factor_names))], columns=factor_names))
+    mkt_env.add_list('RiskFactorMeans', pd.DataFrame(
+        [np.zeros(len(factor_names))], columns=factor_names))
+
+    # A mixed book of a stock, a fixed rate bond (linearised in the hybrid
+    # mode) and a callable bond (fully revalued in the hybrid mode)
+    bond = finProducts.FixedRateBond(
+        'Bond', 'CAD', dt.datetime(2015, 3, 15), dt.datetime(2027, 3, 15),
+        100, 4.0, 2, 'Issuer', {'S&P': 'A'}, 'Senior', 'ACT/365',
+        first_coupon_date=dt.datetime(2015, 9, 15))
+    call_schedule = {dt.datetime(2020, 3, 15): {
+        'strike': 101., 'option_type': 'Call', 'after_feature': 'True'}}
+    callable_bond = finProducts.CallableBond(
+        'CallableBond', 'CAD', dt.datetime(2015, 3, 15),
+        dt.datetime(2027, 3, 15), 100, 'Fixed', 5.0, 2, call_schedule,
+        'Issuer', {'S&P': 'A'}, 'Senior', 'ACT/365',
+        first_coupon_date=dt.datetime(2015, 9, 15))
+    stock = finProducts.Stock('XYZ', 'CAD', 'XYZ Corp', 'XYZ', 'A')
+    portfolio = finProducts.Portfolio({bond: 100, callable_bond: 50,
+                                       stock: 20}, 'CAD')
+
+    scenarios = pd.DataFrame(np.random.RandomState(0).normal(
+        scale=0.01, size=(200, len(factor_names))), columns=factor_names)
+    PnL_full = generate_PnL_distribution(portfolio, scenarios, mkt_env,
+                                         static=True)
+    for method in ['delta_gamma', 'hybrid']:
+        PnL_approx = generate_PnL_distribution(portfolio, scenarios, mkt_env,
+                                               static=True, method=method)
+        error = np.max(np.abs(PnL_approx - PnL_full)) / np.max(
+            np.abs(PnL_full))
+        assert error < 0.01
+        print(method + ' P&L relative to full revaluation: ' + str(error))
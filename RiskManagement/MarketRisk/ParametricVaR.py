@@ -0,0 +1,265 @@
+#
+# Parametric (variance-covariance) Value-At-Risk
+#
+
+import numpy as np
+import pandas as pd
+from scipy.special import ndtri
+import ScenarioAnalysis as finScenarios
+
+# Number of quantiles averaged for the Cornish-Fisher Expected Shortfall
+CORNISH_FISHER_ES_POINTS = 1000
+
+
+def calculate_parametric_VaR(portfolio, mkt_env, alpha, sim_delta_t,
+                             vol_delta_t=None, cornish_fisher=False):
+    '''
+    calculate_parametric_VaR(portfolio, mkt_env, alpha, sim_delta_t,
+                             vol_delta_t=None, cornish_fisher=False)
+
+    Functionality
+    =============
+    This calculates the Value-at-Risk (VaR), Expected Shortfall (ES) and
+    component VaR of a portfolio at alpha percentile without revaluing the
+    portfolio in any scenario. The sensitivities of the portfolio to relative
+    changes of the risk factors are combined with the covariance matrix built
+    from RiskFactorCorrelationMatrix and RiskFactorVolatilities. With
+    cornish_fisher=True the delta-gamma moments of the P&L are used to
+    correct the normal quantile for skewness and kurtosis
+
+    Parameters
+    ==========
+    portfolio : portfolio object
+        the portfolio to value
+    mkt_env : market_environment object
+        a market environment object of current market data
+    alpha : double
+        quantile used for the VaR calculation (between 0 and 1)
+    sim_delta_t : double
+        the time horizon of the VaR in years
+    vol_delta_t : double
+        the time horizon of the vol data in years (defaulted to sim horizon)
+    cornish_fisher : Bool
+        a boolean stating whether to apply the Cornish-Fisher correction
+
+    Returns
+    =======
+    VaR : double
+        the Value-At-Risk (VaR) of the portfolio
+    ES : double
+        the Expected Shortfall (ES) of the portfolio
+    component_VaR : pandas series
+        the contribution of each risk factor to the VaR
+    '''
+    corr_mat = mkt_env.get_matrix('RiskFactorCorrelationMatrix')
+    factor_vol = mkt_env.get_list('RiskFactorVolatilities')
+    factor_names = list(corr_mat)
+    cov_matrix = risk_factor_covariance(corr_mat, factor_vol[factor_names],
+                                        sim_delta_t, vol_delta_t)
+
+    if cornish_fisher:
+        delta, gamma = finScenarios.calculate_delta_gamma(mkt_env, portfolio,
+                                                          factor_names)
+    else:
+        sensitivities = finScenarios.calculate_relative_sensitivities(
+            mkt_env, portfolio, factor_names)
+        delta = np.array([sensitivities[name] for name in factor_names])
+        gamma = None
+
+    return parametric_VaR(delta, cov_matrix, alpha, gamma, cornish_fisher,
+                          factor_names)
+
+
+def parametric_VaR(delta, cov_matrix, alpha, gamma=None, cornish_fisher=False,
+                   factor_names=None):
+    '''
+    parametric_VaR(delta, cov_matrix, alpha, gamma=None, cornish_fisher=False,
+                   factor_names=None)
+
+    Functionality
+    =============
+    This calculates the parametric VaR, ES and component VaR from
+    sensitivities that have already been calculated (e.g. kept from the
+    start of the day and updated for a new trade), so it only needs a few
+    small matrix products. The P&L is delta.X + 0.5 X.gamma.X with X normal
+    with covariance cov_matrix. Without the Cornish-Fisher correction the
+    P&L is taken to be normal with the delta-gamma mean and variance. The
+    component VaR allocates the VaR to the risk factors in proportion to
+    their contribution delta_i * (cov_matrix.delta)_i to the delta variance,
+    so the components add up to the VaR
+
+    Parameters
+    ==========
+    delta : numpy array
+        P&L of the portfolio per unit relative change of each risk factor
+    cov_matrix : numpy array
+        covariance matrix of the relative changes of the risk factors
+    alpha : double
+        quantile used for the VaR calculation (between 0 and 1)
+    gamma : numpy array
+        matrix of second derivatives of the P&L (None for a linear P&L)
+    cornish_fisher : Bool
+        a boolean stating whether to apply the Cornish-Fisher correction
+    factor_names : list of str
+        the names of the risk factors used to label the component VaR
+
+    Returns
+    =======
+    VaR : double
+        the Value-At-Risk (VaR) of the portfolio
+    ES : double
+        the Expected Shortfall (ES) of the portfolio
+    component_VaR : pandas series
+        the contribution of each risk factor to the VaR
+    '''
+    delta = np.ravel(np.asarray(delta, float))
+    cov_matrix = np.asarray(cov_matrix, float)
+    mean, std_dev, skew, ex_kurt = delta_gamma_moments(delta, cov_matrix,
+                                                       gamma)
+
+    z = ndtri(alpha)
+    if cornish_fisher:
+        VaR = mean + std_dev * cornish_fisher_quantile(z, skew, ex_kurt)
+
+        # The ES is the average of the corrected quantiles below alpha
+        u = alpha * (np.arange(CORNISH_FISHER_ES_POINTS) + 0.5) / \
+            CORNISH_FISHER_ES_POINTS
+        ES = mean + std_dev * np.mean(
+            cornish_fisher_quantile(ndtri(u), skew, ex_kurt))
+    else:
+        VaR = mean + std_dev * z
+        ES = mean - std_dev * np.exp(-0.5 * z ** 2) / (
+            np.sqrt(2 * np.pi) * alpha)
+
+    # Allocate the VaR to the risk factors
+    contributions = delta * np.dot(cov_matrix, delta)
+    delta_var = np.sum(contributions)
+    if delta_var > 0:
+        component_VaR = VaR * contributions / delta_var
+    else:
+        component_VaR = np.zeros(len(delta))
+    component_VaR = pd.Series(component_VaR, index=factor_names)
+
+    return VaR, ES, component_VaR
+
+
+def delta_gamma_moments(delta, cov_matrix, gamma=None):
+    '''
+    delta_gamma_moments(delta, cov_matrix, gamma=None)
+
+    Functionality
+    =============
+    Mean, standard deviation, skewness and excess kurtosis of the P&L
+    delta.X + 0.5 X.gamma.X when X is normal with mean zero and covariance
+    cov_matrix. With G = gamma.cov_matrix the cumulants are
+    k1 = tr(G) / 2, k2 = delta.S.delta + tr(G^2) / 2,
+    k3 = 3 delta.S.G.delta + tr(G^3) and
+    k4 = 12 delta.S.G^2.delta + 3 tr(G^4)
+
+    Parameters
+    ==========
+    delta : numpy array
+        P&L of the portfolio per unit change of each risk factor
+    cov_matrix : numpy array
+        covariance matrix of the changes of the risk factors
+    gamma : numpy array
+        matrix of second derivatives of the P&L (None for a linear P&L)
+
+    Returns
+    =======
+    mean : double
+        the mean of the P&L
+    std_dev : double
+        the standard deviation of the P&L
+    skew : double
+        the skewness of the P&L
+    ex_kurt : double
+        the excess kurtosis of the P&L
+    '''
+    cov_delta = np.dot(cov_matrix, delta)
+    delta_var = np.dot(delta, cov_delta)
+    if gamma is None:
+        return 0.0, np.sqrt(delta_var), 0.0, 0.0
+
+    gamma = np.asarray(gamma, float)
+    G = np.dot(gamma, cov_matrix)
+    G2 = np.dot(G, G)
+    G_delta = np.dot(gamma, cov_delta)
+    k1 = 0.5 * np.trace(G)
+    k2 = delta_var + 0.5 * np.trace(G2)
+    k3 = 3 * np.dot(cov_delta, G_delta) + np.trace(np.dot(G2, G))
+    k4 = 12 * np.dot(G_delta, np.dot(cov_matrix, G_delta)) + \
+        3 * np.trace(np.dot(G2, G2))
+
+    if k2 <= 0:
+        return k1, 0.0, 0.0, 0.0
+    std_dev = np.sqrt(k2)
+    return k1, std_dev, k3 / std_dev ** 3, k4 / k2 ** 2
+
+
+def cornish_fisher_quantile(z, skew, ex_kurt):
+    # Quantile of a standardised distribution with the given skewness and
+    # excess kurtosis from the normal quantile z
+    return (z + (z ** 2 - 1) * skew / 6 + (z ** 3 - 3 * z) * ex_kurt / 24 -
+            (2 * z ** 3 - 5 * z) * skew ** 2 / 36)
+
+
+def risk_factor_covariance(corr_matrix, std_dev_vector, sim_delta_t,
+                           vol_delta_t=None):
+    '''
+    risk_factor_covariance(corr_matrix, std_dev_vector, sim_delta_t,
+                           vol_delta_t=None)
+
+    Functionality
+    =============
+    Covariance matrix of the relative changes of the risk factors over the
+    time horizon, from the cached factorization used by the simulations
+
+    Parameters
+    ==========
+    corr_matrix : pandas dataframe
+        correlation matrix of the risk factor time series
+    std_dev_vector : pandas dataframe
+        standard deviations of the risk factor time series
+    sim_delta_t : double
+        the time horizon in years
+    vol_delta_t : double
+        the time horizon of the vol data in years (defaulted to sim horizon)
+
+    Returns
+    =======
+    cov_matrix : numpy array
+        the covariance matrix of the risk factors
+    '''
+    if vol_delta_t == None:
+        vol_delta_t = sim_delta_t
+    lower_cholesky = finScenarios.covariance_cholesky(corr_matrix,
+                                                      std_dev_vector)
+    return (1.0 * sim_delta_t / vol_delta_t) * np.dot(
+        lower_cholesky, np.transpose(lower_cholesky))
+
+
+# -----------------------------------------------------------------------------
+# Testing
+# -----------------------------------------------------------------------------
+if __name__ == '__main__':
+    print('\nTesting the delta-gamma moments against a simulation...')
+    rng = np.random.RandomState(0)
+    A = rng.normal(size=(4, 4))
+    cov_matrix = np.dot(A, A.T) / 4 + 0.2 * np.eye(4)
+    delta = np.array([1.0, -0.5, 0.8, 0.3])
+    B = rng.normal(size=(4, 4))
+    gamma = B + B.T
+    moments = delta_gamma_moments(delta, cov_matrix, gamma)
+
+    X = np.dot(rng.normal(size=(2000000, 4)),
+               np.linalg.cholesky(cov_matrix).T)
+    PnL = np.dot(X, delta) + 0.5 * np.sum(np.dot(X, gamma) * X, axis=1)
+    std_dev = np.std(PnL)
+    sim_moments = (np.mean(PnL), std_dev,
+                   np.mean((PnL - np.mean(PnL)) ** 3) / std_dev ** 3,
+                   np.mean((PnL - np.mean(PnL)) ** 4) / std_dev ** 4 - 3)
+    for name, x, y in zip(['Mean', 'Std Dev', 'Skew', 'Ex Kurt'], moments,
+                          sim_moments):
+        print(name + ':\t' + str(x) + '\t(simulated ' + str(y) + ')')
+        assert abs(x - y) < 0.03 * max(abs(y), 1)
@@ -0,0 +1,222 @@
+#
+# Functions for backtesting Value-At-Risk (VaR) estimates
+#
+
+import numpy as np
+import pandas as pd
+from scipy.special import xlogy
+from scipy.stats import binom, chi2
+from MarketRisk import MarketVaR
+
+# Cumulative binomial probabilities of the number of breaches bounding the
+# green and yellow zones of the traffic light test
+TRAFFIC_LIGHT_BOUNDS = [('Green', 0.95), ('Yellow', 0.9999)]
+
+
+def backtest_rolling_VaR(PnL_series, alpha, num_days=250, VaR_window=250):
+    '''
+    backtest_rolling_VaR(PnL_series, alpha, num_days=250, VaR_window=250)
+
+    Functionality
+    =============
+    Backtests the historic simulation VaR re-estimated on each of the last
+    num_days days. The VaR of a day is the alpha quantile of the P&L of the
+    VaR_window days before it and is compared with the P&L of the day. The
+    estimates of all the days come from one rolling pass over a single
+    historic P&L series (see generate_historic_PnL_series)
+
+    Parameters
+    ==========
+    PnL_series : pandas series
+        the historic P&L of the portfolio indexed by date
+    alpha : double
+        quantile used for the VaR calculation (between 0 and 1)
+    num_days : int
+        the number of days in the backtesting period
+    VaR_window : int
+        the number of days used to estimate each VaR
+
+    Returns
+    =======
+    backtest : pandas dataframe
+        the P&L, VaR and breach (Col) of each day (Rows)
+    summary : pandas series
+        the coverage tests of the backtest (see backtest_VaR_series)
+    '''
+    PnL_series = pd.Series(PnL_series).astype(float)
+    rolling_VaR = MarketVaR.calculate_rolling_VaR_from_PnL(PnL_series, alpha,
+                                                           VaR_window)
+
+    # The VaR estimated at the end of a day is used for the next day
+    VaR = rolling_VaR['VaR'].reindex(PnL_series.index).shift(1)
+    VaR = VaR.dropna().tail(int(num_days))
+
+    return backtest_VaR_series(PnL_series[VaR.index], VaR, alpha)
+
+
+def backtest_VaR_series(PnL, VaR, alpha):
+    '''
+    backtest_VaR_series(PnL, VaR, alpha)
+
+    Functionality
+    =============
+    Backtests a series of VaR estimates against the P&L realised on the same
+    days. A breach is a P&L below the VaR. The summary has the Kupiec
+    proportion of failures test, the Christoffersen independence test, the
+    combined conditional coverage test and the traffic light zone. The
+    number of breaches can be passed to calculate_capital_factor
+
+    Parameters
+    ==========
+    PnL : pandas series or numpy array
+        the P&L of each day
+    VaR : pandas series, numpy array or double
+        the VaR of each day (or one VaR for every day)
+    alpha : double
+        quantile used for the VaR calculation (between 0 and 1)
+
+    Returns
+    =======
+    backtest : pandas dataframe
+        the P&L, VaR and breach (Col) of each day (Rows)
+    summary : pandas series
+        the number of observations and breaches, the test statistics and
+        p-values and the traffic light zone
+    '''
+    index = PnL.index if isinstance(PnL, pd.Series) else None
+    PnL = np.ravel(np.asarray(PnL, float))
+    VaR = np.broadcast_to(np.asarray(VaR, float), PnL.shape)
+    breaches = PnL < VaR
+
+    backtest = pd.DataFrame({'PnL': PnL, 'VaR': VaR, 'Breach': breaches},
+                            index=index, columns=['PnL', 'VaR', 'Breach'])
+
+    num_obs = len(breaches)
+    num_breaches = int(np.sum(breaches))
+    POF_LR, POF_pvalue = kupiec_POF_test(num_obs, num_breaches, alpha)
+    ind_LR, ind_pvalue = christoffersen_independence_test(breaches)
+    cc_LR = POF_LR + ind_LR
+
+    summary = pd.Series([num_obs, num_breaches, alpha * num_obs, POF_LR,
+                         POF_pvalue, ind_LR, ind_pvalue, cc_LR,
+                         chi2.sf(cc_LR, 2),
+                         traffic_light_zone(num_obs, num_breaches, alpha)],
+                        index=['Observations', 'Breaches', 'Expected',
+                               'Kupiec_LR', 'Kupiec_pvalue',
+                               'Christoffersen_LR', 'Christoffersen_pvalue',
+                               'Conditional_LR', 'Conditional_pvalue',
+                               'Zone'],
+                        dtype=object)
+
+    return backtest, summary
+
+
+def kupiec_POF_test(num_obs, num_breaches, alpha):
+    '''
+    kupiec_POF_test(num_obs, num_breaches, alpha)
+
+    Functionality
+    =============
+    Kupiec proportion of failures test that the probability of a breach is
+    alpha. The likelihood ratio is chi-squared with 1 degree of freedom
+
+    Parameters
+    ==========
+    num_obs : int
+        the number of days backtested
+    num_breaches : int
+        the number of breaches
+    alpha : double
+        quantile used for the VaR calculation (between 0 and 1)
+
+    Returns
+    =======
+    LR : double
+        the likelihood ratio statistic
+    pvalue : double
+        the p-value of the test
+    '''
+    if num_obs == 0:
+        return 0.0, 1.0
+    x = num_breaches
+    n = num_obs
+    rate = 1.0 * x / n
+    LR = -2 * (xlogy(n - x, 1 - alpha) + xlogy(x, alpha) -
+               xlogy(n - x, 1 - rate) - xlogy(x, rate))
+    LR = max(LR, 0.0)
+    return LR, chi2.sf(LR, 1)
+
+
+def christoffersen_independence_test(breaches):
+    '''
+    christoffersen_independence_test(breaches)
+
+    Functionality
+    =============
+    Christoffersen test that a breach is as likely after a breach as after a
+    day without one (i.e. the breaches do not cluster). The likelihood ratio
+    of the first order Markov chain of the breaches is chi-squared with 1
+    degree of freedom
+
+    Parameters
+    ==========
+    breaches : numpy array of bool
+        the breach of each day in order
+
+    Returns
+    =======
+    LR : double
+        the likelihood ratio statistic
+    pvalue : double
+        the p-value of the test
+    '''
+    breaches = np.asarray(breaches, bool)
+    if len(breaches) < 2:
+        return 0.0, 1.0
+    prev = breaches[:-1]
+    curr = breaches[1:]
+    n00 = np.sum(~prev & ~curr)
+    n01 = np.sum(~prev & curr)
+    n10 = np.sum(prev & ~curr)
+    n11 = np.sum(prev & curr)
+
+    pi0 = 1.0 * n01 / max(n00 + n01, 1)
+    pi1 = 1.0 * n11 / max(n10 + n11, 1)
+    pi = 1.0 * (n01 + n11) / (n00 + n01 + n10 + n11)
+    LR = -2 * (xlogy(n00 + n10, 1 - pi) + xlogy(n01 + n11, pi) -
+               xlogy(n00, 1 - pi0) - xlogy(n01, pi0) -
+               xlogy(n10, 1 - pi1) - xlogy(n11, pi1))
+    LR = max(LR, 0.0)
+    return LR, chi2.sf(LR, 1)
+
+
+def traffic_light_zone(num_obs, num_breaches, alpha):
+    '''
+    traffic_light_zone(num_obs, num_breaches, alpha)
+
+    Functionality
+    =============
+    Basel traffic light zone of a backtest. The zone is green while the
+    binomial probability of at most num_breaches breaches is below 95%,
+    yellow while it is below 99.99% and red otherwise (0-4, 5-9 and 10 or
+    more breaches for 250 days at 99%)
+
+    Parameters
+    ==========
+    num_obs : int
+        the number of days backtested
+    num_breaches : int
+        the number of breaches
+    alpha : double
+        quantile used for the VaR calculation (between 0 and 1)
+
+    Returns
+    =======
+    zone : str
+        'Green', 'Yellow' or 'Red'
+    '''
+    cum_prob = binom.cdf(num_breaches, num_obs, alpha)
+    for zone, bound in TRAFFIC_LIGHT_BOUNDS:
+        if cum_prob < bound:
+            return zone
+    return 'Red'
@@ -1,2 +1,4 @@
 from MarketRisk.MarginalVaR import *
 from MarketRisk.MarketVaR import *
+from MarketRisk.ParametricVaR import *
+from MarketRisk.VaRBacktesting import *
@@ -0,0 +1,272 @@
+###
+# Cached factorization of the risk factor covariance matrix. The lower
+# Cholesky factor is keyed on a hash of the correlation matrix and the
+# volatility vector so that it is computed (and repaired if required) once
+# and reused by every simulation in the process and across processes.
+###
+
+import os
+import hashlib
+import tempfile
+import numpy as np
+from scipy.linalg import cholesky
+
+# Default location of the on-disk cache of lower Cholesky factors
+COVARIANCE_CACHE_DIR = os.path.join(tempfile.gettempdir(),
+                                    'FinancialRiskManagement',
+                                    'CovarianceCache')
+
+# Factorizations already computed by this process
+_FACTORIZATION_CACHE = {}
+
+
+class CovarianceFactorization(object):
+    '''
+    CovarianceFactorization(object)
+
+    Class holding the lower Cholesky factor of the covariance matrix built
+    from a correlation matrix and a vector of volatilities. If the
+    correlation matrix is not positive definite it is first replaced by the
+    nearest correlation matrix (Higham's alternating projections) with its
+    eigenvalues clipped to a small positive floor.
+
+    Attributes
+    ==========
+    key : str
+        hash of the factor names, correlation matrix and volatility vector
+    factor_names : list of str
+        the risk factors in the order of the rows of the factor
+    lower_cholesky : numpy array
+        the lower Cholesky factor of the covariance matrix
+    repaired : bool
+        True if the correlation matrix had to be repaired to be factorized
+
+    Methods
+    =======
+    get_key :
+        returns the hash key of the factorization
+    get_factor_names :
+        returns the risk factors of the factorization
+    get_lower_cholesky :
+        returns the lower Cholesky factor of the covariance matrix
+    get_cov_matrix :
+        returns the (repaired) covariance matrix
+    is_repaired :
+        returns True if the correlation matrix was repaired
+    '''
+
+    # -------------------------------------------------------------------------
+    # Object Definition
+    # -------------------------------------------------------------------------
+    def __init__(self, corr_matrix, std_dev_vector, cache_dir=None):
+        self.factor_names = [str(x) for x in list(corr_matrix)]
+        corr_matrix = np.asarray(corr_matrix, float)
+        std_dev_vector = np.ravel(np.asarray(std_dev_vector, float))
+        self.key = covariance_key(self.factor_names, corr_matrix,
+                                  std_dev_vector)
+        self.repaired = False
+
+        # Load the factor from disk if it was stored by a previous run,
+        # together with whether the correlation matrix was repaired
+        file_name = None
+        if cache_dir != None:
+            file_name = os.path.join(cache_dir, self.key + '.npz')
+            if os.path.isfile(file_name):
+                with np.load(file_name) as stored:
+                    self.lower_cholesky = stored['lower_cholesky']
+                    self.repaired = bool(stored['repaired'])
+                return
+
+        # Factorize the correlation matrix and scale by the volatilities
+        try:
+            lower_corr = cholesky(corr_matrix, lower=True)
+        except np.linalg.LinAlgError:
+            corr_matrix = nearest_correlation_matrix(corr_matrix)
+            lower_corr = cholesky(corr_matrix, lower=True)
+            self.repaired = True
+        self.lower_cholesky = std_dev_vector[:, np.newaxis] * lower_corr
+
+        if file_name != None:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            # Write to a temporary file first so readers never see a partial
+            # factor
+            tmp_name = file_name + '.' + str(os.getpid()) + '.tmp.npz'
+            np.savez(tmp_name, lower_cholesky=self.lower_cholesky,
+                     repaired=self.repaired)
+            os.rename(tmp_name, file_name)
+
+    # -------------------------------------------------------------------------
+    # Basic getter functions
+    # -------------------------------------------------------------------------
+    def get_key(self):
+        return self.key
+
+    def get_factor_names(self):
+        return self.factor_names
+
+    def get_lower_cholesky(self):
+        return self.lower_cholesky
+
+    def get_cov_matrix(self):
+        return np.dot(self.lower_cholesky, np.transpose(self.lower_cholesky))
+
+    def is_repaired(self):
+        return self.repaired
+
+
+def get_covariance_factorization(corr_matrix, std_dev_vector,
+                                 cache_dir=COVARIANCE_CACHE_DIR):
+    '''
+    get_covariance_factorization(corr_matrix, std_dev_vector,
+                                 cache_dir=COVARIANCE_CACHE_DIR)
+
+    Functionality
+    =============
+    Returns the factorization of the covariance matrix built from corr_matrix
+    and std_dev_vector. The factorization is looked up in the process cache,
+    then in cache_dir on disk, and is only computed if neither has it.
+
+    Parameters
+    ==========
+    corr_matrix : pandas dataframe
+        correlation matrix of the risk factor time series
+    std_dev_vector : pandas dataframe
+        standard deviations of the risk factor time series
+    cache_dir : str
+        directory of the on-disk cache (None to not use the disk)
+
+    Returns
+    =======
+    factorization : CovarianceFactorization object
+        the cached factorization of the covariance matrix
+    '''
+    key = covariance_key([str(x) for x in list(corr_matrix)],
+                         np.asarray(corr_matrix, float),
+                         np.ravel(np.asarray(std_dev_vector, float)))
+    if key not in _FACTORIZATION_CACHE:
+        _FACTORIZATION_CACHE[key] = CovarianceFactorization(
+            corr_matrix, std_dev_vector, cache_dir)
+    return _FACTORIZATION_CACHE[key]
+
+
+def clear_covariance_cache():
+    # Only clears the factorizations held by this process
+    _FACTORIZATION_CACHE.clear()
+
+
+def covariance_key(factor_names, corr_matrix, std_dev_vector):
+    '''
+    covariance_key(factor_names, corr_matrix, std_dev_vector)
+
+    Functionality
+    =============
+    Hash of the inputs of a covariance factorization
+
+    Parameters
+    ==========
+    factor_names : list of str
+        the names of the risk factors
+    corr_matrix : numpy array
+        correlation matrix of the risk factors
+    std_dev_vector : numpy array
+        standard deviations of the risk factors
+
+    Returns
+    =======
+    key : str
+        the hexadecimal SHA-1 digest of the inputs
+    '''
+    sha = hashlib.sha1()
+    sha.update('|'.join(factor_names).encode('utf-8'))
+    sha.update(np.ascontiguousarray(corr_matrix, float).tobytes())
+    sha.update(np.ascontiguousarray(std_dev_vector, float).tobytes())
+    return sha.hexdigest()
+
+
+def nearest_correlation_matrix(corr_matrix, tol=1e-10, max_iter=100,
+                               eig_floor=1e-8):
+    '''
+    nearest_correlation_matrix(corr_matrix, tol=1e-10, max_iter=100,
+                               eig_floor=1e-8)
+
+    Functionality
+    =============
+    Finds the nearest correlation matrix (in the Frobenius norm) using
+    Higham's alternating projections with Dykstra's correction. The
+    eigenvalues of the result are then clipped to eig_floor and the unit
+    diagonal restored so that the matrix is strictly positive definite.
+
+    Parameters
+    ==========
+    corr_matrix : numpy array
+        a symmetric matrix with unit diagonal
+    tol : double
+        the convergence tolerance of the projections
+    max_iter : int
+        the maximum number of projections
+    eig_floor : double
+        the smallest eigenvalue allowed in the result
+
+    Returns
+    =======
+    corr_matrix : numpy array
+        the repaired correlation matrix
+    '''
+    Y = (np.asarray(corr_matrix, float) +
+         np.transpose(np.asarray(corr_matrix, float))) / 2.0
+    dS = np.zeros(Y.shape)
+
+    for ii in range(max_iter):
+        # Project onto the positive semi-definite matrices
+        R = Y - dS
+        eig_val, eig_vect = np.linalg.eigh(R)
+        X = np.dot(eig_vect * np.maximum(eig_val, 0), np.transpose(eig_vect))
+        dS = X - R
+
+        # Project onto the matrices with unit diagonal
+        Y_prev = Y
+        Y = X.copy()
+        np.fill_diagonal(Y, 1.0)
+
+        if np.linalg.norm(Y - Y_prev) <= tol * np.linalg.norm(Y):
+            break
+
+    # Clip the eigenvalues so the Cholesky decomposition exists
+    eig_val, eig_vect = np.linalg.eigh(Y)
+    Y = np.dot(eig_vect * np.maximum(eig_val, eig_floor),
+               np.transpose(eig_vect))
+    scale = 1.0 / np.sqrt(np.diag(Y))
+    Y = Y * np.outer(scale, scale)
+
+    return (Y + np.transpose(Y)) / 2.0
+
+
+# -----------------------------------------------------------------------------
+# Testing
+# -----------------------------------------------------------------------------
+if __name__ == '__main__':
+    import pandas as pd
+
+    print('\nTesting CovarianceFactorization.py...')
+    cache_dir = tempfile.mkdtemp()
+    names = ['A', 'B', 'C']
+    corr_matrix = pd.DataFrame([[1.0, 0.9, -0.9], [0.9, 1.0, 0.9],
+                                [-0.9, 0.9, 1.0]], index=names, columns=names)
+    std_dev_vector = pd.DataFrame([[0.1, 0.2, 0.3]], columns=names)
+
+    # The repaired flag survives a reload of the factor from disk
+    factorization = CovarianceFactorization(corr_matrix, std_dev_vector,
+                                            cache_dir)
+    reloaded = CovarianceFactorization(corr_matrix, std_dev_vector, cache_dir)
+    assert factorization.is_repaired() and reloaded.is_repaired()
+    assert np.array_equal(factorization.get_lower_cholesky(),
+                          reloaded.get_lower_cholesky())
+    print('Repaired factor reloaded from disk: ' +
+          str(reloaded.is_repaired()))
+
+    corr_matrix = pd.DataFrame(np.eye(3), index=names, columns=names)
+    CovarianceFactorization(corr_matrix, std_dev_vector, cache_dir)
+    reloaded = CovarianceFactorization(corr_matrix, std_dev_vector, cache_dir)
+    assert not reloaded.is_repaired()
+    print('Valid factor reloaded from disk: ' + str(reloaded.is_repaired()))
@@ -0,0 +1,263 @@
+###
+# Filtered historical simulation. The historic returns of each risk factor
+# are divided by their EWMA or GARCH(1,1) conditional volatility on the day
+# and rescaled by the current volatility, so the historic scenarios reflect
+# today's volatility rather than the volatility when they happened
+###
+
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+from HistoricScenarios import historic_between_dates
+
+# Volatility models available to filter the historic returns
+VOLATILITY_MODELS = ['ewma', 'garch']
+
+
+class VolatilityFilter(object):
+    '''
+    VolatilityFilter(object)
+
+    Class holding the conditional variances of the daily returns of the risk
+    factors. The variance of day t is forecast from the returns up to day
+    t - 1 with sigma2[t] = omega + alpha * r[t - 1] ** 2 + beta * sigma2[t - 1]
+    for every factor at once. EWMA is the case omega = 0, alpha = 1 - decay
+    and beta = decay. GARCH(1,1) is not estimated by maximum likelihood: alpha
+    and beta are fixed inputs shared by all the factors, and each factor only
+    has its omega fitted by variance targeting, omega = (1 - alpha - beta) *
+    the sample variance of the factor. The first variance is the sample
+    variance. Appending a day only updates the last variance, so the filter
+    never needs to be refitted.
+
+    Attributes
+    ==========
+    method : str
+        the volatility model ('ewma' or 'garch')
+    factor_names : list of str
+        the risk factors
+    omega : numpy array
+        the constant of the variance recursion of each factor
+    alpha : double
+        the weight of the last squared return
+    beta : double
+        the weight of the last variance
+    dates : list of datetime
+        the dates of the returns
+    next_variance : numpy array
+        the variance forecast for the day after the last return
+
+    Methods
+    =======
+    get_method :
+        returns the volatility model
+    get_factor_names :
+        returns the risk factors
+    get_dates :
+        returns the dates of the returns
+    get_num_days :
+        returns the number of days of returns
+    get_returns :
+        returns the matrix of returns (Rows=Dates; Col=Factors)
+    get_variances :
+        returns the conditional variance of each return
+    get_residuals :
+        returns the devolatilised returns
+    get_current_vol :
+        returns the volatility forecast for the next day
+    update :
+        appends the returns of a new day
+    generate_scenarios :
+        returns the filtered historic scenarios rescaled to the current vol
+    '''
+
+    # -------------------------------------------------------------------------
+    # Object Definition
+    # -------------------------------------------------------------------------
+    def __init__(self, returns, method='ewma', decay=0.94, garch_alpha=0.05,
+                 garch_beta=0.9):
+        if method not in VOLATILITY_MODELS:
+            raise ValueError('Volatility model must be one of ' +
+                             str(VOLATILITY_MODELS) + ' (given ' +
+                             str(method) + ')')
+        self.method = method
+        self.factor_names = list(returns)
+        self.dates = list(returns.index)
+        values = np.asarray(returns, float)
+        sample_var = np.var(values, axis=0)
+
+        if method == 'ewma':
+            self.omega = np.zeros(len(self.factor_names))
+            self.alpha = 1.0 - decay
+            self.beta = decay
+        else:
+            self.omega = (1.0 - garch_alpha - garch_beta) * sample_var
+            self.alpha = garch_alpha
+            self.beta = garch_beta
+
+        # The returns and variances are kept in buffers that grow by doubling
+        # so that appending a day is cheap
+        self._returns = values.copy()
+        self._variances = variance_recursion(values, self.omega, self.alpha,
+                                             self.beta, sample_var)
+        self._num_days = len(values)
+        if self._num_days > 0:
+            self.next_variance = (self.omega + self.alpha * values[-1] ** 2 +
+                                  self.beta * self._variances[-1])
+        else:
+            self.next_variance = sample_var
+
+    # -------------------------------------------------------------------------
+    # Basic getter functions
+    # -------------------------------------------------------------------------
+    def get_method(self):
+        return self.method
+
+    def get_factor_names(self):
+        return self.factor_names
+
+    def get_dates(self):
+        return self.dates
+
+    def get_num_days(self):
+        return self._num_days
+
+    def get_returns(self):
+        return self._returns[:self._num_days]
+
+    def get_variances(self):
+        return self._variances[:self._num_days]
+
+    def get_residuals(self):
+        variances = self.get_variances()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(variances > 0,
+                            self.get_returns() / np.sqrt(variances), 0.0)
+
+    def get_current_vol(self):
+        return pd.Series(np.sqrt(self.next_variance), index=self.factor_names)
+
+    # -------------------------------------------------------------------------
+    # Append the returns of a new day. Its variance is the forecast already
+    # made and only the forecast for the next day is updated
+    # -------------------------------------------------------------------------
+    def update(self, date, new_returns):
+        if isinstance(new_returns, (pd.Series, dict)):
+            new_returns = [new_returns[name] for name in self.factor_names]
+        new_returns = np.ravel(np.asarray(new_returns, float))
+
+        if self._num_days == len(self._returns):
+            capacity = max(2 * len(self._returns), 1)
+            self._returns = _grow(self._returns, capacity)
+            self._variances = _grow(self._variances, capacity)
+        self._returns[self._num_days] = new_returns
+        self._variances[self._num_days] = self.next_variance
+        self._num_days += 1
+        self.dates.append(date)
+
+        self.next_variance = (self.omega + self.alpha * new_returns ** 2 +
+                              self.beta * self.next_variance)
+
+    # -------------------------------------------------------------------------
+    # The filtered historic scenarios (Rows=Dates; Col=Factors) of the last
+    # num_scenarios days (None for all the days)
+    # -------------------------------------------------------------------------
+    def generate_scenarios(self, num_scenarios=None):
+        rows = slice(0, self._num_days)
+        if num_scenarios != None:
+            rows = slice(max(self._num_days - int(num_scenarios), 0),
+                         self._num_days)
+        scenarios = self.get_residuals()[rows] * np.sqrt(self.next_variance)
+        return pd.DataFrame(scenarios, columns=self.factor_names,
+                            index=pd.Index(self.dates[rows], name='Date'))
+
+
+def variance_recursion(returns, omega, alpha, beta, first_variance):
+    '''
+    variance_recursion(returns, omega, alpha, beta, first_variance)
+
+    Functionality
+    =============
+    Conditional variances sigma2[t] = omega + alpha * r[t - 1] ** 2 + beta *
+    sigma2[t - 1] of every day and factor, with sigma2[0] = first_variance.
+    The recursion is applied to all the factors at once as a linear filter
+    along the dates
+
+    Parameters
+    ==========
+    returns : numpy array
+        the returns (Rows=Dates; Col=Factors)
+    omega : numpy array
+        the constant of each factor
+    alpha : double
+        the weight of the last squared return
+    beta : double
+        the weight of the last variance
+    first_variance : numpy array
+        the variance of the first day
+
+    Returns
+    =======
+    variances : numpy array
+        the conditional variance of each return
+    '''
+    returns = np.asarray(returns, float)
+    if len(returns) == 0:
+        return np.zeros(returns.shape)
+
+    # The input of the filter on day t is omega + alpha * r[t - 1] ** 2
+    inputs = np.empty(returns.shape)
+    inputs[0] = first_variance
+    inputs[1:] = omega + alpha * returns[:-1] ** 2
+
+    return lfilter([1.0], [1.0, -beta], inputs, axis=0)
+
+
+def filtered_historic_scenarios(num_scenarios=None, end_date=None,
+                                start_date=None, method='ewma', decay=0.94,
+                                garch_alpha=0.05, garch_beta=0.9):
+    '''
+    filtered_historic_scenarios(num_scenarios=None, end_date=None,
+                                start_date=None, method='ewma', decay=0.94,
+                                garch_alpha=0.05, garch_beta=0.9)
+
+    Functionality
+    =============
+    This returns filtered historic scenarios. The volatility of the risk
+    factors is estimated over the whole history up to end_date and the
+    returns of the last num_scenarios days are rescaled to the current
+    volatility. The GARCH(1,1) weights are given rather than estimated (see
+    VolatilityFilter). The scenarios can be passed to
+    generate_PnL_distribution
+
+    Parameters
+    ==========
+    num_scenarios : int
+        the number of scenarios to return (None for the whole history)
+    end_date : datetime
+        the end date for the historic scenarios
+    start_date : datetime
+        the start of the history used to estimate the volatility
+    method : str
+        the volatility model (one of VOLATILITY_MODELS)
+    decay : double
+        the decay factor of the EWMA
+    garch_alpha : double
+        the fixed weight of the last squared return of the GARCH(1,1)
+    garch_beta : double
+        the fixed weight of the last variance of the GARCH(1,1)
+
+    Returns
+    =======
+    scenarios : pandas dataframe
+        a pandas matrix of filtered historic scenarios indexed by date
+    '''
+    returns = historic_between_dates(start_date, end_date)
+    vol_filter = VolatilityFilter(returns, method, decay, garch_alpha,
+                                  garch_beta)
+    return vol_filter.generate_scenarios(num_scenarios)
+
+
+def _grow(values, capacity):
+    grown = np.zeros((capacity,) + values.shape[1:])
+    grown[:len(values)] = values
+    return grown
@@ -3,7 +3,8 @@
 # sensitivities, and scenario analysis
 ###
 
-from MarketData import MarketEnvironment
+import numpy as np
+from MarketData import MarketEnvironmentOverlay
 
 
 def apply_mkt_shock(mkt_env, strspec, change, abs_flag=True):
@@ -34,88 +35,7 @@ def apply_mkt_shock(mkt_env, strspec, change, abs_flag=True):
     a new market environment with the change applied
     '''
 
-    val_date = mkt_env.get_val_date()
-    mkt_env_new = MarketEnvironment('Output_Environment', val_date)
-    mkt_env_new.initialize_from_env(mkt_env)
-
-    ss = strspec.split('-')
-    stype = ss[0]
-    skey = ''
-
-    if stype == 'Curves':
-        for s in ss[1:-1]:
-            skey += s + '-'
-        skey = skey[:-1]
-        srow = ss[-1]
-        curve = mkt_env_new.get_curve(skey)
-        val = (curve.iloc[0]).loc[srow]
-        if abs_flag:
-            new_val = val + change
-        else:
-            new_val = val * (1 + change)
-        new_curve = curve.copy()
-        (new_curve.iloc[0]).loc[srow] = new_val
-        mkt_env_new.add_curve(skey, new_curve)
-
-    elif stype == 'Lists':
-        for s in ss[1:-1]:
-            skey += s + '-'
-        skey = skey[:-1]
-        srow = ss[-1]
-        slist = mkt_env_new.get_list(skey)
-        val = (slist.iloc[0]).loc[srow]
-        if abs_flag:
-            new_val = val + change
-        else:
-            new_val = val * (1 + change)
-        new_list = slist.copy()
-        (new_list.iloc[0]).loc[srow] = new_val
-        mkt_env_new.add_list(skey, new_list)
-
-    elif stype == 'Surfaces':
-        for s in ss[1:-2]:
-            skey += s + '-'
-        skey = skey[:-1]
-        scol = ss[-1]
-        srow = ss[-2]
-        surf = mkt_env_new.get_surface(skey)
-        val = (surf.loc[srow]).loc[scol]
-        if abs_flag:
-            new_val = val + change
-        else:
-            new_val = val * (1 + change)
-        new_surf = surf.copy()
-        (new_surf.loc[srow]).loc[scol] = new_val
-        mkt_env_new.add_surface(skey, new_surf)
-
-    elif stype == 'Matrices':
-        for s in ss[1:-2]:
-            skey += s + '-'
-        skey = skey[:-1]
-        scol = ss[-1]
-        srow = ss[-2]
-        mat = mkt_env_new.get_matrix(skey)
-        val = (mat.loc[srow]).loc[scol]
-        if abs_flag:
-            new_val = val + change
-        else:
-            new_val = val * (1 + change)
-        new_mat = mat.copy()
-        (new_mat.loc[srow]).loc[scol] = new_val
-        mkt_env_new.add_matrix(skey, new_mat)
-
-    else:  # constants
-        for s in ss[1:]:
-            skey += s + '-'
-        skey = skey[:-1]
-        val = mkt_env_new.get_constant(skey)
-        if abs_flag:
-            new_val = val + change
-        else:
-            new_val = val * (1 + change)
-        mkt_env_new.add_constant(skey, new_val)
-
-    return mkt_env_new
+    return apply_mkt_scenario(mkt_env, {strspec: change}, abs_flag)
 
 
 def apply_mkt_scenario(mkt_env, scenario, abs_flag=True):
@@ -140,87 +60,32 @@ def apply_mkt_scenario(mkt_env, scenario, abs_flag=True):
     =======
     a new market environment with the scenario applied
     '''
-    val_date = mkt_env.get_val_date()
-    mkt_env_new = MarketEnvironment('Output_Environment', val_date)
-    mkt_env_new.initialize_from_env(mkt_env)
-
-    for name, change in scenario.items():
-        # for example, strspec = Curves-RiskFree-CDOR-CAD-0.25
-        ss = name.split('-')
-        stype = ss[0]
-        skey = ''
-
-        if stype == 'Curves':
-            for s in ss[1:-1]:
-                skey += s + '-'
-            skey = skey[:-1]
-            srow = ss[-1]
-            curve = mkt_env_new.get_curve(skey)
-            val = (curve.iloc[0]).loc[srow]
-            if abs_flag:
-                new_val = val + change
-            else:
-                new_val = val * (1 + change)
-            new_curve = curve.copy()
-            (new_curve.iloc[0]).loc[srow] = new_val
-            mkt_env_new.add_curve(skey, new_curve)
-
-        elif stype == 'Lists':
-            for s in ss[1:-1]:
-                skey += s + '-'
-            skey = skey[:-1]
-            srow = ss[-1]
-            slist = mkt_env_new.get_list(skey)
-            val = (slist.iloc[0]).loc[srow]
-            if abs_flag:
-                new_val = val + change
-            else:
-                new_val = val * (1 + change)
-            new_list = slist.copy()
-            (new_list.iloc[0]).loc[srow] = new_val
-            mkt_env_new.add_list(skey, new_list)
-
-        elif stype == 'Surfaces':
-            for s in ss[1:-2]:
-                skey += s + '-'
-            skey = skey[:-1]
-            scol = ss[-1]
-            srow = ss[-2]
-            surf = mkt_env_new.get_surface(skey)
-            val = (surf.loc[srow]).loc[scol]
-            if abs_flag:
-                new_val = val + change
-            else:
-                new_val = val * (1 + change)
-            new_surf = surf.copy()
-            (new_surf.loc[srow]).loc[scol] = new_val
-            mkt_env_new.add_surface(skey, new_surf)
-
-        elif stype == 'Matrices':
-            for s in ss[1:-2]:
-                skey += s + '-'
-            skey = skey[:-1]
-            scol = ss[-1]
-            srow = ss[-2]
-            mat = mkt_env_new.get_matrix(skey)
-            val = (mat.loc[srow]).loc[scol]
-            if abs_flag:
-                new_val = val + change
-            else:
-                new_val = val * (1 + change)
-            new_mat = mat.copy()
-            (new_mat.loc[srow]).loc[scol] = new_val
-            mkt_env_new.add_matrix(skey, new_mat)
-
-        else:  # constants
-            for s in ss[1:]:
-                skey += s + '-'
-            skey = skey[:-1]
-            val = mkt_env_new.get_constant(skey)
-            if abs_flag:
-                new_val = val + change
-            else:
-                new_val = val * (1 + change)
+    # The new environment is an overlay holding only the shocked factors
+    mkt_env_new = MarketEnvironmentOverlay(mkt_env, 'Output_Environment')
+
+    # Look up the risk factors in the index of the market environment (the
+    # names are only parsed once) and update each container a single time
+    risk_factor_index = mkt_env.get_risk_factor_index()
+    names = list(scenario.keys())
+    changes = np.array([scenario[name] for name in names], float)
+    groups = risk_factor_index.group_by_container(names)
+
+    for (stype, skey), (pos, rows, cols) in groups.items():
+        if stype == 'Constants':
+            new_val = mkt_env_new.get_constant(skey)
+            for change in changes[pos]:
+                if abs_flag:
+                    new_val = new_val + change
+                else:
+                    new_val = new_val * (1 + change)
             mkt_env_new.add_constant(skey, new_val)
+            continue
+
+        values = mkt_env_new.get_factor_values(stype, skey, rows, cols)
+        if abs_flag:
+            values = values + changes[pos]
+        else:
+            values = values * (1 + changes[pos])
+        mkt_env_new.set_factor_values(stype, skey, rows, cols, values)
 
     return mkt_env_new
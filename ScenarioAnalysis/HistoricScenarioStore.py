@@ -0,0 +1,216 @@
+###
+# Columnar, date-indexed store of the historic risk factor scenarios. The
+# Excel repository is imported once into a directory of NumPy files (a
+# memory-mapped matrix of the scenarios, the sorted dates and the risk factor
+# names) so date ranges are found by binary search and sliced without
+# copying or re-reading the repository
+###
+
+import os
+import json
+import numpy as np
+import pandas as pd
+
+# Files of a historic scenario store
+STORE_VALUES_FILE = 'values.npy'
+STORE_DATES_FILE = 'dates.npy'
+STORE_FACTORS_FILE = 'factors.json'
+
+# Stores already opened by this process (by directory)
+_STORE_CACHE = {}
+
+
+class HistoricScenarioStore(object):
+    '''
+    HistoricScenarioStore(object)
+
+    Class giving access to a historic scenario store on disk. The matrix of
+    scenarios (Rows=Dates; Col=Factors) is memory-mapped, so opening the
+    store reads no data and the scenarios between two dates are a view of
+    the rows found by binary search on the sorted dates. The scenarios are
+    returned read-only and must be copied before they are modified.
+
+    Attributes
+    ==========
+    store_dir : str
+        the directory of the store
+    dates : numpy array of datetime64
+        the sorted dates of the scenarios
+    factor_names : list of str
+        the risk factors of the columns of the scenarios
+    values : numpy memmap
+        the scenarios (Rows=Dates; Col=Factors)
+
+    Methods
+    =======
+    get_store_dir :
+        returns the directory of the store
+    get_dates :
+        returns the dates of the scenarios
+    get_factor_names :
+        returns the risk factors of the scenarios
+    get_values :
+        returns the matrix of all the scenarios
+    get_num_scenarios :
+        returns the number of scenarios in the store
+    get_date_slice :
+        returns the rows of the scenarios after a date up to a date
+    between_dates :
+        returns the scenarios after a start date up to an end date
+    specified_amt :
+        returns a number of scenarios ending on a date
+    '''
+
+    # -------------------------------------------------------------------------
+    # Object Definition
+    # -------------------------------------------------------------------------
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.dates = np.load(os.path.join(store_dir, STORE_DATES_FILE))
+        self.values = np.load(os.path.join(store_dir, STORE_VALUES_FILE),
+                              mmap_mode='r')
+        with open(os.path.join(store_dir, STORE_FACTORS_FILE), 'r') as f:
+            self.factor_names = json.load(f)
+
+    # -------------------------------------------------------------------------
+    # Basic getter functions
+    # -------------------------------------------------------------------------
+    def get_store_dir(self):
+        return self.store_dir
+
+    def get_dates(self):
+        return self.dates
+
+    def get_factor_names(self):
+        return self.factor_names
+
+    def get_values(self):
+        return self.values
+
+    def get_num_scenarios(self):
+        return len(self.dates)
+
+    # -------------------------------------------------------------------------
+    # Binary search for the rows dated after start_date up to end_date
+    # (either can be None for the start or the end of the history)
+    # -------------------------------------------------------------------------
+    def get_date_slice(self, start_date=None, end_date=None):
+        start = 0
+        end = len(self.dates)
+        if start_date != None:
+            start = np.searchsorted(self.dates, _to_datetime64(start_date),
+                                    side='right')
+        if end_date != None:
+            end = np.searchsorted(self.dates, _to_datetime64(end_date),
+                                  side='right')
+        return slice(int(start), int(max(start, end)))
+
+    def between_dates(self, start_date=None, end_date=None):
+        return self._scenarios(self.get_date_slice(start_date, end_date))
+
+    def specified_amt(self, num_scenarios, end_date=None):
+        rows = self.get_date_slice(None, end_date)
+        start = max(rows.stop - int(num_scenarios), 0)
+        return self._scenarios(slice(start, rows.stop))
+
+    def _scenarios(self, rows):
+        # A dataframe over a view of the memory-mapped rows
+        return pd.DataFrame(self.values[rows], columns=self.factor_names,
+                            index=pd.DatetimeIndex(self.dates[rows],
+                                                   name='Date'),
+                            copy=False)
+
+
+def import_historic_scenarios(hist_data, store_dir, date_col='Date'):
+    '''
+    import_historic_scenarios(hist_data, store_dir, date_col='Date')
+
+    Functionality
+    =============
+    Writes a historic scenario store from a table of scenarios with a date
+    column (e.g. the historic risk scenario repository read from Excel). The
+    scenarios are sorted by date and the files are written to a temporary
+    directory first, so a store is never seen partly written
+
+    Parameters
+    ==========
+    hist_data : pandas dataframe or str
+        the scenarios with a date column, or the path of an Excel file of them
+    store_dir : str
+        the directory to write the store to
+    date_col : str
+        the name of the date column
+
+    Returns
+    =======
+    store : HistoricScenarioStore object
+        the new store
+    '''
+    if isinstance(hist_data, str):
+        hist_data = pd.read_excel(hist_data, header=0)
+    hist_data = hist_data.sort_values(date_col, kind='mergesort')
+
+    dates = pd.to_datetime(hist_data[date_col]).values.astype('datetime64[D]')
+    factors = hist_data.drop(date_col, axis=1)
+    factor_names = [str(x) for x in list(factors)]
+    values = np.ascontiguousarray(factors.values, float)
+
+    tmp_dir = store_dir.rstrip(os.sep) + '.' + str(os.getpid()) + '.tmp'
+    if not os.path.isdir(tmp_dir):
+        os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, STORE_VALUES_FILE), values)
+    np.save(os.path.join(tmp_dir, STORE_DATES_FILE), dates)
+    with open(os.path.join(tmp_dir, STORE_FACTORS_FILE), 'w') as f:
+        json.dump(factor_names, f)
+
+    # Replace any previous store
+    if os.path.isdir(store_dir):
+        for name in os.listdir(store_dir):
+            os.remove(os.path.join(store_dir, name))
+        os.rmdir(store_dir)
+    os.rename(tmp_dir, store_dir)
+    _STORE_CACHE.pop(store_dir, None)
+
+    return get_historic_scenario_store(store_dir)
+
+
+def get_historic_scenario_store(store_dir, source_file=None):
+    '''
+    get_historic_scenario_store(store_dir, source_file=None)
+
+    Functionality
+    =============
+    Returns the historic scenario store in store_dir, opening it once per
+    process. If a source Excel file is given the store is (re)imported from
+    it when the store does not exist or is older than the file
+
+    Parameters
+    ==========
+    store_dir : str
+        the directory of the store
+    source_file : str
+        the Excel file the store is imported from
+
+    Returns
+    =======
+    store : HistoricScenarioStore object
+        the historic scenario store
+    '''
+    values_file = os.path.join(store_dir, STORE_VALUES_FILE)
+    if source_file != None and os.path.isfile(source_file) and (
+            not os.path.isfile(values_file) or
+            os.path.getmtime(values_file) < os.path.getmtime(source_file)):
+        return import_historic_scenarios(source_file, store_dir)
+
+    if store_dir not in _STORE_CACHE:
+        _STORE_CACHE[store_dir] = HistoricScenarioStore(store_dir)
+    return _STORE_CACHE[store_dir]
+
+
+def clear_historic_store_cache():
+    # Only clears the stores opened by this process
+    _STORE_CACHE.clear()
+
+
+def _to_datetime64(date):
+    return np.datetime64(pd.Timestamp(date).date(), 'D')
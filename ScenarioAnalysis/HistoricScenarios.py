@@ -4,8 +4,8 @@
 ###
 
 import datetime as dt
-import pandas as pd
 import os
+from HistoricScenarioStore import get_historic_scenario_store
 
 
 def historic_between_dates(start_date, end_date=None):
@@ -16,7 +16,8 @@ def historic_between_dates(start_date, end_date=None):
     =============
     This returns a matrix of scenerios between two dates where the columns
     correspond to the new values of the risk factors and the rows correspond to
-    the scenerio
+    the scenerio. The scenarios are a read-only view of the historic scenario
+    store (see get_historic_repository_store)
 
     Parameters
     ==========
@@ -24,44 +25,19 @@ def historic_between_dates(start_date, end_date=None):
          the start date for the historic scenerios
     end_date : datetime
         the end date for the historic scenerios
-    factors : set of strings
-        a set of strings specifing the unique identifiers of the risk factors
 
     Returns
     =======
     scenarios : pandas dataframe
-        a pandas matrix of historic scenerios
+        a pandas matrix of historic scenerios indexed by date
     '''
 
-    # Paths where the portfolio repository is stored
-    SEARCH_STR = 'Dropbox'
-    REPOSITORY_PATH = 'Risk Management Project!!/Repositories/'
-    REPOSITORY_NAME = 'HistoricRiskScenerioRepository'
-    REPOSITORY_FILETYPE = '.xlsx'
-
-    # Find the path on the local machine where dropbox is located
-    curr_dir = os.getcwd()
-    search_str_idx = curr_dir.find(SEARCH_STR) + len(SEARCH_STR) + 1
-    user_path = curr_dir[:search_str_idx]
-
-    # Specify the string of the path with file name and sheet names list
-    path_w_file = user_path + REPOSITORY_PATH + REPOSITORY_NAME + REPOSITORY_FILETYPE
-
     # if the end date is not given, generate from scenerios until today
     if end_date == None:
         end_date = dt.datetime.today()
 
-    # import the historic data from excel
-    hist_data = pd.read_excel(path_w_file, header=0)
-
-    # Filter the rows and columns
-    mask = (hist_data['Date'] > start_date) & (hist_data['Date'] <= end_date)
-    hist_data = hist_data.loc[mask]
-    del hist_data['Date']
-
-    scenarios = hist_data
-
-    return scenarios
+    store = get_historic_repository_store()
+    return store.between_dates(start_date, end_date)
 
 
 def historic_specified_amt(num_scenarios, end_date=None):
@@ -72,7 +48,8 @@ def historic_specified_amt(num_scenarios, end_date=None):
     =============
     This returns a specified number of scenerios ending on end_date where the
     columns correspond to the new values of the risk factors and the rows
-    correspond to the scenerio
+    correspond to the scenerio. The scenarios are a read-only view of the
+    historic scenario store (see get_historic_repository_store)
 
     Parameters
     ==========
@@ -84,7 +61,35 @@ def historic_specified_amt(num_scenarios, end_date=None):
     Returns
     =======
     scenarios : pandas dataframe
-        a pandas matrix of historic scenerios
+        a pandas matrix of historic scenerios indexed by date
+    '''
+
+    # if the end date is not given, generate from scenerios until today
+    if end_date == None:
+        end_date = dt.datetime.today()
+
+    store = get_historic_repository_store()
+    return store.specified_amt(num_scenarios, end_date)
+
+
+def get_historic_repository_store():
+    '''
+    get_historic_repository_store()
+
+    Functionality
+    =============
+    This returns the historic scenario store of the historic risk scenerio
+    repository. The Excel repository is only used to import the store, which
+    happens the first time it is used and again whenever the repository is
+    updated
+
+    Parameters
+    ==========
+
+    Returns
+    =======
+    store : HistoricScenarioStore object
+        the store of the historic scenerios
     '''
 
     # Paths where the portfolio repository is stored
@@ -92,31 +97,17 @@ def historic_specified_amt(num_scenarios, end_date=None):
     REPOSITORY_PATH = 'Risk Management Project!!/Repositories/'
     REPOSITORY_NAME = 'HistoricRiskScenerioRepository'
     REPOSITORY_FILETYPE = '.xlsx'
+    STORE_SUFFIX = '_Store'
 
     # Find the path on the local machine where dropbox is located
     curr_dir = os.getcwd()
     search_str_idx = curr_dir.find(SEARCH_STR) + len(SEARCH_STR) + 1
     user_path = curr_dir[:search_str_idx]
 
-    # Specify the string of the path with file name and sheet names list
-    path_w_file = user_path + REPOSITORY_PATH + REPOSITORY_NAME + REPOSITORY_FILETYPE
-
-    # if the end date is not given, generate from scenerios until today
-    if end_date == None:
-        end_date = dt.datetime.today()
-
-    # import the historic data from excel
-    hist_data = pd.read_excel(path_w_file, header=0)
-
-    # Filter the rows and columns
-    mask = (hist_data['Date'] <= end_date)
-    hist_data = hist_data.loc[mask]
-    del hist_data['Date']
-
-    # Filter the rows and columns
-    scenarios = hist_data.tail(num_scenarios)
-
-    return scenarios
+    # Specify the string of the path with file name and the store directory
+    path_w_name = user_path + REPOSITORY_PATH + REPOSITORY_NAME
+    return get_historic_scenario_store(path_w_name + STORE_SUFFIX,
+                                       path_w_name + REPOSITORY_FILETYPE)
 
 
 def dotcom_bubble_scenerios():
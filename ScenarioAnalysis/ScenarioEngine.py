@@ -0,0 +1,187 @@
+###
+# Vectorized engine used to apply an entire matrix of risk factor scenarios to
+# a market environment at once
+###
+
+import numpy as np
+import pandas as pd
+from MarketData import MarketEnvironmentOverlay, get_container
+
+
+class ScenarioEngine(object):
+    '''
+    ScenarioEngine(object)
+
+    Class for applying a whole matrix of scenarios to a market environment.
+    Every risk factor (e.g. "Curves-RiskFree-CDOR-CAD-0.25") is looked up in
+    the risk factor index of the market environment and mapped to a fixed
+    slot in a flat numeric state vector so that the shocked market states of
+    all scenarios can be produced as a single NumPy array.
+
+    Attributes
+    ==========
+    mkt_env : market_environment object
+        the base market environment the scenarios are applied to
+    factor_names : list of str
+        the risk factors in the order of their slots in the state vector
+    base_state : numpy array
+        the current value of each risk factor in the base environment
+
+    Methods
+    =======
+    get_mkt_env :
+        returns the base market environment
+    get_factor_names :
+        returns the list of risk factors in slot order
+    get_base_state :
+        returns the state vector of the base market environment
+    get_slot :
+        returns the slot of a risk factor in the state vector
+    get_container_states :
+        returns the values of a container under each shocked state
+    shocked_states :
+        returns the shocked state vectors of a matrix of scenarios
+    build_mkt_env :
+        creates a market environment from a shocked state vector
+    generate_mkt_envs :
+        generator of market environments for a matrix of shocked states
+    '''
+
+    # -------------------------------------------------------------------------
+    # Object Definition
+    # -------------------------------------------------------------------------
+    def __init__(self, mkt_env, factor_names=None):
+        self.mkt_env = mkt_env
+        risk_factor_index = mkt_env.get_risk_factor_index()
+
+        # Default to all the risk factors of the market environment
+        if factor_names is None:
+            factor_names = risk_factor_index.get_factor_names()
+        self.factor_names = list(factor_names)
+
+        self._slots = {}
+        self._constants = {}
+        self._containers = {}
+        self.base_state = np.zeros(len(self.factor_names))
+
+        for slot, name in enumerate(self.factor_names):
+            self._slots[name] = slot
+            stype, skey, _, _, row, col = risk_factor_index.get_factor(name)
+
+            if stype == 'Constants':
+                self._constants[skey] = slot
+                self.base_state[slot] = mkt_env.get_constant(skey)
+                continue
+
+            # Record the position of the factor inside its container
+            container_id = (stype, skey)
+            if container_id not in self._containers:
+                data = get_container(mkt_env, stype, skey)
+                self._containers[container_id] = {
+                    'data': data, 'values': np.asarray(data.values, float),
+                    'rows': [], 'cols': [], 'slots': []}
+            container = self._containers[container_id]
+            container['rows'].append(row)
+            container['cols'].append(col)
+            container['slots'].append(slot)
+            self.base_state[slot] = container['values'][row, col]
+
+        # Convert the positions to arrays for fancy indexing
+        for container in self._containers.values():
+            container['rows'] = np.asarray(container['rows'], int)
+            container['cols'] = np.asarray(container['cols'], int)
+            container['slots'] = np.asarray(container['slots'], int)
+
+    # -------------------------------------------------------------------------
+    # Basic getter functions
+    # -------------------------------------------------------------------------
+    def get_mkt_env(self):
+        return self.mkt_env
+
+    def get_factor_names(self):
+        return self.factor_names
+
+    def get_base_state(self):
+        return self.base_state
+
+    def get_slot(self, factor_name):
+        return self._slots[factor_name]
+
+    # -------------------------------------------------------------------------
+    # The values of one container (e.g. a volatility surface) under each of
+    # a matrix of shocked states, so products can be priced under all the
+    # states at once. Constants give a vector (Rows=States) and the other
+    # containers an array of shape (states, rows, columns)
+    # -------------------------------------------------------------------------
+    def get_container_states(self, states, stype, skey):
+        states = np.atleast_2d(states)
+        if stype == 'Constants':
+            if skey in self._constants:
+                return states[:, self._constants[skey]].copy()
+            return np.full(len(states), float(self.mkt_env.get_constant(skey)))
+
+        container = self._containers.get((stype, skey))
+        if container is None:
+            values = np.asarray(get_container(self.mkt_env, stype,
+                                              skey).values, float)
+            return np.broadcast_to(values, (len(states),) + values.shape)
+
+        values = np.tile(container['values'], (len(states), 1, 1))
+        values[:, container['rows'], container['cols']] = \
+            states[:, container['slots']]
+        return values
+
+    # -------------------------------------------------------------------------
+    # Apply a matrix of scenarios (Rows=Scenarios; Col=Factors) to the base
+    # state vector in one pass
+    # -------------------------------------------------------------------------
+    def shocked_states(self, scenarios, abs_flag=True):
+        if isinstance(scenarios, pd.Series):
+            scenarios = scenarios.to_frame().T
+        if isinstance(scenarios, pd.DataFrame):
+            slots = np.array([self._slots[name] for name in scenarios.columns],
+                             int)
+            changes = np.asarray(scenarios.values, float)
+        else:
+            changes = np.atleast_2d(np.asarray(scenarios, float))
+            slots = np.arange(changes.shape[1])
+
+        states = np.tile(self.base_state, (len(changes), 1))
+        base = self.base_state[slots]
+        if abs_flag:
+            states[:, slots] = base + changes
+        else:
+            states[:, slots] = base * (1 + changes)
+
+        return states
+
+    # -------------------------------------------------------------------------
+    # Create a market environment from a state vector. The environment is an
+    # overlay of the base environment holding only the factors that moved.
+    # The valuation date can be rolled forward (e.g. along a simulated path)
+    # -------------------------------------------------------------------------
+    def build_mkt_env(self, state, ID='Output_Environment', val_date=None):
+        mkt_env_new = MarketEnvironmentOverlay(self.mkt_env, ID, val_date)
+
+        changed = state != self.base_state
+
+        for (stype, skey), container in self._containers.items():
+            moved = changed[container['slots']]
+            if not moved.any():
+                continue
+            mkt_env_new.set_factor_values(stype, skey,
+                                          container['rows'][moved],
+                                          container['cols'][moved],
+                                          state[container['slots'][moved]])
+
+        for skey, slot in self._constants.items():
+            if changed[slot]:
+                mkt_env_new.add_constant(skey, state[slot])
+
+        return mkt_env_new
+
+    def generate_mkt_envs(self, states, ID_prefix='Scenario ', val_date=None):
+        for ii in range(len(states)):
+            yield self.build_mkt_env(states[ii], ID_prefix + str(ii + 1),
+                                     val_date)
+
@@ -34,10 +34,9 @@ def shifting_market_data(mkt_env, market_data_type, shift_factor_spec, bps,
     =======
     a new market environment with the change applied
     '''
-    factor_vol = mkt_env.get_list('RiskFactorVolatilities')
-    factor_names = list(factor_vol)
+    risk_factor_index = mkt_env.get_risk_factor_index()
     shift_factor = market_data_type + '-' + shift_factor_spec
-    shift_list = [x for x in factor_names if shift_factor in x]
+    shift_list = risk_factor_index.get_factors_with_prefix(shift_factor)
     shift = bps * np.ones((1, len(shift_list)))
     scenario = pd.DataFrame(shift, columns=shift_list)
     scenario = scenario.iloc[0]
@@ -2,18 +2,29 @@
 
 from ScenarioGeneration import *
 from GenericScenarios import *
+import numpy as np
+import pandas as pd
+from ScenarioEngine import ScenarioEngine
 
 
-def calculate_portfolio_sensitivities(mkt_env, portfolio):
-    factor_vol = mkt_env.get_list('RiskFactorVolatilities')
-    factor_names = list(factor_vol)
-    orig_port_val = portfolio.value_product(mkt_env)
+def calculate_portfolio_sensitivities(mkt_env, portfolio, method='bump'):
+    # With method='adjoint' the positions that return the gradient of their
+    # value are priced once and their sensitivity is the gradient times the
+    # change. Only the other positions are bumped and revalued
+    risk_factor_index = mkt_env.get_risk_factor_index()
+    factor_names = risk_factor_index.get_factor_names()
+    if method == 'adjoint':
+        position_vals, gradient, bumped_positions = \
+            calculate_portfolio_gradient(mkt_env, portfolio)
+    else:
+        position_vals = portfolio.value_positions(mkt_env)
+        gradient = {}
+        bumped_positions = None
     sensitivities_dict = {}
 
     for factor in factor_names:
-        ff = factor.split('-')
-        ftype = ff[0]
-        fsubtype = ff[1]
+        ftype = risk_factor_index.get_container_type(factor)
+        fsubtype = risk_factor_index.get_key(factor).split('-')[0]
 
         if ftype == 'Constants':
             if fsubtype == 'FXRates':
@@ -23,12 +34,78 @@ def calculate_portfolio_sensitivities(mkt_env, portfolio):
         else:
             change = 0.0001
 
-        mkt_env_new = apply_mkt_shock(mkt_env, factor, change)
-        sensitivity = portfolio.value_product(mkt_env_new) - orig_port_val
+        # Only the positions depending on the factor are repriced
+        dependent_positions = portfolio.get_dependent_positions(
+            ftype, risk_factor_index.get_key(factor))
+        if bumped_positions != None:
+            dependent_positions = [x for x in dependent_positions
+                                   if x in bumped_positions]
+        sensitivity = gradient.get(factor, 0.0) * change
+        if len(dependent_positions) > 0:
+            mkt_env_new = apply_mkt_shock(mkt_env, factor, change)
+            sensitivity += revalue_dependent_positions(portfolio,
+                                                       position_vals,
+                                                       dependent_positions,
+                                                       mkt_env_new)
         sensitivities_dict[factor] = sensitivity
 
     return sensitivities_dict
 
+
+def calculate_relative_sensitivities(mkt_env, portfolio, factor_names=None,
+                                     rel_bump=0.0001):
+    '''
+    calculate_relative_sensitivities(mkt_env, portfolio, factor_names=None,
+                                     rel_bump=0.0001)
+
+    Functionality
+    =============
+    First-order sensitivity of the portfolio value to a relative change of
+    each risk factor (the convention the VaR scenarios are applied with),
+    found by bumping one factor at a time through the ScenarioEngine and
+    repricing only the positions depending on the factor
+
+    Parameters
+    ==========
+    mkt_env : market_environment object
+        a market environment object of current market data
+    portfolio : portfolio object
+        the portfolio to value
+    factor_names : list of str
+        the risk factors to bump (defaulted to all the risk factors)
+    rel_bump : double
+        the relative bump applied to each risk factor
+
+    Returns
+    =======
+    sensitivities_dict : dict
+        change in portfolio value per unit relative change of each factor
+    '''
+    engine = ScenarioEngine(mkt_env, factor_names)
+    factor_names = engine.get_factor_names()
+    risk_factor_index = mkt_env.get_risk_factor_index()
+    position_vals = portfolio.value_positions(mkt_env)
+    states = engine.shocked_states(rel_bump * np.eye(len(factor_names)),
+                                   abs_flag=False)
+
+    sensitivities_dict = {}
+    for ii, factor in enumerate(factor_names):
+        # A factor at zero does not move under a relative bump
+        dependent_positions = portfolio.get_dependent_positions(
+            risk_factor_index.get_container_type(factor),
+            risk_factor_index.get_key(factor))
+        if (engine.get_base_state()[ii] == 0 or
+                len(dependent_positions) == 0):
+            sensitivities_dict[factor] = 0.0
+            continue
+        mkt_env_new = engine.build_mkt_env(states[ii])
+        sensitivities_dict[factor] = revalue_dependent_positions(
+            portfolio, position_vals, dependent_positions,
+            mkt_env_new) / rel_bump
+
+    return sensitivities_dict
+
+
 def risk_free_curve_bump(mkt_env, is_positive):
     # shift all risk free rates by 1bps 0.0001 (absolute)
     shift_factor_spec = 'RiskFree-Gov'
@@ -57,3 +134,265 @@ def calculate_DV01_Convexity(mkt_env, FI_port):
                         positive_change_value - 2 * original_value + negative_change_value) / (
                         0.0001 ** 2)
     return DV01, convexity
+
+
+def calculate_key_rate_ladder(mkt_env, portfolio, curve_spec='RiskFree-Gov',
+                              bump=0.0001):
+    '''
+    calculate_key_rate_ladder(mkt_env, portfolio, curve_spec='RiskFree-Gov',
+                              bump=0.0001)
+
+    Functionality
+    =============
+    Key-rate DV01 and convexity of the portfolio for each currency and tenor
+    of a set of curves. The base state and the up and down bumps of every
+    key rate are stacked into one batch of shocked states through the
+    ScenarioEngine and the positions with a batch valuation (see
+    Portfolio.value_batched_positions) are valued under all of them at once.
+    Only the other positions depending on a bumped curve are revalued in
+    the market environments of its bumps
+
+    Parameters
+    ==========
+    mkt_env : market_environment object
+        a market environment object of current market data
+    portfolio : portfolio object
+        the portfolio to value
+    curve_spec : str
+        prefix of the keys of the curves to bump (e.g. 'RiskFree-Gov' for
+        the curves 'RiskFree-Gov-CAD', 'RiskFree-Gov-USD', ...)
+    bump : double
+        the absolute bump applied to each key rate
+
+    Returns
+    =======
+    ladder : pandas dataframe
+        indexed by (Currency, Tenor) with the change in portfolio value for
+        the up and down bumps ('Up', 'Down'), the 'DV01' (value gained for a
+        fall of one bump) and the 'Convexity' of each key rate. Use
+        ladder['DV01'].unstack() for a Currency x Tenor table
+    '''
+    risk_factor_index = mkt_env.get_risk_factor_index()
+    factor_names = risk_factor_index.get_factors_with_prefix(
+        'Curves-' + curve_spec)
+    num_factors = len(factor_names)
+
+    # Row 0 is the base state, rows 1..F the up bumps and rows F+1..2F the
+    # down bumps
+    engine = ScenarioEngine(mkt_env, factor_names)
+    changes = bump * np.vstack((np.zeros(num_factors), np.eye(num_factors),
+                                -np.eye(num_factors)))
+    states = engine.shocked_states(changes, abs_flag=True)
+
+    # The changes of the batched positions are taken from their base values
+    # in the same batch
+    batched, batched_vals = portfolio.value_batched_positions(engine, states)
+    batched_PnL = batched_vals[1:].sum(axis=1) - batched_vals[0].sum()
+    ladder = np.column_stack((batched_PnL[:num_factors],
+                              batched_PnL[num_factors:]))
+
+    batched = set(batched)
+    position_vals = None
+    ladder_index = []
+    for ii, factor in enumerate(factor_names):
+        _, skey, _, tenor, _, _ = risk_factor_index.get_factor(factor)
+        ladder_index.append((skey.split('-')[-1], float(tenor)))
+
+        dependent_positions = [x for x in portfolio.get_dependent_positions(
+            'Curves', skey) if x not in batched]
+        if len(dependent_positions) == 0:
+            continue
+        if position_vals is None:
+            position_vals = portfolio.value_positions(mkt_env)
+        for jj, state in enumerate([states[1 + ii],
+                                    states[1 + num_factors + ii]]):
+            ladder[ii, jj] += revalue_dependent_positions(
+                portfolio, position_vals, dependent_positions,
+                engine.build_mkt_env(state))
+
+    ladder = pd.DataFrame(ladder, columns=['Up', 'Down'],
+                          index=pd.MultiIndex.from_tuples(
+                              ladder_index, names=['Currency', 'Tenor']))
+    ladder['DV01'] = (ladder['Down'] - ladder['Up']) / 2
+    ladder['Convexity'] = (ladder['Up'] + ladder['Down']) / (bump ** 2)
+
+    return ladder
+
+
+def calculate_delta_gamma(mkt_env, portfolio, factor_names=None,
+                          rel_bump=0.001, positions=None):
+    '''
+    calculate_delta_gamma(mkt_env, portfolio, factor_names=None,
+                          rel_bump=0.001, positions=None)
+
+    Functionality
+    =============
+    First and second order sensitivities of the portfolio value to relative
+    changes of the risk factors (the convention the VaR scenarios are
+    applied with), so that the P&L of a scenario x is approximately
+    x * delta + 0.5 * x * gamma * x. The delta and gamma of an option to its
+    underlying price are taken from the greeks of its pricing model. All
+    other sensitivities are found by central differences from one batch of
+    up and down bumps, each repricing only the positions depending on the
+    bumped factor. Cross gammas between different factors are not included
+
+    Parameters
+    ==========
+    mkt_env : market_environment object
+        a market environment object of current market data
+    portfolio : portfolio object
+        the portfolio to value
+    factor_names : list of str
+        the risk factors (defaulted to all the risk factors)
+    rel_bump : double
+        the relative bump applied to each risk factor
+    positions : list of products
+        the positions to include (defaulted to all the positions)
+
+    Returns
+    =======
+    delta : numpy array
+        change in value per unit relative change of each factor
+    gamma : numpy array
+        matrix of second derivatives with respect to the relative changes
+    '''
+    engine = ScenarioEngine(mkt_env, factor_names)
+    factor_names = engine.get_factor_names()
+    base_state = engine.get_base_state()
+    risk_factor_index = mkt_env.get_risk_factor_index()
+    num_factors = len(factor_names)
+    if positions == None:
+        positions = list((portfolio.positions).keys())
+    positions = set(positions)
+
+    delta = np.zeros(num_factors)
+    gamma = np.zeros((num_factors, num_factors))
+
+    # Delta and gamma of options to the price of their underlying
+    analytic = set([])
+    for product in positions:
+        if not hasattr(product, 'get_greeks'):
+            continue
+        spot_factor = ('Constants-MarketPrice-' +
+                       product.get_underlying().get_ID())
+        if (spot_factor not in factor_names or
+                product.get_expiration_date() <= mkt_env.get_val_date()):
+            continue
+        slot = engine.get_slot(spot_factor)
+        price_info = product.get_greeks(mkt_env)
+        scale = (portfolio.positions)[product] * (
+            portfolio.get_base_currency_conversion(product, mkt_env))
+        delta[slot] += scale * price_info.get('delta') * base_state[slot]
+        gamma[slot, slot] += scale * price_info.get('gamma') * (
+                base_state[slot] ** 2)
+        analytic.add((product, slot))
+
+    # Central differences from the up (first F rows) and down bumps
+    position_vals = {}
+    changes = rel_bump * np.vstack((np.eye(num_factors),
+                                    -np.eye(num_factors)))
+    states = engine.shocked_states(changes, abs_flag=False)
+    for ii, factor in enumerate(factor_names):
+        dependent_positions = [
+            x for x in portfolio.get_dependent_positions(
+                risk_factor_index.get_container_type(factor),
+                risk_factor_index.get_key(factor))
+            if x in positions and (x, ii) not in analytic]
+        if len(dependent_positions) == 0 or base_state[ii] == 0:
+            continue
+        for product in dependent_positions:
+            if product not in position_vals:
+                position_vals[product] = portfolio.value_position(product,
+                                                                  mkt_env)
+        up = revalue_dependent_positions(portfolio, position_vals,
+                                         dependent_positions,
+                                         engine.build_mkt_env(states[ii]))
+        down = revalue_dependent_positions(
+            portfolio, position_vals, dependent_positions,
+            engine.build_mkt_env(states[num_factors + ii]))
+        delta[ii] += (up - down) / (2 * rel_bump)
+        gamma[ii, ii] += (up + down) / (rel_bump ** 2)
+
+    return delta, gamma
+
+
+def calculate_portfolio_gradient(mkt_env, portfolio):
+    '''
+    calculate_portfolio_gradient(mkt_env, portfolio)
+
+    Functionality
+    =============
+    Values each position of the portfolio once. The positions whose products
+    return the gradient of their value (bonds, FRNs, CDSs, stocks, cash)
+    also return their derivatives with respect to the risk factors, which
+    are summed into the gradient of the portfolio value
+
+    Parameters
+    ==========
+    mkt_env : market_environment object
+        a market environment object of current market data
+    portfolio : portfolio object
+        the portfolio to value
+
+    Returns
+    =======
+    position_vals : dict (product:double)
+        the value of each position
+    gradient : dict (str:double)
+        derivative of the value of the gradient positions with respect to
+        each risk factor
+    other_positions : set of products
+        the positions that do not return a gradient (e.g. options), which
+        need to be bumped and revalued
+    '''
+    position_vals = {}
+    gradient = {}
+    other_positions = set([])
+    for product in (portfolio.positions).keys():
+        if not portfolio.supports_gradient(product):
+            position_vals[product] = portfolio.value_position(product,
+                                                              mkt_env)
+            other_positions.add(product)
+            continue
+        price_info = portfolio.value_position(product, mkt_env,
+                                              return_gradient=True)
+        position_vals[product] = price_info['value']
+        for factor, derivative in price_info['gradient'].items():
+            gradient[factor] = gradient.get(factor, 0.0) + derivative
+
+    return position_vals, gradient, other_positions
+
+
+def revalue_dependent_positions(portfolio, position_vals, dependent_positions,
+                                mkt_env_new):
+    '''
+    revalue_dependent_positions(portfolio, position_vals, dependent_positions,
+                                mkt_env_new)
+
+    Functionality
+    =============
+    Change in the value of a portfolio when only some of its positions are
+    affected by a change in the market data. The other positions keep their
+    base values, so they cancel out of the change
+
+    Parameters
+    ==========
+    portfolio : portfolio object
+        the portfolio to value
+    position_vals : dict (product:double)
+        the base value of each position (from value_positions)
+    dependent_positions : list of products
+        the positions depending on the market data that changed
+    mkt_env_new : market_environment object
+        the market environment with the change applied
+
+    Returns
+    =======
+    PnL : double
+        the change in the value of the portfolio
+    '''
+    PnL = 0.0
+    for product in dependent_positions:
+        PnL += (portfolio.value_position(product, mkt_env_new) -
+                position_vals[product])
+    return PnL
@@ -1,11 +1,22 @@
 import pandas as pd
 import numpy as np
 import math
-from scipy.linalg import cholesky
+from scipy.linalg import cholesky, solve_triangular
+from scipy.special import ndtri
+from CovarianceFactorization import get_covariance_factorization
+
+# Sampling schemes available for the standard normal random variables
+SAMPLING_SCHEMES = ['pseudo', 'antithetic', 'moment_matching', 'sobol']
+
+# Number of scenarios drawn from each child stream of a seeded simulation.
+# Scenario i always comes from child stream i // RANDOM_STREAM_SIZE so the
+# scenarios do not depend on how the simulations are split between workers
+RANDOM_STREAM_SIZE = 1024
 
 
 def SimulationEngine(corr_matrix, std_dev_vector, numSim, sim_delta_t,
-                     vol_delta_t=None):
+                     vol_delta_t=None, sampling='pseudo', seed=None,
+                     first_sim=0):
     # corr_matrix is correlation matrix of risk factor time series; format will be pandas DataFrame matrix
     # std_dev_vector is vector of standard deviations of risk factor time series; format will be pandas DataFrame matrix
     # numSim is number of simulations
@@ -13,42 +24,566 @@ def SimulationEngine(corr_matrix, std_dev_vector, numSim, sim_delta_t,
     # vol_delta_t will be the time horizon of the vol data in years (defaulted to sim horizon)
     # The scaling factor is with the intent to do a 1-Day Market Risk VaR calculation.
     # Aside: corr_matrix is invariant of time-scale.
+    # sampling is the scheme used to draw the normals (see SAMPLING_SCHEMES)
+    # seed is the root seed of the random streams (None uses np.random)
+    # first_sim is the index of the first scenario (to split runs by worker)
+
+    # The full set of scenarios is a single block of the streaming engine
+    blocks = list(simulation_engine_blocks(corr_matrix, std_dev_vector,
+                                           numSim, sim_delta_t, vol_delta_t,
+                                           block_size=max(numSim, 1),
+                                           sampling=sampling, seed=seed,
+                                           first_sim=first_sim))
+    if len(blocks) == 0:
+        return _empty_scenarios(corr_matrix)
+    return pd.concat(blocks)
+
+
+def simulation_engine_blocks(corr_matrix, std_dev_vector, numSim, sim_delta_t,
+                             vol_delta_t=None, block_size=10000,
+                             sampling='pseudo', seed=None, first_sim=0):
+    '''
+    simulation_engine_blocks(corr_matrix, std_dev_vector, numSim, sim_delta_t,
+                             vol_delta_t=None, block_size=10000,
+                             sampling='pseudo', seed=None, first_sim=0)
 
-    # Step 0: Convert Pandas DataFrames to Matrices and Vectors
+    Functionality
+    =============
+    Generator version of the SimulationEngine which yields the scenarios in
+    blocks of at most block_size rows so that memory use is bounded by the
+    block size rather than the number of simulations. The Cholesky factor is
+    computed once and shared by every block, and the normals are drawn
+    scenario by scenario from the same random stream, so concatenating the
+    blocks gives the same scenarios for any block size (except for moment
+    matching, which is applied to each block).
+
+    Parameters
+    ==========
+    corr_matrix : pandas dataframe
+        correlation matrix of the risk factor time series
+    std_dev_vector : pandas dataframe
+        standard deviations of the risk factor time series
+    numSim : int
+        total number of simulations
+    sim_delta_t : double
+        the time horizon for the simulation in years
+    vol_delta_t : double
+        the time horizon of the vol data in years (defaulted to sim horizon)
+    block_size : int
+        the maximum number of scenarios in each block
+    sampling : str
+        the sampling scheme of the normals (one of SAMPLING_SCHEMES)
+    seed : int or numpy SeedSequence
+        the root seed of the random streams (None uses the global np.random)
+    first_sim : int
+        the index of the first scenario to generate (requires a seed)
+
+    Returns
+    =======
+    scenarios : generator of pandas dataframes
+        blocks of scenarios (Rows=Scenarios; Col=Factors)
+    '''
     col_names = list(corr_matrix)
-    corr_matrix = corr_matrix.as_matrix()
-    std_dev_vector = std_dev_vector.as_matrix()
-    std_dev_vector = np.squeeze(np.asarray(std_dev_vector))
+    for diffusion, _, start in _simulation_blocks(corr_matrix, std_dev_vector,
+                                                  numSim, sim_delta_t,
+                                                  vol_delta_t, block_size,
+                                                  sampling, seed, first_sim):
+        yield pd.DataFrame(diffusion, columns=col_names,
+                           index=range(start, start + len(diffusion)))
 
-    # Step 1: Create Covariance Matrix
-    std_dev_diag_matrix = np.diag(std_dev_vector)
-    temp1 = np.dot(std_dev_diag_matrix, corr_matrix)
-    cov_matrix = np.dot(temp1, std_dev_diag_matrix)
 
-    # Step 2: Calculate Cholesky Decomposition of Covariance Matrix
-    try:
-        lower_cholesky = cholesky(cov_matrix, lower=True)
-    except:
-        # If the covariance matrix is not PSD, find the closest possible PSD matrix
-        _, sin_val, sin_vect = np.linalg.svd(cov_matrix, full_matrices=True)
-        sym_polar = np.dot(np.dot(sin_vect, sin_val), np.transpose(sin_vect))
-        cov_matrix_adj = (sym_polar + cov_matrix) / 2.0
-        cov_matrix = (cov_matrix_adj + np.transpose(cov_matrix_adj)) / 2.0
-        lower_cholesky = cholesky(cov_matrix, lower=True)
-
-    # Step 3: Simulate Vector of Standard Normal Random Variables
-    std_normal_matrix = np.random.normal(0, 1, (len(corr_matrix), numSim))
-
-    # Step 4: Calculate the time scaling factor
+def ImportanceSamplingEngine(corr_matrix, std_dev_vector, numSim, sim_delta_t,
+                             mean_shift, vol_delta_t=None, sampling='pseudo',
+                             seed=None, first_sim=0):
+    '''
+    ImportanceSamplingEngine(corr_matrix, std_dev_vector, numSim, sim_delta_t,
+                             mean_shift, vol_delta_t=None, sampling='pseudo',
+                             seed=None, first_sim=0)
+
+    Functionality
+    =============
+    SimulationEngine with the standard normals drawn from N(mean_shift, I)
+    instead of N(0, I), so that more scenarios fall in the loss tail of the
+    portfolio. Each scenario carries the likelihood ratio weight
+    exp(-mean_shift.Z - |mean_shift|^2 / 2) of its unshifted normals Z, which
+    is passed to the weighted VaR/ES estimators
+
+    Parameters
+    ==========
+    corr_matrix : pandas dataframe
+        correlation matrix of the risk factor time series
+    std_dev_vector : pandas dataframe
+        standard deviations of the risk factor time series
+    numSim : int
+        total number of simulations
+    sim_delta_t : double
+        the time horizon for the simulation in years
+    mean_shift : numpy array
+        the shift of the standard normals (see importance_sampling_shift)
+    vol_delta_t : double
+        the time horizon of the vol data in years (defaulted to sim horizon)
+    sampling : str
+        the sampling scheme of the normals (one of SAMPLING_SCHEMES)
+    seed : int or numpy SeedSequence
+        the root seed of the random streams (None uses the global np.random)
+    first_sim : int
+        the index of the first scenario to generate (requires a seed)
+
+    Returns
+    =======
+    scenarios : pandas dataframe
+        the scenarios (Rows=Scenarios; Col=Factors)
+    weights : numpy array
+        the likelihood ratio weight of each scenario
+    '''
+    blocks = list(importance_sampling_blocks(corr_matrix, std_dev_vector,
+                                             numSim, sim_delta_t, mean_shift,
+                                             vol_delta_t,
+                                             block_size=max(numSim, 1),
+                                             sampling=sampling, seed=seed,
+                                             first_sim=first_sim))
+    if len(blocks) == 0:
+        return _empty_scenarios(corr_matrix), np.zeros(0)
+    scenarios = pd.concat([block[0] for block in blocks])
+    weights = np.concatenate([block[1] for block in blocks])
+    return scenarios, weights
+
+
+def importance_sampling_blocks(corr_matrix, std_dev_vector, numSim,
+                               sim_delta_t, mean_shift, vol_delta_t=None,
+                               block_size=10000, sampling='pseudo', seed=None,
+                               first_sim=0):
+    # Generator version of the ImportanceSamplingEngine which yields tuples of
+    # (scenarios, weights) in blocks of at most block_size scenarios
+    col_names = list(corr_matrix)
+    for diffusion, log_weights, start in _simulation_blocks(
+            corr_matrix, std_dev_vector, numSim, sim_delta_t, vol_delta_t,
+            block_size, sampling, seed, first_sim, mean_shift):
+        scenarios = pd.DataFrame(diffusion, columns=col_names,
+                                 index=range(start, start + len(diffusion)))
+        yield scenarios, np.exp(log_weights)
+
+
+def importance_sampling_shift(corr_matrix, std_dev_vector, sensitivities,
+                              alpha, sim_delta_t, vol_delta_t=None):
+    '''
+    importance_sampling_shift(corr_matrix, std_dev_vector, sensitivities,
+                              alpha, sim_delta_t, vol_delta_t=None)
+
+    Functionality
+    =============
+    Mean shift of the standard normals that moves the centre of the
+    simulation to the alpha quantile of the linearised portfolio P&L. With
+    P&L = g.X and X = s * L Z, the P&L is most sensitive to Z along
+    d = s * L^T g, so the shift is ndtri(alpha) * d / |d|
+
+    Parameters
+    ==========
+    corr_matrix : pandas dataframe
+        correlation matrix of the risk factor time series
+    std_dev_vector : pandas dataframe
+        standard deviations of the risk factor time series
+    sensitivities : dict or pandas series
+        P&L of the portfolio per unit relative change of each risk factor
+        (factors that are missing have no sensitivity)
+    alpha : double
+        quantile used for the VaR calculation (between 0 and 1)
+    sim_delta_t : double
+        the time horizon for the simulation in years
+    vol_delta_t : double
+        the time horizon of the vol data in years (defaulted to sim horizon)
+
+    Returns
+    =======
+    mean_shift : numpy array
+        the shift of the standard normals
+    '''
+    col_names = list(corr_matrix)
+    gradient = np.array([sensitivities.get(name, 0.0) for name in col_names],
+                        float)
+
+    lower_cholesky = covariance_cholesky(corr_matrix, std_dev_vector)
+    direction = np.dot(np.transpose(lower_cholesky), gradient)
+    norm = np.linalg.norm(direction)
+    if norm == 0:
+        return np.zeros(len(col_names))
+    return ndtri(alpha) * direction / norm
+
+
+def PathSimulationEngine(corr_matrix, std_dev_vector, numSim, num_steps,
+                         step_delta_t, vol_delta_t=None, sampling='pseudo',
+                         seed=None, first_sim=0):
+    '''
+    PathSimulationEngine(corr_matrix, std_dev_vector, numSim, num_steps,
+                         step_delta_t, vol_delta_t=None, sampling='pseudo',
+                         seed=None, first_sim=0)
+
+    Functionality
+    =============
+    Simulates paths of the risk factors over num_steps steps of step_delta_t
+    years. Each step is a relative change drawn with the same Cholesky
+    diffusion as the SimulationEngine, and the steps are compounded, so that
+    longer horizons do not rely on the square-root-of-time rule. The normals
+    of a whole path are drawn as one point (antithetic pairs are whole paths
+    and Sobol points have num_steps times as many dimensions as factors)
+
+    Parameters
+    ==========
+    corr_matrix : pandas dataframe
+        correlation matrix of the risk factor time series
+    std_dev_vector : pandas dataframe
+        standard deviations of the risk factor time series
+    numSim : int
+        number of simulated paths
+    num_steps : int
+        the number of steps in each path
+    step_delta_t : double
+        the length of each step in years
+    vol_delta_t : double
+        the time horizon of the vol data in years (defaulted to step length)
+    sampling : str
+        the sampling scheme of the normals (one of SAMPLING_SCHEMES)
+    seed : int or numpy SeedSequence
+        the root seed of the random streams (None uses the global np.random)
+    first_sim : int
+        the index of the first path to generate (requires a seed)
+
+    Returns
+    =======
+    path_scenarios : list of pandas dataframes
+        the relative change of the risk factors from the base market at the
+        end of each step (Rows=Paths; Col=Factors)
+    '''
+    blocks = list(path_simulation_blocks(corr_matrix, std_dev_vector, numSim,
+                                         num_steps, step_delta_t, vol_delta_t,
+                                         block_size=max(numSim, 1),
+                                         sampling=sampling, seed=seed,
+                                         first_sim=first_sim))
+    if len(blocks) == 0:
+        return [_empty_scenarios(corr_matrix) for step in range(num_steps)]
+    return [pd.concat([block[step] for block in blocks])
+            for step in range(num_steps)]
+
+
+def path_simulation_blocks(corr_matrix, std_dev_vector, numSim, num_steps,
+                           step_delta_t, vol_delta_t=None, block_size=1000,
+                           sampling='pseudo', seed=None, first_sim=0):
+    # Generator version of the PathSimulationEngine which yields the list of
+    # step scenarios for blocks of at most block_size paths
+    col_names = list(corr_matrix)
+    num_factors = len(col_names)
+    for diffusion, _, start in _simulation_blocks(
+            corr_matrix, std_dev_vector, numSim, step_delta_t, vol_delta_t,
+            block_size, sampling, seed, first_sim, num_steps=num_steps):
+        num_paths = len(diffusion)
+
+        # Compound the relative changes of the steps along each path
+        diffusion = diffusion.reshape(num_paths, num_steps, num_factors)
+        path_changes = np.cumprod(1 + diffusion, axis=1) - 1
+
+        index = range(start, start + num_paths)
+        yield [pd.DataFrame(path_changes[:, step, :], columns=col_names,
+                            index=index) for step in range(num_steps)]
+
+
+def _simulation_blocks(corr_matrix, std_dev_vector, numSim, sim_delta_t,
+                       vol_delta_t, block_size, sampling, seed, first_sim,
+                       mean_shift=None, num_steps=1):
+    # Blocks of (diffusion terms, log likelihood ratio weights, first index).
+    # Each row holds the diffusion terms of num_steps steps one after another
+    num_factors = len(list(corr_matrix))
+    lower_cholesky = covariance_cholesky(corr_matrix, std_dev_vector)
+
+    # Calculate the time scaling factor
     if vol_delta_t == None:
         vol_delta_t = sim_delta_t
-    scaling_factor = 1.0 * sim_delta_t / vol_delta_t
+    scaling_factor = math.sqrt(1.0 * sim_delta_t / vol_delta_t)
+    diffusion_matrix = np.transpose(scaling_factor * lower_cholesky)
+
+    def _diffuse(std_normal_matrix):
+        # Calculate the diffusion term of each step of each scenario
+        num_rows = len(std_normal_matrix)
+        return np.dot(std_normal_matrix.reshape(-1, num_factors),
+                      diffusion_matrix).reshape(num_rows, -1)
+
+    if seed is not None:
+        # The diffusion is applied to whole child streams so the rounding of
+        # the matrix product does not depend on the blocks either
+        blocks = _seeded_normal_blocks(num_factors * num_steps, numSim,
+                                       block_size, sampling, seed, first_sim,
+                                       _diffuse, mean_shift)
+    else:
+        blocks = ((_diffuse(shifted), log_weights)
+                  for shifted, log_weights in (
+                      _shift_normals(std_normal_matrix, mean_shift)
+                      for std_normal_matrix in standard_normal_blocks(
+                          num_factors * num_steps, numSim, block_size,
+                          sampling)))
+
+    start = first_sim
+    for diffusion_term_matrix, log_weights in blocks:
+        yield diffusion_term_matrix, log_weights, start
+        start += len(diffusion_term_matrix)
+
+
+def _empty_scenarios(corr_matrix):
+    # No scenarios (numSim = 0) as a frame with the factors as its columns
+    return pd.DataFrame(columns=list(corr_matrix), dtype=float)
+
+
+def _shift_normals(std_normals, mean_shift):
+    # Shifted normals and the log of their likelihood ratio weights
+    if mean_shift is None:
+        return std_normals, np.zeros(len(std_normals))
+    mean_shift = np.asarray(mean_shift, float)
+    log_weights = (-np.dot(std_normals, mean_shift) -
+                   0.5 * np.dot(mean_shift, mean_shift))
+    return std_normals + mean_shift, log_weights
+
+
+def standard_normal_blocks(num_factors, numSim, block_size=10000,
+                           sampling='pseudo', seed=None, first_sim=0):
+    '''
+    standard_normal_blocks(num_factors, numSim, block_size=10000,
+                           sampling='pseudo', seed=None, first_sim=0)
+
+    Functionality
+    =============
+    Generator of independent standard normal random variables in blocks of
+    at most block_size rows (Rows=Scenarios; Col=Factors). The sampling
+    schemes are:
+        pseudo : plain pseudo-random normals
+        antithetic : pairs of pseudo-random normals (Z, -Z)
+        moment_matching : pseudo-random normals rescaled so that each block
+            has zero sample mean and identity sample covariance
+        sobol : scrambled Sobol points mapped through the inverse normal CDF
+
+    Without a seed the normals come from the global np.random state. With a
+    seed, scenario i is drawn from the child stream i // RANDOM_STREAM_SIZE
+    of the seed (or is point i of one scrambled Sobol sequence), so any
+    split of the simulations between workers gives bit-identical scenarios.
+    Moment matching is then applied to each child stream rather than to each
+    block.
+
+    Parameters
+    ==========
+    num_factors : int
+        the number of risk factors (columns)
+    numSim : int
+        total number of simulations
+    block_size : int
+        the maximum number of scenarios in each block
+    sampling : str
+        the sampling scheme (one of SAMPLING_SCHEMES)
+    seed : int or numpy SeedSequence
+        the root seed of the random streams (None uses the global np.random)
+    first_sim : int
+        the index of the first scenario to generate (requires a seed)
+
+    Returns
+    =======
+    std_normals : generator of numpy arrays
+        blocks of standard normal random variables
+    '''
+    if sampling not in SAMPLING_SCHEMES:
+        raise ValueError('Unknown sampling scheme: ' + str(sampling))
+
+    if seed is not None:
+        for std_normals, _ in _seeded_normal_blocks(num_factors, numSim,
+                                                    block_size, sampling, seed,
+                                                    first_sim):
+            yield std_normals
+        return
+    if first_sim != 0:
+        raise ValueError('A seed is required to start at first_sim')
+
+    if sampling == 'sobol':
+        # Seeded from the global state so np.random.seed reproduces the run
+        from scipy.stats import qmc
+        sobol_engine = qmc.Sobol(num_factors, scramble=True,
+                                 seed=np.random.randint(2 ** 31 - 1))
+
+    antithetic_carry = None
+    start = 0
+    while start < numSim:
+        num_block = min(block_size, numSim - start)
+
+        if sampling == 'sobol':
+            std_normals = _sobol_normals(sobol_engine, num_block)
+
+        elif sampling == 'antithetic':
+            # Scenarios 2k and 2k+1 are an antithetic pair. A pair split by the
+            # end of a block is completed at the start of the next block
+            rows = []
+            if antithetic_carry is not None:
+                rows.append(antithetic_carry)
+                antithetic_carry = None
+            num_pairs = (num_block - len(rows) + 1) // 2
+            normals = np.random.normal(0, 1, (num_pairs, num_factors))
+            pairs = np.empty((2 * num_pairs, num_factors))
+            pairs[0::2] = normals
+            pairs[1::2] = -normals
+            rows.append(pairs)
+            std_normals = np.concatenate(rows)
+            if len(std_normals) > num_block:
+                antithetic_carry = std_normals[num_block:]
+                std_normals = std_normals[:num_block]
+
+        elif sampling == 'moment_matching':
+            std_normals = np.random.normal(0, 1, (num_block, num_factors))
+            std_normals = _match_moments(std_normals)
+
+        else:
+            std_normals = np.random.normal(0, 1, (num_block, num_factors))
+
+        yield std_normals
+        start += num_block
+
+
+def random_stream(seed, stream_index):
+    '''
+    random_stream(seed, stream_index)
+
+    Functionality
+    =============
+    Returns the child random number generator stream_index of the root seed.
+    The children are independent of each other and of the number of
+    children used, so each worker can draw its own disjoint block
+
+    Parameters
+    ==========
+    seed : int or numpy SeedSequence
+        the root seed of the simulation
+    stream_index : int
+        the index of the child stream
+
+    Returns
+    =======
+    rng : numpy Generator
+        the random number generator of the child stream
+    '''
+    root = _seed_sequence(seed)
+    child = np.random.SeedSequence(root.entropy,
+                                   spawn_key=root.spawn_key + (stream_index,))
+    return np.random.Generator(np.random.PCG64(child))
+
+
+def _seed_sequence(seed):
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+
+def _seeded_normal_blocks(num_factors, numSim, block_size, sampling, seed,
+                          first_sim, transform=None, mean_shift=None):
+    # Blocks of (normals, log likelihood ratio weights) of the seeded normals,
+    # shifted by mean_shift and then passed through transform if they are
+    # given
+    sobol_engine = None
+    if sampling == 'sobol':
+        from scipy.stats import qmc
+        sobol_engine = qmc.Sobol(num_factors, scramble=True,
+                                 seed=np.random.Generator(
+                                     np.random.PCG64(_seed_sequence(seed))))
+
+    stream_index = None
+    stream_normals = None
+    stream_log_weights = None
+    pos = first_sim
+    end = first_sim + numSim
+    while pos < end:
+        block_end = min(pos + block_size, end)
+
+        # Assemble the block from the child streams it overlaps
+        pieces = []
+        weight_pieces = []
+        while pos < block_end:
+            if pos // RANDOM_STREAM_SIZE != stream_index:
+                stream_index = pos // RANDOM_STREAM_SIZE
+                stream_normals = _stream_normals(seed, stream_index,
+                                                 num_factors, sampling,
+                                                 sobol_engine)
+                stream_normals, stream_log_weights = _shift_normals(
+                    stream_normals, mean_shift)
+                if transform is not None:
+                    stream_normals = transform(stream_normals)
+            offset = stream_index * RANDOM_STREAM_SIZE
+            stop = min(block_end, offset + RANDOM_STREAM_SIZE)
+            pieces.append(stream_normals[pos - offset:stop - offset])
+            weight_pieces.append(stream_log_weights[pos - offset:stop - offset])
+            pos = stop
+        yield np.concatenate(pieces), np.concatenate(weight_pieces)
+
+
+def _stream_normals(seed, stream_index, num_factors, sampling,
+                    sobol_engine=None):
+    # All the normals of one child stream (RANDOM_STREAM_SIZE scenarios)
+    if sampling == 'sobol':
+        # The Sobol points of the stream are the points of the single
+        # scrambled sequence starting at the first scenario of the stream
+        sobol_engine.reset()
+        if stream_index > 0:
+            sobol_engine.fast_forward(stream_index * RANDOM_STREAM_SIZE)
+        return _sobol_normals(sobol_engine, RANDOM_STREAM_SIZE)
+
+    rng = random_stream(seed, stream_index)
+    if sampling == 'antithetic':
+        normals = rng.standard_normal((RANDOM_STREAM_SIZE // 2, num_factors))
+        std_normals = np.empty((RANDOM_STREAM_SIZE, num_factors))
+        std_normals[0::2] = normals
+        std_normals[1::2] = -normals
+        return std_normals
+
+    std_normals = rng.standard_normal((RANDOM_STREAM_SIZE, num_factors))
+    if sampling == 'moment_matching':
+        std_normals = _match_moments(std_normals)
+    return std_normals
+
+
+def _sobol_normals(sobol_engine, num_sims):
+    uniforms = sobol_engine.random(num_sims)
+    # Keep the uniforms away from 0 and 1 before inverting
+    uniforms = np.clip(uniforms, 1e-12, 1 - 1e-12)
+    return ndtri(uniforms)
+
+
+def _match_moments(std_normals):
+    # Remove the sample mean and whiten with the sample covariance. This needs
+    # more scenarios than factors, otherwise only the mean is matched
+    std_normals = std_normals - np.mean(std_normals, axis=0)
+    num_sims, num_factors = std_normals.shape
+    if num_sims <= num_factors:
+        return std_normals
+    sample_cov = np.dot(np.transpose(std_normals), std_normals) / (num_sims - 1)
+    try:
+        lower = cholesky(sample_cov, lower=True)
+    except np.linalg.LinAlgError:
+        return std_normals
+    return np.transpose(solve_triangular(lower, np.transpose(std_normals),
+                                         lower=True))
+
+
+def covariance_cholesky(corr_matrix, std_dev_vector):
+    '''
+    covariance_cholesky(corr_matrix, std_dev_vector)
+
+    Functionality
+    =============
+    Returns the lower Cholesky factor of the covariance matrix of the risk
+    factors. The factor is shared through the covariance factorization cache
+    so it is only computed (and repaired if the matrix is not PSD) once
 
-    # Step 5: Calculate Diffusion Term
-    diffusion_term_matrix = (math.sqrt(scaling_factor)) * np.dot(lower_cholesky,
-                                                                 std_normal_matrix)
-    # Output the diffusion term matrix with rows representing different simulations and columns representing each risk factor:
-    diffusion_term_matrix = np.transpose(diffusion_term_matrix)
+    Parameters
+    ==========
+    corr_matrix : pandas dataframe
+        correlation matrix of the risk factor time series
+    std_dev_vector : pandas dataframe
+        standard deviations of the risk factor time series
 
-    scenarios = pd.DataFrame(diffusion_term_matrix, columns=col_names)
-    return scenarios
+    Returns
+    =======
+    lower_cholesky : numpy array
+        the lower Cholesky factor of the covariance matrix
+    '''
+    factorization = get_covariance_factorization(corr_matrix, std_dev_vector)
+    return factorization.get_lower_cholesky()
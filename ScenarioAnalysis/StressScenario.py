@@ -0,0 +1,347 @@
+###
+# Declarative stress scenarios. A stress scenario is a list of relative and
+# absolute shocks to the risk factors matching a pattern. It is compiled into
+# a single shock vector and applied to the market environment in one pass
+###
+
+import os
+import json
+import fnmatch
+import numpy as np
+import pandas as pd
+from ScenarioEngine import ScenarioEngine
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# Types of shock and the file types stress scenarios can be loaded from
+SHOCK_TYPES = ['relative', 'absolute']
+YAML_FILETYPES = ['.yaml', '.yml']
+
+
+class StressScenario(object):
+    '''
+    StressScenario(object)
+
+    Class describing a stress scenario as an ordered list of shocks. Each
+    shock applies a change to every risk factor matching a pattern, which is
+    either a prefix of whole tokens of the names (e.g.
+    "Matrices-CreditSpreads-Ratings") or a glob pattern (e.g.
+    "Curves-RiskFree-*-USD-*"). A relative shock multiplies the factor by
+    (1 + change) and an absolute shock adds the change. Shocks are applied in
+    order, so the scenario compiles into a scale and a shift of each factor.
+
+    Attributes
+    ==========
+    ID : str
+        ID of the stress scenario
+    description : str
+        description of the stress scenario
+    shocks : list of dict
+        the shocks with keys 'factors' (pattern), 'change' and 'type'
+        ('relative' or 'absolute')
+
+    Methods
+    =======
+    get_ID :
+        returns the ID of the stress scenario
+    get_description :
+        returns the description of the stress scenario
+    get_shocks :
+        returns the list of shocks
+    add_shock :
+        adds a shock to the risk factors matching a pattern
+    add_relative_shock :
+        adds a relative shock to the risk factors matching a pattern
+    add_absolute_shock :
+        adds an absolute shock to the risk factors matching a pattern
+    compile :
+        returns the risk factors shocked and their scale and shift (raises a
+        ValueError if a shock matches no risk factor)
+    to_dict :
+        returns the stress scenario as a dictionary (e.g. to save as JSON)
+    '''
+
+    # -------------------------------------------------------------------------
+    # Object Definition
+    # -------------------------------------------------------------------------
+    def __init__(self, ID, shocks=None, description=''):
+        self.ID = ID
+        self.description = description
+        self.shocks = []
+        if shocks != None:
+            for shock in shocks:
+                self.add_shock(shock['factors'], shock['change'],
+                               shock.get('type', 'relative'))
+
+    # -------------------------------------------------------------------------
+    # Basic getter functions and functions to add shocks
+    # -------------------------------------------------------------------------
+    def get_ID(self):
+        return self.ID
+
+    def get_description(self):
+        return self.description
+
+    def get_shocks(self):
+        return self.shocks
+
+    def add_shock(self, factors, change, shock_type='relative'):
+        if shock_type not in SHOCK_TYPES:
+            raise ValueError('Shock type must be one of ' + str(SHOCK_TYPES) +
+                             ' (given ' + str(shock_type) + ')')
+        self.shocks.append({'factors': factors, 'change': float(change),
+                            'type': shock_type})
+
+    def add_relative_shock(self, factors, change):
+        self.add_shock(factors, change, 'relative')
+
+    def add_absolute_shock(self, factors, change):
+        self.add_shock(factors, change, 'absolute')
+
+    # -------------------------------------------------------------------------
+    # Compile the shocks into new value = scale * value + shift for each
+    # risk factor that is shocked (in the order of the risk factor index). A
+    # shock matching no risk factor is an error rather than doing nothing
+    # -------------------------------------------------------------------------
+    def compile(self, risk_factor_index):
+        scale = np.ones(risk_factor_index.get_num_factors())
+        shift = np.zeros(risk_factor_index.get_num_factors())
+        shocked = np.zeros(risk_factor_index.get_num_factors(), bool)
+
+        for shock in self.shocks:
+            slots = match_risk_factors(risk_factor_index, shock['factors'])
+            if len(slots) == 0:
+                raise ValueError('The shock to ' + str(shock['factors']) +
+                                 ' of stress scenario ' + str(self.ID) +
+                                 ' matches no risk factor')
+            if shock['type'] == 'relative':
+                scale[slots] = scale[slots] * (1 + shock['change'])
+                shift[slots] = shift[slots] * (1 + shock['change'])
+            else:
+                shift[slots] = shift[slots] + shock['change']
+            shocked[slots] = True
+
+        factor_names = risk_factor_index.get_factor_names()
+        factor_names = [factor_names[ii] for ii in np.flatnonzero(shocked)]
+        return factor_names, scale[shocked], shift[shocked]
+
+    def to_dict(self):
+        return {'ID': self.ID, 'description': self.description,
+                'shocks': [dict(shock) for shock in self.shocks]}
+
+
+def match_risk_factors(risk_factor_index, pattern):
+    '''
+    match_risk_factors(risk_factor_index, pattern)
+
+    Functionality
+    =============
+    Finds the slots of the risk factors matching a pattern. Patterns with
+    glob wildcards ('*', '?', '[') are matched against the whole name and
+    other patterns are a prefix of whole tokens of the name
+
+    Parameters
+    ==========
+    risk_factor_index : RiskFactorIndex object
+        the index of the risk factors of the market environment
+    pattern : str
+        e.g. "Constants-MarketPrice" or "Curves-RiskFree-*-USD-*"
+
+    Returns
+    =======
+    slots : numpy array of int
+        the slots of the matching risk factors in the index
+    '''
+    if any(char in pattern for char in '*?['):
+        factor_names = risk_factor_index.get_factor_names()
+        slots = [ii for ii, name in enumerate(factor_names)
+                 if fnmatch.fnmatchcase(name, pattern)]
+    else:
+        slots = risk_factor_index.get_slots_with_prefix(pattern)
+    return np.asarray(slots, int)
+
+
+def load_stress_scenarios(file_name):
+    '''
+    load_stress_scenarios(file_name)
+
+    Functionality
+    =============
+    Loads a library of stress scenarios from a JSON or YAML file. The file
+    holds a list of scenarios (or a dictionary with the list under
+    'stress_scenarios'), each with an 'ID', an optional 'description' and a
+    list of 'shocks' with keys 'factors', 'change' and 'type', e.g.
+
+        - ID: Adverse
+          shocks:
+            - {factors: Constants-MarketPrice, change: -0.5, type: relative}
+
+    Parameters
+    ==========
+    file_name : str
+        the path of the file (.json, .yaml or .yml)
+
+    Returns
+    =======
+    stress_scenarios : list of StressScenario objects
+        the stress scenarios in the order of the file
+    '''
+    file_type = os.path.splitext(file_name)[1].lower()
+    with open(file_name, 'r') as stress_file:
+        if file_type in YAML_FILETYPES:
+            if yaml == None:
+                raise ImportError('PyYAML is required to load ' + file_name)
+            specs = yaml.safe_load(stress_file)
+        else:
+            specs = json.load(stress_file)
+
+    if isinstance(specs, dict):
+        specs = specs.get('stress_scenarios', [specs])
+
+    return [StressScenario(spec['ID'], spec.get('shocks', []),
+                           spec.get('description', '')) for spec in specs]
+
+
+def compile_stress_scenarios(mkt_env, stress_scenarios):
+    '''
+    compile_stress_scenarios(mkt_env, stress_scenarios)
+
+    Functionality
+    =============
+    Compiles a library of stress scenarios into a ScenarioEngine over all the
+    risk factors shocked by any of them and the matrix of shocked states
+
+    Parameters
+    ==========
+    mkt_env : market_environment object
+        a market environment object of current market data
+    stress_scenarios : list of StressScenario objects
+        the stress scenarios to compile
+
+    Returns
+    =======
+    engine : ScenarioEngine object
+        the engine over the shocked risk factors
+    states : numpy array
+        the shocked state vector of each stress scenario (Rows=Scenarios)
+    '''
+    risk_factor_index = mkt_env.get_risk_factor_index()
+    compiled = [stress.compile(risk_factor_index)
+                for stress in stress_scenarios]
+
+    # Keep the order of the risk factor index for the shocked factors
+    shocked = set()
+    for factor_names, _, _ in compiled:
+        shocked.update(factor_names)
+    factor_names = [name for name in risk_factor_index.get_factor_names()
+                    if name in shocked]
+
+    engine = ScenarioEngine(mkt_env, factor_names)
+    base_state = engine.get_base_state()
+    states = np.tile(base_state, (len(compiled), 1))
+    for ii, (names, scale, shift) in enumerate(compiled):
+        slots = np.array([engine.get_slot(name) for name in names], int)
+        states[ii, slots] = base_state[slots] * scale + shift
+
+    return engine, states
+
+
+def apply_stress_scenario(mkt_env, stress_scenario):
+    '''
+    apply_stress_scenario(mkt_env, stress_scenario)
+
+    Functionality
+    =============
+    Applies all the shocks of a stress scenario in a single pass
+
+    Parameters
+    ==========
+    mkt_env : market_environment object
+        a market environment object of current market data
+    stress_scenario : StressScenario object
+        the stress scenario to apply
+
+    Returns
+    =======
+    a new market environment with the stress scenario applied
+    '''
+    engine, states = compile_stress_scenarios(mkt_env, [stress_scenario])
+    return engine.build_mkt_env(states[0], stress_scenario.get_ID())
+
+
+def generate_stress_PnL(portfolios, mkt_env, stress_scenarios):
+    '''
+    generate_stress_PnL(portfolios, mkt_env, stress_scenarios)
+
+    Functionality
+    =============
+    Revalues one or more portfolios under a whole library of stress
+    scenarios. The scenarios are compiled together, each stressed market
+    environment is built once and shared by all the portfolios, and the base
+    value of each portfolio is only calculated once
+
+    Parameters
+    ==========
+    portfolios : dict (str:portfolio object)
+        the portfolios to value by name
+    mkt_env : market_environment object
+        a market environment object of current market data
+    stress_scenarios : list of StressScenario objects
+        the stress scenarios to evaluate
+
+    Returns
+    =======
+    PnL : pandas dataframe
+        profit and loss of each portfolio (Col) under each stress scenario
+        (Rows, indexed by the ID of the scenario)
+    '''
+    orig_vals = dict((name, portfolio.value_product(mkt_env))
+                     for name, portfolio in portfolios.items())
+    engine, states = compile_stress_scenarios(mkt_env, stress_scenarios)
+
+    PnL = pd.DataFrame(0.0, index=[stress.get_ID() for stress in
+                                   stress_scenarios],
+                       columns=list(portfolios.keys()))
+    for ii, stress in enumerate(stress_scenarios):
+        mkt_env_new = engine.build_mkt_env(states[ii], stress.get_ID())
+        for name, portfolio in portfolios.items():
+            PnL.iloc[ii, PnL.columns.get_loc(name)] = (
+                portfolio.value_product(mkt_env_new) - orig_vals[name])
+
+    return PnL
+
+
+# -----------------------------------------------------------------------------
+# Testing
+# -----------------------------------------------------------------------------
+if __name__ == '__main__':
+    import datetime as dt
+    from MarketData import MarketEnvironment, RiskFactorIndex
+
+    print('\nTesting StressScenario.py...')
+    mkt_env = MarketEnvironment('Test', dt.datetime(2017, 6, 1))
+    mkt_env.add_constant('MarketPrice-XYZ', 100.0)
+    mkt_env.add_curve('RiskFree-Gov-USD', pd.DataFrame([[0.01, 0.02]],
+                                                       columns=['1', '5']))
+    risk_factor_index = RiskFactorIndex(mkt_env, [
+        'Constants-MarketPrice-XYZ', 'Curves-RiskFree-Gov-USD-1',
+        'Curves-RiskFree-Gov-USD-5'])
+    stress = StressScenario('Test', [
+        {'factors': 'Constants-MarketPrice', 'change': -0.5},
+        {'factors': 'Curves-RiskFree-*-USD-*', 'change': 0.01,
+         'type': 'absolute'}])
+    factor_names, scale, shift = stress.compile(risk_factor_index)
+    assert factor_names == risk_factor_index.get_factor_names()
+    print(factor_names, scale, shift)
+
+    # A mistyped pattern raises an error naming the pattern
+    stress.add_relative_shock('Constants-MarketPrices', -0.5)
+    try:
+        stress.compile(risk_factor_index)
+        raise AssertionError('The unmatched shock was not reported')
+    except ValueError as error:
+        assert 'Constants-MarketPrices' in str(error)
+        print(error)
@@ -1,7 +1,12 @@
 from AdverseScenarios import *
+from CovarianceFactorization import *
+from FilteredHistoricScenarios import *
 from FinancialStabilityStressScenario import *
 from GenericScenarios import *
+from HistoricScenarioStore import *
 from HistoricScenarios import *
+from ScenarioEngine import *
 from ScenarioGeneration import *
 from Sensitivites import *
 from SimulationEngine import *
+from StressScenario import *
@@ -1,14 +1,28 @@
 import numpy as np
 import math
 
+# Parameterisations of the binomial tree
+TREE_TYPES = ['crr', 'leisen_reimer']
 
-def binomial_tree(S0, K, r, sigma, T, q, N, option, american):
+
+def binomial_tree(S0, K, r, sigma, T, q, N, option, american, tree='crr'):
     '''
-        BinomialTree(S0, K, r, sigma, T, q, N, option, american)
+        BinomialTree(S0, K, r, sigma, T, q, N, option, american, tree='crr')
 
         Functionality:
         ==========
-        Valuation of (American) Options using the Binomial Tree.
+        Valuation of (American) Options using the Binomial Tree. The inputs
+        other than N and american can be arrays that are broadcast against
+        each other, so one call prices an option under a whole batch of
+        states (e.g. the spot, vol and rate of every scenario). Only the
+        option values of one time step are kept, so the memory is O(N) per
+        option, and the backward induction and early exercise are array
+        operations over the nodes of the step and the batch. The tree is
+        either the Cox-Ross-Rubinstein tree or the Leisen-Reimer tree, whose
+        probabilities come from the Peizer-Pratt inversion of the Black-Scholes
+        d1 and d2 so it converges smoothly (second order for European options)
+        instead of oscillating with N. The Leisen-Reimer tree uses an odd
+        number of steps (N + 1 if N is even)
 
         Parameters
         ==========
@@ -21,61 +35,103 @@ def binomial_tree(S0, K, r, sigma, T, q, N, option, american):
         N: number of branches in the binomial tree
         option: call/put
         american: true/false
+        tree: the tree parameterisation (one of TREE_TYPES)
 
         Returns
         =======
         price_info: a dictionary of the option price and sensitivities
         '''
+    scalar = all(np.ndim(x) == 0 for x in [S0, K, r, sigma, T, q, option])
+    S0, K, r, sigma, T, q = np.broadcast_arrays(
+        *[np.asarray(x, float) for x in [S0, K, r, sigma, T, q]])
+    cp = np.where(np.char.lower(np.asarray(option).astype(str)) == 'call',
+                  1.0, -1.0)
+    N = int(N)
+    if tree not in TREE_TYPES:
+        raise ValueError('Tree must be one of ' + str(TREE_TYPES) +
+                         ' (given ' + str(tree) + ')')
+    if tree == 'leisen_reimer' and N % 2 == 0:
+        N += 1
+
     # ensure interest rate is non-negative
-    if r < 0:
-        r = 0
-
-    # Basic Calculations
-    h = 1.0 * T / N
-    u = math.exp(sigma * math.sqrt(h))
-    d = math.exp(-1.0 * sigma * math.sqrt(h))
-    drift = math.exp((r - q) * h)
-    p = (drift - d) / (u - d)
-
-    if option == 'call':
-        cp = 1.0
+    r = np.maximum(r, 0)
+
+    # Expired options are priced from a unit time and replaced at the end
+    live = T > 0
+    T = np.where(live, T, 1.0)
+
+    # Basic Calculations (with a trailing axis for the nodes of a step)
+    h = (T / N)[..., np.newaxis]
+    growth = np.exp((r - q)[..., np.newaxis] * h)
+    discount = np.exp(-r[..., np.newaxis] * h)
+    if tree == 'crr':
+        u = np.exp(sigma[..., np.newaxis] * np.sqrt(h))
+        d = 1.0 / u
+        p = (growth - d) / (u - d)
     else:
-        cp = -1.0
-
-    # Process the terminal stock price
-    stkval = np.zeros((N + 1, N + 1))
-    optval = np.zeros((N + 1, N + 1))
-    stkval[0, 0] = S0
-    for ii in range(1, N + 1):
-        stkval[ii, 0] = stkval[ii - 1, 0] * u
-        for jj in range(1, ii + 1):
-            stkval[ii, jj] = stkval[ii - 1, jj - 1] * d
-
-    # Backward recursion of option price
-    for jj in range(N + 1):
-        optval[N, jj] = max(0, cp * (stkval[N, jj] - K))
+        sigma_sqrt_T = sigma * np.sqrt(T)
+        d1 = (np.log(S0 / K) + (r - q + 0.5 * sigma ** 2) * T) / sigma_sqrt_T
+        p = peizer_pratt_inversion(d1 - sigma_sqrt_T, N)[..., np.newaxis]
+        p_star = peizer_pratt_inversion(d1, N)[..., np.newaxis]
+        u = growth * p_star / p
+        d = (growth - p * u) / (1 - p)
+    cp = np.asarray(cp)[..., np.newaxis]
+    K = K[..., np.newaxis]
+
+    # Process the terminal stock price (node j has N - j up moves)
+    jj = np.arange(N + 1)
+    stkval = S0[..., np.newaxis] * u ** (N - jj) * d ** jj
+    optval = np.maximum(0, cp * (stkval - K))
+
+    # Backward recursion of option price, keeping the first two steps for
+    # the sensitivities
+    levels = {}
     for ii in range(N - 1, -1, -1):
-        for jj in range(ii + 1):
-            optval[ii, jj] = (p * optval[ii + 1, jj] + (1 - p) * optval[
-                ii + 1, jj + 1]) / drift
-            if american:
-                optval[ii, jj] = max(optval[ii, jj], cp * (stkval[ii, jj] - K))
+        optval = discount * (p * optval[..., :-1] +
+                             (1 - p) * optval[..., 1:])
+        stkval = stkval[..., :-1] / u
+        if american:
+            optval = np.maximum(optval, cp * (stkval - K))
+        if ii <= 2:
+            levels[ii] = (stkval, optval)
 
     # Calculate price and sensitivities
-    value = optval[0, 0]
+    value = optval[..., 0]
+
+    stk1, opt1 = levels[min(1, N - 1)]
+    delta = (opt1[..., 0] - opt1[..., -1]) / (stk1[..., 0] - stk1[..., -1])
 
-    delta = (optval[1, 0] - optval[1, 1]) / (stkval[1, 0] - stkval[1, 1])
+    if N >= 3:
+        stk2, opt2 = levels[2]
+        g_num1 = (opt2[..., 0] - opt2[..., 1]) / (stk2[..., 0] - stk2[..., 1])
+        g_num2 = (opt2[..., 1] - opt2[..., 2]) / (stk2[..., 1] - stk2[..., 2])
+        g_denom = 0.5 * (stk2[..., 0] - stk2[..., 2])
+        gamma = (g_num1 - g_num2) / g_denom
+    else:
+        gamma = np.full(value.shape, np.nan)
 
-    g_num1 = (optval[2, 0] - optval[3, 2]) / (stkval[2, 0] - stkval[3, 2])
-    g_num2 = (optval[2, 1] - optval[3, 3]) / (stkval[2, 1] - stkval[3, 3])
-    g_denom = 0.5 * (stkval[3, 1] - stkval[3, 3])
-    gamma = (g_num1 - g_num2) / g_denom
+    if not live.all():
+        intrinsic = np.maximum(cp[..., 0] * (S0 - K[..., 0]), 0)
+        value = np.where(live, value, intrinsic)
+        delta = np.where(live, delta, cp[..., 0] * (intrinsic > 0))
+        gamma = np.where(live, gamma, 0.0)
 
     price_info = {'value': value, 'delta': delta, 'gamma': gamma}
+    if scalar:
+        price_info = dict((k, float(v)) for k, v in price_info.items())
 
     return price_info
 
 
+def peizer_pratt_inversion(z, N):
+    # Peizer-Pratt (method 2) approximation of the probability of a binomial
+    # tree with N steps (N odd) matching the normal probability of z
+    z = np.asarray(z, float)
+    x = z / (N + 1.0 / 3 + 0.1 / (N + 1))
+    return 0.5 + np.sign(z) * np.sqrt(0.25 - 0.25 * np.exp(-x ** 2 *
+                                                          (N + 1.0 / 6)))
+
+
 if __name__ == '__main__':
     S0 = 100
     K = 100
@@ -6,8 +6,10 @@
 # Analytical Black-Scholes-Merton (BSM) Formula
 
 import numpy as np
+import pandas as pd
 from math import log, sqrt, exp
-from scipy import stats
+from scipy import stats, optimize
+from scipy.special import ndtr
 
 
 def black_scholes_value(index_price, strike, time, risk_free, sigma, div_yield,
@@ -31,50 +33,104 @@ def black_scholes_value(index_price, strike, time, risk_free, sigma, div_yield,
     value : present value of the European call/put option
     '''
 
+    price_info = black_scholes_values(index_price, strike, time, risk_free,
+                                      sigma, div_yield, option_type)
+
+    return dict((k, float(v)) for k, v in price_info.items())
+
+
+def black_scholes_values(index_price, strike, time, risk_free, sigma,
+                         div_yield, option_type):
+    '''
+    Valuation of European options and the Greeks in BSM model over arrays of
+    inputs. All the inputs are broadcast against each other, so a single
+    call prices a whole book of options under every scenario (e.g. inputs of
+    shape (scenarios, 1) and (1, options)). Options at or past expiry are
+    given their intrinsic value.
+
+    Parameters
+    ==========
+    index_price : initial stock/index levels
+    strike : strike prices
+    time : maturity dates (in year fractions)
+    risk_free : constant risk-free short rates
+    sigma : volatility factors in diffusion term
+    div_yield: continuously compounded dividend yields
+    option_type: call/put (a string or an array of them, or an array of
+        booleans that are True for calls)
+
+    Returns
+    =======
+    price_info : dict of numpy arrays
+        the 'value', 'delta', 'theta', 'rho', 'vega' and 'gamma' of the
+        options
+    '''
+
     days_in_year = 365
 
-    # ensure interest rate is non-negative
-    if risk_free < 0:
-        risk_free = 0
+    index_price = np.asarray(index_price, float)
+    strike = np.asarray(strike, float)
+    time = np.asarray(time, float)
+    sigma = np.asarray(sigma, float)
+    div_yield = np.asarray(div_yield, float)
 
-    index_price = float(index_price)
+    # ensure interest rate is non-negative
+    risk_free = np.maximum(np.asarray(risk_free, float), 0)
 
-    d_plus = (log(index_price / strike) + (
-            risk_free - div_yield + 0.5 * sigma ** 2) * time) / (
-                     sigma * sqrt(time))
-    d_minus = d_plus - (sigma * sqrt(time))
+    # +1 for calls and -1 for puts
+    eta = option_sign(option_type)
 
-    discount_factor_risk_free = exp(-risk_free * time)
-    discount_factor_div_yield = exp(-div_yield * time)
+    # Expired options are priced from a zero time so the formulas stay finite
+    live = time > 0
+    time = np.where(live, time, 1.0)
+    sqrt_time = np.sqrt(time)
+    sigma_sqrt_time = sigma * sqrt_time
 
-    norm_pdf_d_plus = stats.norm.pdf(d_plus, 0.0, 1.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        d_plus = (np.log(index_price / strike) + (
+                risk_free - div_yield + 0.5 * sigma ** 2) * time) / (
+                     sigma_sqrt_time)
+    d_minus = d_plus - sigma_sqrt_time
 
-    if option_type == 'call':
-        eta = 1
-    else:
-        eta = -1
+    discount_factor_risk_free = np.exp(-risk_free * time)
+    discount_factor_div_yield = np.exp(-div_yield * time)
 
-    eta_norm_cdf_d_plus = stats.norm.cdf(eta * d_plus, 0.0, 1.0)
-    eta_norm_cdf_d_minus = stats.norm.cdf(eta * d_minus, 0.0, 1.0)
+    norm_pdf_d_plus = np.exp(-0.5 * d_plus ** 2) / sqrt(2 * np.pi)
+    eta_norm_cdf_d_plus = ndtr(eta * d_plus)
+    eta_norm_cdf_d_minus = ndtr(eta * d_minus)
 
     value = eta * (
-            index_price * discount_factor_div_yield * eta_norm_cdf_d_plus - strike * discount_factor_risk_free * eta_norm_cdf_d_minus)
+            index_price * discount_factor_div_yield * eta_norm_cdf_d_plus -
+            strike * discount_factor_risk_free * eta_norm_cdf_d_minus)
 
     delta = eta * discount_factor_div_yield * eta_norm_cdf_d_plus
 
-    gamma = discount_factor_div_yield / (
-            index_price * sigma * sqrt(time)) * norm_pdf_d_plus
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gamma = discount_factor_div_yield / (
+                index_price * sigma_sqrt_time) * norm_pdf_d_plus
 
     theta = (-(index_price * sigma * discount_factor_div_yield / (
-            2 * sqrt(time)) * norm_pdf_d_plus) - eta * (
-                     risk_free * strike * discount_factor_risk_free * eta_norm_cdf_d_minus + div_yield * index_price * discount_factor_div_yield * eta_norm_cdf_d_plus) / (
+            2 * sqrt_time) * norm_pdf_d_plus) - eta * (
+                     risk_free * strike * discount_factor_risk_free *
+                     eta_norm_cdf_d_minus + div_yield * index_price *
+                     discount_factor_div_yield * eta_norm_cdf_d_plus) / (
                      days_in_year * time))
 
     rho = eta * (
-            0.01 * strike * time * discount_factor_risk_free * eta_norm_cdf_d_minus)
+            0.01 * strike * time * discount_factor_risk_free *
+            eta_norm_cdf_d_minus)
 
-    vega = 0.01 * index_price * discount_factor_div_yield * sqrt(
-        time) * norm_pdf_d_plus
+    vega = 0.01 * index_price * discount_factor_div_yield * sqrt_time * \
+        norm_pdf_d_plus
+
+    if not live.all():
+        intrinsic = np.maximum(eta * (index_price - strike), 0)
+        value = np.where(live, value, intrinsic)
+        delta = np.where(live, delta, eta * (intrinsic > 0))
+        theta = np.where(live, theta, 0.0)
+        rho = np.where(live, rho, 0.0)
+        vega = np.where(live, vega, 0.0)
+        gamma = np.where(live, gamma, 0.0)
 
     return {'value': value, 'delta': delta, 'theta': theta, 'rho': rho,
             'vega': vega, 'gamma': gamma}
@@ -98,28 +154,179 @@ def calculate_implied_vol(index_price, strike, time, risk_free, option_price,
 
     Returns
     =======
-    simga_est : numerically estimated implied volatility
+    simga_est : numerically estimated implied volatility (nan if the price
+        is outside the no-arbitrage bounds)
     '''
 
-    MAX_JUMP = 0.5
-    TOLERENCE = 0.000000000000001
+    return float(calculate_implied_vols(index_price, strike, time, risk_free,
+                                        option_price, div_yield, option_type,
+                                        sigma_est, max_iterations))
 
-    for i in range(max_iterations):
-        bsm_result = black_scholes_value(index_price, strike, time, risk_free,
-                                         sigma_est, div_yield, option_type)
 
-        price_difference = bsm_result['value'] - option_price
-        d_sigma = price_difference / (100 * bsm_result['vega'])
+def calculate_implied_vols(index_price, strike, time, risk_free, option_price,
+                           div_yield, option_type, sigma_est=None,
+                           max_iterations=50, tolerance=1e-10):
+    '''
+    Implied volatilities of arrays of option quotes, solved together. The
+    inputs are broadcast against each other. Puts are converted to calls by
+    put-call parity and each quote starts from the Corrado-Miller rational
+    approximation. All the quotes then take safeguarded Halley steps on the
+    vega and volga: each quote keeps a bracket of its implied volatility and
+    bisects whenever a step leaves it. The quotes still unconverged after
+    max_iterations are finished by Brent's method on their bracket. Quotes
+    outside the no-arbitrage bounds give nan.
 
-        if d_sigma < TOLERENCE:
+    Parameters
+    ==========
+    index_price : initial stock/index levels
+    strike : strike prices
+    time : maturity dates (in year fractions)
+    risk_free : constant risk-free short rates
+    option_price : the options' prices
+    div_yield : continuously compounded dividend yields
+    option_type : call/put (a string or an array of them, or an array of
+        booleans that are True for calls)
+    sigma_est : estimates of impl. volatility (None for the rational guess)
+    max_iterations : the maximum number of Halley iterations
+    tolerance : the tolerance of the price error
+
+    Returns
+    =======
+    sigma : numpy array of numerically estimated implied volatilities
+    '''
+
+    MIN_SIGMA = 1e-8
+    MAX_SIGMA = 10.0
+
+    index_price, strike, time, risk_free, option_price, div_yield, \
+        option_type = np.broadcast_arrays(
+            np.asarray(index_price, float), np.asarray(strike, float),
+            np.asarray(time, float), np.asarray(risk_free, float),
+            np.asarray(option_price, float), np.asarray(div_yield, float),
+            np.asarray(option_type))
+    shape = index_price.shape
+    S = index_price.ravel()
+    K = strike.ravel()
+    T = time.ravel()
+    q = div_yield.ravel()
+    r = np.maximum(risk_free.ravel(), 0)
+    call = option_sign(option_type.ravel()) > 0
+
+    # Convert puts to calls and check the no-arbitrage bounds
+    disc_S = S * np.exp(-q * T)
+    disc_K = K * np.exp(-r * T)
+    price = np.where(call, option_price.ravel(),
+                     option_price.ravel() + disc_S - disc_K)
+    lower = np.maximum(disc_S - disc_K, 0)
+    with np.errstate(invalid='ignore'):
+        valid = (T > 0) & (price > lower) & (price < disc_S)
+
+    # Corrado-Miller initial guess
+    with np.errstate(invalid='ignore', divide='ignore'):
+        a = price - 0.5 * (disc_S - disc_K)
+        b = np.maximum(a ** 2 - (disc_S - disc_K) ** 2 / np.pi, 0)
+        sigma = np.sqrt(2 * np.pi / T) / (disc_S + disc_K) * (a + np.sqrt(b))
+    if sigma_est is not None:
+        sigma = np.broadcast_to(np.asarray(sigma_est, float), shape).ravel()
+    sigma = np.where(np.isfinite(sigma), np.clip(sigma, 0.01, 3.0), 0.2)
+
+    lo = np.full(len(S), MIN_SIGMA)
+    hi = np.full(len(S), MAX_SIGMA)
+    active = valid.copy()
+    for _ in range(int(max_iterations)):
+        idx = np.flatnonzero(active)
+        if len(idx) == 0:
             break
-        elif abs(d_sigma) > MAX_JUMP:
-            d_sigma = np.sign(d_sigma) * MAX_JUMP
+        sig = sigma[idx]
+        price_info = black_scholes_values(S[idx], K[idx], T[idx], r[idx],
+                                          sig, q[idx], True)
+        diff = price_info['value'] - price[idx]
+        done = np.abs(diff) <= tolerance
+        active[idx[done]] = False
+
+        # Shrink the brackets (the price increases with the volatility)
+        hi[idx] = np.where(diff > 0, sig, hi[idx])
+        lo[idx] = np.where(diff < 0, sig, lo[idx])
+
+        # Halley step, falling back to bisection outside the bracket
+        vega = 100 * price_info['vega']
+        sqrt_T = np.sqrt(T[idx])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            d_plus = (np.log(S[idx] / K[idx]) + (
+                    r[idx] - q[idx] + 0.5 * sig ** 2) * T[idx]) / (
+                             sig * sqrt_T)
+            d_minus = d_plus - sig * sqrt_T
+            newton = diff / vega
+            halley = newton / (1 - 0.5 * newton * d_plus * d_minus / sig)
+            new_sigma = sig - halley
+            bisect = (~np.isfinite(new_sigma) | (new_sigma <= lo[idx]) |
+                      (new_sigma >= hi[idx]))
+        new_sigma = np.where(bisect, 0.5 * (lo[idx] + hi[idx]), new_sigma)
+        sigma[idx] = np.where(done, sig, new_sigma)
+
+    # Brent's method for the quotes that have not converged
+    for ii in np.flatnonzero(active):
+        def _price_error(x):
+            return black_scholes_value(S[ii], K[ii], T[ii], r[ii], x, q[ii],
+                                       'call')['value'] - price[ii]
+        try:
+            sigma[ii] = optimize.brentq(_price_error, lo[ii], hi[ii],
+                                        xtol=1e-14)
+        except ValueError:
+            sigma[ii] = np.nan
+
+    sigma = np.where(valid, sigma, np.nan)
+    return sigma.reshape(shape)
+
+
+def implied_vol_surface(index_price, option_prices, risk_free, div_yield,
+                        option_type='call'):
+    '''
+    Implied volatility surface (e.g. ImpliedVols-<ccy>-<ticker>) from a grid
+    of option quotes, solved in a single call of calculate_implied_vols.
 
-        sigma_est -= d_sigma
-        sigma_est = max(sigma_est, 0)
+    Parameters
+    ==========
+    index_price : current stock/index level
+    option_prices : pandas dataframe of option prices with the maturities
+        (in year fractions) as the index and the strikes as percentages of
+        the index level as the columns
+    risk_free : risk-free short rate (or one per maturity)
+    div_yield : continuously compounded dividend yield
+    option_type : call/put (or a dataframe of them like option_prices)
+
+    Returns
+    =======
+    surface : pandas dataframe of implied volatilities with the labels of
+        option_prices
+    '''
 
-    return sigma_est
+    maturities = np.array([float(i) for i in option_prices.index])
+    strike_pcts = np.array([float(i) for i in list(option_prices)])
+    risk_free = np.asarray(risk_free, float)
+    if risk_free.ndim == 1:
+        risk_free = risk_free[:, np.newaxis]
+    if isinstance(option_type, pd.DataFrame):
+        option_type = option_type.values
+
+    sigma = calculate_implied_vols(index_price,
+                                   index_price * strike_pcts[np.newaxis, :],
+                                   maturities[:, np.newaxis], risk_free,
+                                   option_prices.values, div_yield,
+                                   option_type)
+
+    return pd.DataFrame(sigma, index=option_prices.index,
+                        columns=option_prices.columns)
+
+
+def option_sign(option_type):
+    # +1 for calls and -1 for puts, from 'call'/'put' strings (any case) or
+    # booleans that are True for calls
+    option_type = np.asarray(option_type)
+    if option_type.dtype == bool:
+        return np.where(option_type, 1.0, -1.0)
+    return np.where(np.char.lower(option_type.astype(str)) == 'call', 1.0,
+                    -1.0)
 
 
 def get_implied_strike_from_implied_vol(index_price, sigma_implied, time,
@@ -1,52 +1,43 @@
-from dateutil.relativedelta import relativedelta
+import numpy as np
 import FinancialModels as finModels
 
 
 def bond_pricing_function(first_coupon_date, coupon_frequency, maturity_date,
-                          val_date, coupon_rate, face, yield_curve):
-    coupon_rate = 1.0 * coupon_rate / coupon_frequency
-    coupon_amount = coupon_rate / 100. * face
+                          val_date, coupon_rate, face, yield_curve,
+                          return_gradient=False, cashflow_table=None):
+    # If return_gradient is True a dictionary is returned with the 'value'
+    # and the derivative of the value with respect to each key rate of the
+    # 'yield_curve' (found by differentiating the sum of discounted
+    # cashflows by hand, so at about the cost of a single pricing).
+    # The cashflows left at the valuation date can be given as a
+    # cashflow_table (see finModels.coupon_cashflow_table), e.g. the table
+    # cached by the bond, instead of being rebuilt from the schedule
+    if cashflow_table is None:
+        cashflow_table = finModels.coupon_cashflow_table(
+            first_coupon_date, coupon_frequency, maturity_date, val_date,
+            coupon_rate, face)
+    times = cashflow_table['times']
+    cashflows = cashflow_table['amounts']
+
+    rates = np.array(finModels.interpolated_yield_curve(yield_curve, times),
+                     float)
 
-    num_months = 12. / coupon_frequency
-
-    coupon_schedule = [first_coupon_date]
-
-    j = 1
-    while coupon_schedule[-1] < maturity_date:
-        coupon_schedule.append(
-            coupon_schedule[-1] + relativedelta(months=int(num_months)))
-        j = j + 1
-
-    if coupon_schedule[-1] > maturity_date:
-        coupon_schedule[-1] = maturity_date
-
-    CouponSchedule_temp = []
-    for ii in range(0, len(coupon_schedule)):
-        if coupon_schedule[ii] > val_date:
-            CouponSchedule_temp.append(coupon_schedule[ii])
-    coupon_schedule = CouponSchedule_temp
-
-    coupon_schedule_value = []
-    for ii in range(0, len(coupon_schedule)):
-        coupon_schedule_value.append(
-            float((coupon_schedule[ii] - val_date).days) / 365)
+    #    #ensure valuation curve only encompasses non-negative rates
+    #    rates = np.maximum(rates, 0)
 
-    valuation_curve = finModels.interpolated_yield_curve(yield_curve,
-                                                         coupon_schedule_value)
+    # price the coupon stream and the face value payment
+    discount = np.power(1 + rates, -times)
+    price = float(np.dot(cashflows, discount))
 
-    #    #ensure valuation curve only encompasses non-negative rates
-    #    for ii in range(0,len(valuation_curve)):
-    #        if valuation_curve[ii]<0:
-    #            valuation_curve[ii]=0
+    if not return_gradient:
+        return price
 
-    # price coupon stream
-    price = 0
-    for ii in range(0, len(valuation_curve)):
-        price = price + coupon_amount / pow(1 + valuation_curve[ii],
-                                            coupon_schedule_value[ii])
+    # Derivative with respect to each discount rate, mapped back to the key
+    # rates through the interpolation weights
+    rate_gradient = -times * cashflows * discount / (1 + rates)
+    weights = finModels.interpolated_yield_curve_weights(yield_curve, times)
 
-    # add value of Face value payment
-    price = price + face / pow(1 + valuation_curve[-1],
-                               coupon_schedule_value[-1])
+    price_info = {'value': price,
+                  'yield_curve': np.dot(rate_gradient, weights)}
 
-    return price
+    return price_info
@@ -1,107 +1,399 @@
-from dateutil.relativedelta import relativedelta
 import numpy as np
+import FinancialModels as finModels
+
+# Short rate models of the lattice
+SHORT_RATE_MODELS = ['ho_lee', 'hull_white']
+
+# Mean reversion speed of the Hull-White short rate (per year)
+DEFAULT_MEAN_REVERSION = 0.1
 
 
 def callable_bond_pricing_function(initial_short_rate, mu, vol,
                                    first_coupon_date, coupon_frequency,
                                    coupon_rate, face, call_schedule,
                                    call_schedule_exercise_type, val_date,
-                                   maturity_date):
-    num_months = 12. / coupon_frequency
-
-    initial_pmt__after__val_date = first_coupon_date
-    while initial_pmt__after__val_date < val_date:
-        initial_pmt__after__val_date = initial_pmt__after__val_date + relativedelta(
-            months=int(num_months))
-
-    delta_t_1 = (initial_pmt__after__val_date - val_date).days / 365.
-    delta_t_1plus = 1. / coupon_frequency
-
-    # initial_short_rate=0.02
-    # mu=0.1
-    # vol=0.05
-    # CouponRate=10
-    # Face=100
-    # callSchedule=np.matrix([[datetime.datetime(2016,12,1,0,0),102],[datetime.datetime(2017,12,6,0,0),104]])
-    # CallScheduleExerciseType='Bermudan' # Bermudan or American call schedule exercise
-    # MaturityDate=dt.datetime(2018,12,1,0,0)
-    # ValDate=dt.datetime(2017,6,1,0,0)
-
-    coupon_rate = 1.0 * coupon_rate / coupon_frequency
-    coupon_amount = coupon_rate / 100. * face
-
-    n = (
-                maturity_date - val_date).days / 365.  # number of years between valdate and bond maturity
-    n = round(n * 2) / 2  # round to nearest 0.5
-    num_steps = n / 0.5  # number of steps in interest rate tree
-    num_steps = int(num_steps)  # change to integer
-
-    ho__lee__tree = np.zeros(shape=(num_steps, num_steps))
-    ho__lee__tree[0, 0] = initial_short_rate
-
-    row_count_1 = 0
-    for ii in range(1, num_steps - 1 + 1):
-        row_count_1 = row_count_1 + 1
-        for jj in range(0, row_count_1 - 1 + 1):
-            if (ii == 0) & (jj == 0):
-                delta_t = delta_t_1
+                                   maturity_date, model='ho_lee',
+                                   mean_reversion=DEFAULT_MEAN_REVERSION):
+    '''
+    callable_bond_pricing_function(initial_short_rate, mu, vol,
+                                   first_coupon_date, coupon_frequency,
+                                   coupon_rate, face, call_schedule,
+                                   call_schedule_exercise_type, val_date,
+                                   maturity_date, model='ho_lee',
+                                   mean_reversion=DEFAULT_MEAN_REVERSION)
+
+    Functionality
+    =============
+    Values a callable bond by backward induction on a short rate lattice
+    with one step per coupon period. The call is assumed to be exercised
+    just before the coupon payment, so the value of a node is the lower of
+    the strike and the coupon plus the discounted expected value of the next
+    step. The lattice can be shared by all the bonds with the same currency
+    and coupon frequency (see short_rate_lattice and
+    callable_bond_lattice_values)
+
+    Parameters
+    ==========
+    initial_short_rate : double
+        the short rate at the valuation date
+    mu : double
+        the drift of the short rate per year
+    vol : double
+        the volatility of the short rate per year
+    first_coupon_date : datetime
+        the date of the first coupon
+    coupon_frequency : int
+        the number of coupons per year
+    coupon_rate : double
+        the annual coupon rate in percentage terms
+    face : double
+        the face value of the bond
+    call_schedule : numpy matrix
+        the call dates (first column) and strikes (second column)
+    call_schedule_exercise_type : str
+        'Bermudan' (callable on the call dates) or 'American' (callable on
+        or after each call date)
+    val_date : datetime
+        the valuation date
+    maturity_date : datetime
+        the maturity date of the bond
+    model : str
+        the short rate model (one of SHORT_RATE_MODELS)
+    mean_reversion : double
+        the mean reversion speed of the Hull-White model
+
+    Returns
+    =======
+    price : double
+        the value of the callable bond
+    '''
+    schedule = callable_bond_schedule(first_coupon_date, coupon_frequency,
+                                      coupon_rate, face, call_schedule,
+                                      call_schedule_exercise_type, val_date,
+                                      maturity_date)
+    rates = short_rate_lattice(initial_short_rate, mu, vol,
+                               1. / coupon_frequency, schedule['num_steps'],
+                               model, mean_reversion)
+    values = callable_bond_lattice_values(rates, 1. / coupon_frequency,
+                                          [schedule], model, mean_reversion)
+    return float(values[0])
+
+
+def callable_bond_schedule(first_coupon_date, coupon_frequency, coupon_rate,
+                           face, call_schedule, call_schedule_exercise_type,
+                           val_date, maturity_date):
+    '''
+    callable_bond_schedule(first_coupon_date, coupon_frequency, coupon_rate,
+                           face, call_schedule, call_schedule_exercise_type,
+                           val_date, maturity_date)
+
+    Functionality
+    =============
+    The cashflows and call strikes of a callable bond on the steps of a
+    short rate lattice. Step 0 is the valuation date and step i (i >= 1) is
+    the i-th coupon date after it. Each call date is moved to the
+    nearest coupon date. American calls apply from their call date (from
+    step 1 for call dates that have passed) until the next call date and
+    the strike of the steps that cannot be called is infinite
+
+    Parameters
+    ==========
+    (see callable_bond_pricing_function)
+
+    Returns
+    =======
+    schedule : dict
+        the 'num_steps' of the bond, the 'first_period' from the valuation
+        date to the first coupon in years, the 'coupon_amount', the
+        'final_payment' at maturity and the 'strikes' of steps 0 to
+        num_steps
+    '''
+    coupon_amount = 1.0 * coupon_rate / coupon_frequency / 100. * face
+
+    # A coupon on the valuation date has already been paid
+    coupon_dates = [x for x in finModels.generate_coupon_schedule(
+        first_coupon_date, coupon_frequency, maturity_date) if x > val_date]
+    coupon_times = np.array([(x - val_date).days / 365.
+                             for x in coupon_dates])
+    num_steps = len(coupon_dates)
+
+    strikes = np.full(num_steps + 1, np.inf)
+    if num_steps > 0:
+        calls = sorted((call_schedule[ii, 0], float(call_schedule[ii, 1]))
+                       for ii in range(len(call_schedule)))
+        for call_date, strike in calls:
+            if call_date < val_date and \
+                    call_schedule_exercise_type != 'American':
+                continue
+            call_time = max((call_date - val_date).days / 365., 0)
+            step = int(np.argmin(np.abs(coupon_times - call_time))) + 1
+            if call_schedule_exercise_type == 'American':
+                strikes[step:] = strike
             else:
-                delta_t = delta_t_1plus
-            ho__lee__tree[jj, ii] = max(0, ho__lee__tree[
-                jj, ii - 1] + mu * delta_t + vol * pow(delta_t, 0.5))
-        ho__lee__tree[ii, ii] = max(0, ho__lee__tree[
-            ii - 1, ii - 1] + mu * delta_t - vol * pow(delta_t, 0.5))
-    bond__price__tree = np.zeros(shape=(num_steps + 1, num_steps + 1))
-    bond__price__tree[:, -1] = face + coupon_amount
-
-    ###############################################################################
-    # Incorporating Call Schedule
-    call_schedule_2 = {}
-    for ii in range(0, len(call_schedule) - 1 + 1):
-        call_schedule_2[
-            int(round((call_schedule[ii, 0] - val_date).days / 365 * 2))] = \
-        call_schedule[ii, 1]
-    call_schedule_times = set()
-    for key in call_schedule_2:
-        call_schedule_times.add(key)
-
-    if call_schedule_exercise_type == 'Bermudan':
-        # Creating Strike Tree (BERMUDAN)
-        strike__tree = np.zeros(shape=(num_steps + 1, num_steps + 1))
-        strike__tree[:] = 1e500
-        for ii in range(1, len(bond__price__tree) + 1):
-            if ii in call_schedule_times:
-                strike__tree[:, ii] = call_schedule_2[ii]
-
-    if call_schedule_exercise_type == 'American':
-        # Creating Strike Tree (AMERICAN)
-        strike__tree = np.zeros(shape=(num_steps + 1, num_steps + 1))
-        strike__tree[:] = 1e500
-        for ii in range(1, len(bond__price__tree) + 1):
-            if ii in call_schedule_times:
-                strike__tree[:, ii:] = call_schedule_2[ii]
-    ###############################################################################
-
-    row_count_2 = num_steps + 1
-    for ii in range(num_steps - 1, -1, -1):  # cycle through columns
-        row_count_2 = row_count_2 - 1
-        for jj in range(0, row_count_2):  # cycle through rows
-            if (ii == 0) & (jj == 0):
-                delta_t = delta_t_1
-                coupon_amount = 0  # no coupon payment at time 0
+                strikes[step] = strike
+
+        # The final payment is not callable
+        strikes[num_steps] = np.inf
+
+    return {'num_steps': num_steps,
+            'first_period': coupon_times[0] if num_steps > 0 else 0.,
+            'coupon_amount': coupon_amount,
+            'final_payment': face + coupon_amount,
+            'strikes': strikes}
+
+
+def short_rate_lattice(initial_short_rate, mu, vol, dt, num_steps,
+                       model='ho_lee', mean_reversion=DEFAULT_MEAN_REVERSION):
+    '''
+    short_rate_lattice(initial_short_rate, mu, vol, dt, num_steps,
+                       model='ho_lee', mean_reversion=DEFAULT_MEAN_REVERSION)
+
+    Functionality
+    =============
+    Recombining lattice of the short rate, floored at zero, with the rate of
+    every step and node built in one array operation. The Ho-Lee lattice is
+    binomial and the rate of node j (j down moves) at step i is
+    r0 + i mu dt + (i - 2j) vol sqrt(dt). The Hull-White lattice is the
+    trinomial tree of Hull and White, where the short rate reverts to
+    r0 + mu / a at speed a. The rate of node j (from -jmax to jmax, see
+    hull_white_branching) at step i is the mean of the short rate at i dt
+    plus j dx, with dx = sqrt(3 V) and V the variance of the short rate over
+    a step. The rates, drifts and volatilities can be arrays (e.g. one per
+    valuation state), giving one lattice per element
+
+    Parameters
+    ==========
+    initial_short_rate : double or numpy array
+        the short rate at the valuation date
+    mu : double or numpy array
+        the drift of the short rate per year
+    vol : double or numpy array
+        the volatility of the short rate per year
+    dt : double
+        the length of a step in years
+    num_steps : int
+        the number of steps of the lattice
+    model : str
+        the short rate model (one of SHORT_RATE_MODELS)
+    mean_reversion : double
+        the mean reversion speed of the Hull-White model
+
+    Returns
+    =======
+    rates : numpy array
+        the short rate of each step and node (..., Step, Node), zero for the
+        nodes that cannot be reached at a step
+    '''
+    if model not in SHORT_RATE_MODELS:
+        raise ValueError('Short rate model must be one of ' +
+                         str(SHORT_RATE_MODELS) + ' (given ' + str(model) +
+                         ')')
+    r0, mu, vol = np.broadcast_arrays(
+        *[np.asarray(x, float) for x in [initial_short_rate, mu, vol]])
+    r0 = r0[..., np.newaxis, np.newaxis]
+    mu = mu[..., np.newaxis, np.newaxis]
+    vol = vol[..., np.newaxis, np.newaxis]
+
+    step = np.arange(num_steps)[:, np.newaxis]
+    t = step * dt
+
+    if model == 'ho_lee':
+        node = np.arange(num_steps)[np.newaxis, :]
+        rates = r0 + mu * t + (step - 2 * node) * vol * np.sqrt(dt)
+        return np.where(node <= step, np.maximum(rates, 0), 0.)
+
+    a = mean_reversion
+    j = hull_white_branching(dt, num_steps, a)[0][np.newaxis, :]
+    if a > 0:
+        mean = r0 + mu * (1 - np.exp(-a * t)) / a
+        step_var = vol ** 2 * (1 - np.exp(-2 * a * dt)) / (2 * a)
+    else:
+        mean = r0 + mu * t
+        step_var = vol ** 2 * dt
+    rates = mean + j * np.sqrt(3 * step_var)
+    return np.where(np.abs(j) <= step, np.maximum(rates, 0), 0.)
+
+
+def hull_white_branching(dt, num_steps, mean_reversion=DEFAULT_MEAN_REVERSION):
+    '''
+    hull_white_branching(dt, num_steps, mean_reversion=DEFAULT_MEAN_REVERSION)
+
+    Functionality
+    =============
+    Branching of the Hull-White trinomial tree. The deviation x of the short
+    rate from its mean moves from node j (x = j dx) to the nodes k + 1, k and
+    k - 1 with E[x'] = (1 + M) j dx, M = exp(-a dt) - 1, and variance dx^2 / 3.
+    The branching is centred on k = j except at the edge nodes
+    |j| = jmax = ceil(0.184 / (a dt)), which branch back towards the mean,
+    so that the probabilities stay positive. With e = j M + j - k they are
+    1/6 + (e^2 + e) / 2, 2/3 - e^2 and 1/6 + (e^2 - e) / 2. The branching
+    only depends on a and dt, so it is shared by the lattices of every
+    state
+
+    Parameters
+    ==========
+    dt : double
+        the length of a step in years
+    num_steps : int
+        the number of steps of the lattice
+    mean_reversion : double
+        the mean reversion speed a (no edge nodes when zero)
+
+    Returns
+    =======
+    nodes : numpy array
+        the node numbers j of the lattice (from -min(jmax, num_steps))
+    children : numpy array
+        the indices in nodes of the up, middle and down branches of each
+        node (Branch, Node)
+    probabilities : numpy array
+        the probabilities of the branches of each node (Branch, Node)
+    '''
+    a = mean_reversion
+    M = np.expm1(-a * dt)
+    num_nodes = num_steps
+    if a > 0:
+        jmax = int(np.ceil(0.184 / (a * dt)))
+        num_nodes = min(jmax, num_steps)
+    else:
+        jmax = num_steps + 1
+
+    nodes = np.arange(-num_nodes, num_nodes + 1)
+    centres = nodes.copy()
+    centres[nodes == jmax] -= 1
+    centres[nodes == -jmax] += 1
+
+    e = nodes * M + nodes - centres
+    probabilities = np.array([1. / 6 + (e ** 2 + e) / 2, 2. / 3 - e ** 2,
+                              1. / 6 + (e ** 2 - e) / 2])
+    # The nodes that are never reached before the last step can branch
+    # off the lattice, so their branches are clipped
+    children = np.clip(np.array([centres + 1, centres, centres - 1]) +
+                       num_nodes, 0, 2 * num_nodes)
+
+    return nodes, children, probabilities
+
+
+def callable_bond_lattice_values(rates, dt, schedules, model='ho_lee',
+                                 mean_reversion=DEFAULT_MEAN_REVERSION):
+    '''
+    callable_bond_lattice_values(rates, dt, schedules, model='ho_lee',
+                                 mean_reversion=DEFAULT_MEAN_REVERSION)
+
+    Functionality
+    =============
+    Backward induction of a set of callable bonds on the same short rate
+    lattices (e.g. the lattice of every valuation state of a currency). The
+    bonds and lattices are inducted together as arrays, so there is one
+    array operation per step however many bonds and states there are. Each
+    bond enters the induction at its own maturity step
+
+    Parameters
+    ==========
+    rates : numpy array
+        the short rate lattices (..., Step, Node) from short_rate_lattice
+        with at least as many steps as the longest bond
+    dt : double
+        the length of a step in years
+    schedules : list of dict
+        the schedules of the bonds from callable_bond_schedule
+    model : str
+        the short rate model the lattices were built with
+    mean_reversion : double
+        the mean reversion speed of the Hull-White model
+
+    Returns
+    =======
+    values : numpy array
+        the value of each bond (last axis) on each lattice
+    '''
+    rates = np.asarray(rates, float)
+    batch_shape = rates.shape[:-2]
+    num_steps = np.array([x['num_steps'] for x in schedules], int)
+    max_steps = max(num_steps) if len(schedules) > 0 else 0
+
+    first_period = np.array([x['first_period'] for x in schedules], float)
+    coupon = np.array([x['coupon_amount'] for x in schedules], float)
+    final = np.array([x['final_payment'] for x in schedules], float)
+    strikes = np.full((len(schedules), max_steps + 1), np.inf)
+    for kk, schedule in enumerate(schedules):
+        strikes[kk, :num_steps[kk] + 1] = schedule['strikes']
+
+    if model == 'hull_white':
+        nodes, children, probabilities = hull_white_branching(
+            dt, rates.shape[-2], mean_reversion)
+        step_discount = (1 + rates) ** -dt
+
+        # Every node of the lattice is inducted at each step (the nodes that
+        # cannot be reached do not affect the others)
+        values = np.zeros(batch_shape + (len(schedules), len(nodes)))
+        for ii in range(max_steps - 1, -1, -1):
+            values[..., num_steps == ii + 1, :] = \
+                final[num_steps == ii + 1, np.newaxis]
+
+            if ii > 0:
+                discount = step_discount[..., np.newaxis, ii, :]
             else:
-                delta_t = delta_t_1plus
-            bond__price__tree[jj, ii] = min(coupon_amount + ((0.5 *
-                                                              bond__price__tree[
-                                                                  jj, ii + 1] + 0.5 *
-                                                              bond__price__tree[
-                                                                  jj + 1, ii + 1]) / (
-                                                                 pow((1 +
-                                                                      ho__lee__tree[
-                                                                          jj, ii]),
-                                                                     delta_t))),
-                                            strike__tree[
-                                                jj, ii])  # reflects coupon payment at each node in adddition to discounted bond value at subsequent nodes   # (each node wit prob=0.5)  # this value is compared against  # set-up assumes call will be activated just prior to coupon payment
-    bond__price = bond__price__tree[0, 0]
-
-    return bond__price
+                discount = (1 + rates[..., np.newaxis, 0, :]) ** \
+                    -first_period[:, np.newaxis]
+            expected = np.sum(probabilities * values[..., children], axis=-2)
+            payment = coupon[:, np.newaxis] if ii > 0 else 0.
+            values = np.minimum(payment + expected * discount,
+                                strikes[:, ii, np.newaxis])
+
+        return np.where(num_steps > 0, values[..., np.argmax(nodes == 0)],
+                        0.)
+
+    # The discount factors of a full step (with the probability 0.5 of each
+    # branch) are shared by all the bonds
+    step_discount = 0.5 * (1 + rates) ** -dt
+
+    # Each step replaces the values of the nodes of the next step
+    values = np.zeros(batch_shape + (len(schedules), max_steps + 1))
+    for ii in range(max_steps - 1, -1, -1):
+        starting = num_steps == ii + 1
+        values[..., starting, :ii + 2] = final[starting, np.newaxis]
+
+        if ii > 0:
+            discount = step_discount[..., np.newaxis, ii, :ii + 1]
+        else:
+            discount = 0.5 * (1 + rates[..., np.newaxis, 0, :1]) ** \
+                -first_period[:, np.newaxis]
+        total = values[..., :ii + 1] + values[..., 1:ii + 2]
+        payment = coupon[:, np.newaxis] if ii > 0 else 0.
+        values[..., :ii + 1] = np.minimum(payment + total * discount,
+                                          strikes[:, ii, np.newaxis])
+
+    # Bonds without a payment left are worth nothing
+    return np.where(num_steps > 0, values[..., 0], 0.)
+
+# -----------------------------------------------------------------------------
+# Testing
+# -----------------------------------------------------------------------------
+if __name__ == '__main__':
+    import datetime as dt
+
+    print('\nTesting CallableBondPricing.py...')
+    first_coupon_date = dt.datetime(2015, 6, 1)
+    maturity_date = dt.datetime(2025, 6, 1)
+    call_schedule = np.array([[dt.datetime(2018, 6, 1), 102.],
+                              [dt.datetime(2020, 6, 1), 100.]], dtype=object)
+    no_calls = np.empty((0, 2), dtype=object)
+
+    # Valuing on a coupon date and the day after only drops a day of accrual
+    # and the callable bond is never worth more than the straight bond
+    prices = {}
+    for val_date in [dt.datetime(2017, 6, 1), dt.datetime(2017, 6, 2)]:
+        for model in SHORT_RATE_MODELS:
+            callable_price = callable_bond_pricing_function(
+                0.02, 0.001, 0.01, first_coupon_date, 2, 5., 100.,
+                call_schedule, 'Bermudan', val_date, maturity_date, model)
+            straight_price = callable_bond_pricing_function(
+                0.02, 0.001, 0.01, first_coupon_date, 2, 5., 100., no_calls,
+                'Bermudan', val_date, maturity_date, model)
+            print(str(val_date.date()) + ' ' + model + ':\tcallable ' +
+                  str(callable_price) + '\tstraight ' + str(straight_price))
+            assert callable_price <= straight_price
+            prices.setdefault(model, []).append(callable_price)
+    for model in SHORT_RATE_MODELS:
+        assert abs(prices[model][1] - prices[model][0]) < 0.05
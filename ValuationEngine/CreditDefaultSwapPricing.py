@@ -1,11 +1,17 @@
 import math
+import numpy as np
 import FinancialModels as finModels
-from dateutil.relativedelta import relativedelta
 
 
 def CDS_pricing_function(payment_frequency, contract_spread, notional, val_date,
                          maturity_date, buy_or_sell_protection, recovery_rate,
-                         yield_curve, hazard_rate):
+                         yield_curve, hazard_rate, return_gradient=False,
+                         cashflow_table=None):
+    # If return_gradient is True a dictionary is returned with the 'value'
+    # and the derivative of the value with respect to each key rate of the
+    # 'yield_curve', the 'hazard_rate' and the 'recovery_rate'. The payments
+    # left at the valuation date can be given as a cashflow_table (see
+    # finModels.CDS_cashflow_table), e.g. the table cached by the CDS
     # contractSpread=100 #in basis points
     # Notional=10000000
     # MaturityDate=datetime.datetime(2018,12,01,01,0,0)
@@ -16,24 +22,11 @@ def CDS_pricing_function(payment_frequency, contract_spread, notional, val_date,
     # HazardRate=0.011
 
     # TimeToMaturity=round((MaturityDate-ValDate).days/365.*4)/4 #round to nearest 0.25
-    num_months = 12. / payment_frequency
-    num_months = int(num_months)
-
-    payment_schedule = [maturity_date]
-    # factor_1=0
-    # for ii in range(0,int(TimeToMaturity*4)):
-    #    factor_1=factor_1+0.25
-    #    payment_schedule.append(factor_1)
-    while payment_schedule[-1] > val_date:
-        payment_schedule.append(
-            payment_schedule[-1] + relativedelta(months=-num_months))
-    payment_schedule = payment_schedule[::-1]  # reverse list
-
-    payment_schedule_value = []
-    for ii in range(0, len(payment_schedule)):
-        if (payment_schedule[ii] - val_date).days > 0:
-            payment_schedule_value.append(
-                ((payment_schedule[ii] - val_date).days) / 365.)
+    if cashflow_table is None:
+        cashflow_table = finModels.CDS_cashflow_table(
+            maturity_date, payment_frequency, val_date, contract_spread,
+            notional)
+    payment_schedule_value = cashflow_table['times']
 
     valuation_curve = finModels.interpolated_yield_curve(yield_curve,
                                                          payment_schedule_value)
@@ -72,4 +65,45 @@ def CDS_pricing_function(payment_frequency, contract_spread, notional, val_date,
     elif buy_or_sell_protection == 'Sell':
         CDS_price = payment_leg - default_leg
 
-    return CDS_price
+    if not return_gradient:
+        return CDS_price
+
+    # Survival and default probabilities of each period and their
+    # derivatives with respect to the hazard rate
+    times = payment_schedule_value
+    rates = np.array(valuation_curve, float)
+    period = 1. / payment_frequency
+    discount = np.power(1 + rates, -times)
+    survival = np.exp(-hazard_rate * times)
+    default = np.where(times < period, 1 - survival,
+                       np.exp(-hazard_rate * (times - period)) *
+                       (1 - math.exp(-hazard_rate * period)))
+    ddefault = np.where(times < period, times * survival,
+                        np.exp(-hazard_rate * (times - period)) *
+                        (period * math.exp(-hazard_rate * period) -
+                         (times - period) *
+                         (1 - math.exp(-hazard_rate * period))))
+
+    payment_cashflows = notional * period * (
+            (contract_spread / 100.) / 100.) * survival
+    default_cashflows = notional * (1 - recovery_rate) * default
+
+    # Derivatives of the protection buyer's value (zero for the discount
+    # rates that were floored)
+    rate_gradient = -times * (default_cashflows - payment_cashflows) * (
+        np.power(1 + rates, -times - 1))
+    rate_gradient[rates <= 0] = 0
+    hazard_gradient = np.sum((notional * (1 - recovery_rate) * ddefault +
+                              times * payment_cashflows) * discount)
+    recovery_gradient = -np.sum(notional * default * discount)
+    weights = finModels.interpolated_yield_curve_weights(yield_curve, times)
+
+    sign = 1.0
+    if buy_or_sell_protection == 'Sell':
+        sign = -1.0
+    price_info = {'value': CDS_price,
+                  'yield_curve': sign * np.dot(rate_gradient, weights),
+                  'hazard_rate': sign * hazard_gradient,
+                  'recovery_rate': sign * recovery_gradient}
+
+    return price_info
@@ -1,10 +1,16 @@
+import numpy as np
 import FinancialModels as finModels
-from dateutil.relativedelta import relativedelta
 
 
 def FRN_pricing_function(first_coupon_date, coupon_frequency, maturity_date,
                          val_date, coupon_rate, face, yield_curve,
-                         reference_curve):
+                         reference_curve, return_gradient=False,
+                         cashflow_table=None):
+    # If return_gradient is True a dictionary is returned with the 'value'
+    # and the derivative of the value with respect to each key rate of the
+    # 'yield_curve' and the 'reference_curve'. Only the payment times of the
+    # cashflow_table (see finModels.coupon_cashflow_table) are used, since
+    # the coupons are set by the reference curve
     # BondPricingFunction(FirstCouponDate,CouponFrequency,MaturityDate,ValDate,CouponRate,Face,yieldCurveInput):
 
     # yieldCurveInput=[] # 3m,6m,1y,2yr,3yr,4yr,5yr,7yr,10yr,15yr,20yr,25yr,30yr
@@ -13,33 +19,17 @@ def FRN_pricing_function(first_coupon_date, coupon_frequency, maturity_date,
     # MaturityDate=datetime.datetime(2017,12,1,0,0)
     # ValDate=datetime.datetime(2016,12,1,0,0)
 
+    if cashflow_table is None:
+        cashflow_table = finModels.coupon_cashflow_table(
+            first_coupon_date, coupon_frequency, maturity_date, val_date,
+            coupon_rate, face)
+
     coupon_rate = 1.0 * coupon_rate / coupon_frequency
     InitialCoupon = coupon_rate / 100. * face
 
     #######################################################################
-    num_months = 12. / coupon_frequency
-
-    coupon_schedule = [first_coupon_date]
-
-    j = 1
-    while coupon_schedule[-1] < maturity_date:
-        coupon_schedule.append(
-            coupon_schedule[-1] + relativedelta(months=int(num_months)))
-        j = j + 1
-
-    if coupon_schedule[-1] > maturity_date:
-        coupon_schedule[-1] = maturity_date
-
-    coupon_schedule_temp = []
-    for ii in range(len(coupon_schedule)):
-        if coupon_schedule[ii] > val_date:
-            coupon_schedule_temp.append(coupon_schedule[ii])
-    coupon_schedule = coupon_schedule_temp
-
-    coupon_schedule_value = []
-    for ii in range(len(coupon_schedule)):
-        coupon_schedule_value.append(
-            float((coupon_schedule[ii] - val_date).days) / 365)
+    # Only the coupons after the valuation date are left to be paid
+    coupon_schedule_value = cashflow_table['times']
 
     valuation_curve = finModels.interpolated_yield_curve(yield_curve,
                                                          coupon_schedule_value)
@@ -82,4 +72,40 @@ def FRN_pricing_function(first_coupon_date, coupon_frequency, maturity_date,
     FRN_price = FRN_price + (
             face / pow(1 + valuation_curve[-1], timeto_maturity))
 
-    return FRN_price
+    if not return_gradient:
+        return FRN_price
+
+    times = coupon_schedule_value
+    rates = np.array(valuation_curve, float)
+    ref_rates = np.array(interp_ref_curve, float)
+    forwards = np.array(forward_curve, float)
+
+    # Derivative with respect to each discount rate
+    rate_gradient = -times * np.array(coupon_pmts) * np.power(1 + rates,
+                                                              -times - 1)
+    rate_gradient[-1] = rate_gradient[-1] - timeto_maturity * face * pow(
+        1 + rates[-1], -timeto_maturity - 1)
+
+    # Derivative with respect to each forward rate (zero where the forward
+    # rate was floored) and then each reference rate, using
+    # log(1 + f[i+1]) = (t[i+1] log(1 + R[i+1]) - t[i] log(1 + R[i])) / dt
+    forward_gradient = face / float(coupon_frequency) * np.power(1 + rates,
+                                                                 -times)
+    forward_gradient[forwards <= 0] = 0
+    ref_gradient = np.zeros(len(times))
+    ref_gradient[0] = forward_gradient[0]
+    for ii in range(len(times) - 1):
+        dt = times[ii + 1] - times[ii]
+        dforward = forward_gradient[ii + 1] * (1 + forwards[ii + 1]) / dt
+        ref_gradient[ii + 1] += dforward * times[ii + 1] / (
+                1 + ref_rates[ii + 1])
+        ref_gradient[ii] -= dforward * times[ii] / (1 + ref_rates[ii])
+
+    weights = finModels.interpolated_yield_curve_weights(yield_curve, times)
+    ref_weights = finModels.interpolated_yield_curve_weights(reference_curve,
+                                                             times)
+    price_info = {'value': FRN_price,
+                  'yield_curve': np.dot(rate_gradient, weights),
+                  'reference_curve': np.dot(ref_gradient, ref_weights)}
+
+    return price_info
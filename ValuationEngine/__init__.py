@@ -1,3 +1,4 @@
+from AmericanOptionPricing import *
 from BinomialTree import *
 from BlackScholes import *
 from BondPricing import *